@@ -0,0 +1,125 @@
+"""
+Training the sentiment model in a background thread.
+
+The interactive menu starts a BackgroundTrainer and shows up immediately. Loading the lexicon
+snapshot or training on the review corpus happens in a daemon thread; only the actions that
+analyse a review wait for the model, showing the training progress while they do.
+Parallel training starts its worker processes with the "spawn" method, since forking a process
+that runs several threads is unsafe.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from lexicon_snapshot import load_or_train_word_counter
+from sentiment_analysis import WordCounter
+
+PROGRESS_INTERVAL: float = 0.5
+
+
+class TrainingProgress:
+    """
+    Files counted so far out of the training corpus, updated by the training thread.
+    """
+
+    def __init__(self):
+        self.counted = 0
+        self.total = 0
+        self.started = time.perf_counter()
+
+    def update(self, counted: int, total: int) -> None:
+        self.counted = counted
+        self.total = total
+
+    @property
+    def docs_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.counted / elapsed if elapsed > 0 else 0.0
+
+    def describe(self) -> str:
+        if not self.total:
+            return "Loading the sentiment model..."
+        return (
+            f"Training the sentiment model: {self.counted}/{self.total} files "
+            f"({100 * self.counted // self.total}%), {self.docs_per_second:.0f} docs/s"
+        )
+
+
+class BackgroundTrainer:
+    """
+    Loads or trains a WordCounter with load_or_train_word_counter in a daemon thread.
+    """
+
+    def __init__(
+        self,
+        pos_path_pattern: str,
+        neg_path_pattern: str,
+        snapshot_path: str,
+        workers: int = 1,
+    ):
+        self.pos_path_pattern = pos_path_pattern
+        self.neg_path_pattern = neg_path_pattern
+        self.snapshot_path = snapshot_path
+        self.workers = workers
+        self.progress = TrainingProgress()
+        self.word_counter = None
+        self.error: Optional[BaseException] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._train, name="training", daemon=True)
+        self._thread.start()
+
+    def _train(self) -> None:
+        try:
+            word_counter = WordCounter()
+            load_or_train_word_counter(
+                word_counter,
+                self.pos_path_pattern,
+                self.neg_path_pattern,
+                self.snapshot_path,
+                workers=self.workers,
+                progress=self.progress.update,
+            )
+            self.word_counter = word_counter
+        except BaseException as error:
+            self.error = error
+        finally:
+            self._ready.set()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def status(self) -> str:
+        if not self.is_ready:
+            return self.progress.describe()
+        if self.error is not None:
+            return f"The sentiment model could not be loaded: {self.error}"
+        return "The sentiment model is ready."
+
+    def wait(self, report: Callable[[str], None] = None):
+        """
+        Blocks until the model is ready and returns the trained WordCounter, or None if training failed.
+        While waiting, the progress is passed to report every PROGRESS_INTERVAL seconds
+        (by default it is rewritten in place on the terminal).
+        """
+        in_place = report is None
+        if in_place:
+            report = _print_in_place
+        reported = False
+        while not self._ready.wait(PROGRESS_INTERVAL if reported else 0):
+            report(self.progress.describe())
+            reported = True
+        if reported and in_place:
+            print()
+        if self.error is not None:
+            print(f"\n{self.status()}")
+            return None
+        return self.word_counter
+
+
+def _print_in_place(message: str) -> None:
+    print(f"\r{message:<79}", end="", flush=True)
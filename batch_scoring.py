@@ -0,0 +1,364 @@
+"""
+Non-interactive scoring of many reviews at once.
+
+Reviews are read from a directory of .txt files, a glob pattern, a JSONL file or a CSV file,
+scored in basic and/or advanced mode and written incrementally to a JSONL or CSV file
+(standard output by default). With --cache-size or --cache-path, duplicate reviews are scored
+once through a ScoringCache.
+Input is processed as a stream in fixed-size batches, so memory
+use does not depend on the number of reviews, and review files larger than CHUNK_SIZE are
+scored chunk by chunk.
+
+Example:
+    python batch_scoring.py reviews --mode both --output results.csv
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from config import (
+    LEXICON_SNAPSHOT_PATH,
+    NEG_FILES_FEED,
+    POS_FILES_FEED,
+    SENTIMENT_SCORER,
+    TRAINING_WORKERS,
+)
+import instrumentation
+from lexicon_snapshot import load_or_train_word_counter
+from preprocessing import CHUNK_SIZE, preprocess_review, preprocess_review_both
+from scoring_cache import MAX_ENTRIES, ScoringCache
+from sentiment_analysis import (
+    SCORERS,
+    WordCounter,
+    compute_file_sentiment,
+    compute_file_sentiment_both,
+    compute_sentiment_batch,
+    sentiment_verdict,
+)
+
+BATCH_SIZE: int = 256
+TEXT_FIELDS: List[str] = ["review", "text"]
+ID_FIELDS: List[str] = ["id", "review_id"]
+MODES: Dict[str, List[str]] = {
+    "basic": ["basic"],
+    "advanced": ["advanced"],
+    "both": ["basic", "advanced"],
+}
+
+
+def iter_reviews(source: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (review id, review text) pairs from a directory, glob pattern, .jsonl or .csv file.
+    Files are read one at a time; the id is the file name or the record's id field (or line number).
+    """
+    files = text_files(source)
+    if files is not None:
+        yield from _iter_text_files(files)
+    elif source.endswith(".jsonl"):
+        yield from _iter_jsonl(source)
+    else:
+        yield from _iter_csv(source)
+
+
+def text_files(source: str) -> Optional[List[str]]:
+    """
+    Returns the sorted review files of a directory or glob pattern, None for a .jsonl or .csv file.
+    """
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.txt")))
+    if source.endswith(".jsonl") or source.endswith(".csv"):
+        return None
+    return sorted(glob.glob(source))
+
+
+def _iter_text_files(files: List[str]) -> Iterator[Tuple[str, str]]:
+    for file in files:
+        with open(file, encoding="utf-8") as stream:
+            yield os.path.basename(file), stream.read()
+
+
+def _iter_jsonl(source: str) -> Iterator[Tuple[str, str]]:
+    with open(source, encoding="utf-8") as stream:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"{source}:{line_number} is not a JSON object")
+            yield _record_id(record, line_number), _record_text(record, source, line_number)
+
+
+def _iter_csv(source: str) -> Iterator[Tuple[str, str]]:
+    with open(source, encoding="utf-8", newline="") as stream:
+        for row_number, record in enumerate(csv.DictReader(stream), 1):
+            yield _record_id(record, row_number), _record_text(record, source, row_number)
+
+
+def _record_id(record: Dict[str, str], number: int) -> str:
+    for field in ID_FIELDS:
+        if record.get(field) not in (None, ""):
+            return str(record[field])
+    return str(number)
+
+
+def _record_text(record: Dict[str, str], source: str, number: int) -> str:
+    for field in TEXT_FIELDS:
+        if field in record:
+            return record[field] or ""
+    raise ValueError(f"{source}:{number} has none of the fields {', '.join(TEXT_FIELDS)}")
+
+
+class ResultWriter:
+    """
+    Writes one scored review per JSONL line or CSV row and flushes after every batch,
+    so results are visible while the job is still running.
+    """
+
+    def __init__(self, stream: TextIO, output_format: str, modes: List[str]):
+        self.stream = stream
+        self.output_format = output_format
+        self.fields = ["id"]
+        for mode in modes:
+            self.fields += [f"{mode}_sentiment", f"{mode}_verdict"]
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.DictWriter(stream, fieldnames=self.fields)
+            self.csv_writer.writeheader()
+
+    def write(self, result: Dict[str, object]) -> None:
+        if self.csv_writer is not None:
+            self.csv_writer.writerow(result)
+        else:
+            self.stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+def score_reviews(
+    reviews: Iterator[Tuple[str, str]],
+    word_counter: WordCounter,
+    modes: List[str],
+    writer: ResultWriter,
+    batch_size: int = BATCH_SIZE,
+    cache: Optional[ScoringCache] = None,
+    scorer: str = SENTIMENT_SCORER,
+) -> int:
+    """
+    Scores the reviews batch by batch, writing every result as soon as its batch is done.
+    With a cache, reviews scored before are not scored again; the cache must use the same scorer.
+    Returns the number of scored reviews.
+    """
+    scored = 0
+    while True:
+        batch = list(islice(reviews, batch_size))
+        if not batch:
+            return scored
+
+        results = [{"id": review_id} for review_id, _ in batch]
+        texts = [review for _, review in batch]
+        if cache is not None:
+            # Both modes of a review are cached in one entry, scored from one tokenization.
+            both_sentiments = cache.sentiments_many(texts)
+            mode_sentiments = {
+                mode: [sentiments[mode == "advanced"] for sentiments in both_sentiments]
+                for mode in modes
+            }
+        else:
+            mode_sentiments = _score_batch(texts, word_counter, modes, scorer)
+        for mode in modes:
+            for result, sentiment in zip(results, mode_sentiments[mode]):
+                result[f"{mode}_sentiment"] = round(sentiment, 6)
+                result[f"{mode}_verdict"] = sentiment_verdict(sentiment)
+
+        for result in results:
+            writer.write(result)
+        writer.flush()
+        scored += len(batch)
+
+
+def score_files(
+    files: List[str],
+    word_counter: WordCounter,
+    modes: List[str],
+    writer: ResultWriter,
+    batch_size: int = BATCH_SIZE,
+    scorer: str = SENTIMENT_SCORER,
+) -> int:
+    """
+    Scores review files like score_reviews. Files larger than CHUNK_SIZE bytes are streamed through
+    compute_file_sentiment, so a large file is never held in memory whole; the usual small files
+    are read and scored together, which is faster. Returns the number of scored files.
+    """
+    for start in range(0, len(files), batch_size):
+        batch = files[start : start + batch_size]
+        small_files = [file for file in batch if os.path.getsize(file) <= CHUNK_SIZE]
+        texts = []
+        for file in small_files:
+            with open(file, encoding="utf-8") as stream:
+                texts.append(stream.read())
+        small_sentiments = _score_batch(texts, word_counter, modes, scorer)
+        sentiments: Dict[str, Dict[str, float]] = {
+            file: {mode: small_sentiments[mode][i] for mode in modes}
+            for i, file in enumerate(small_files)
+        }
+        for file in batch:
+            if file not in sentiments:
+                sentiments[file] = _score_large_file(file, word_counter, modes, scorer)
+            result: Dict[str, object] = {"id": os.path.basename(file)}
+            for mode in modes:
+                sentiment = sentiments[file][mode]
+                result[f"{mode}_sentiment"] = round(sentiment, 6)
+                result[f"{mode}_verdict"] = sentiment_verdict(sentiment)
+            writer.write(result)
+        writer.flush()
+    return len(files)
+
+
+def _score_large_file(
+    file: str, word_counter: WordCounter, modes: List[str], scorer: str
+) -> Dict[str, float]:
+    if len(modes) > 1:
+        # Both modes are scored from one pass over the file.
+        basic, advanced = compute_file_sentiment_both(file, word_counter, scorer=scorer)
+        return {"basic": basic, "advanced": advanced}
+    return {
+        mode: compute_file_sentiment(file, word_counter, advanced=mode == "advanced", scorer=scorer)
+        for mode in modes
+    }
+
+
+def _score_batch(
+    reviews: List[str], word_counter: WordCounter, modes: List[str], scorer: str
+) -> Dict[str, List[float]]:
+    preprocessed_both = None
+    if len(modes) > 1:
+        # Both modes tokenize the review once and differ only in the marked negations.
+        preprocessed_both = [preprocess_review_both(review) for review in reviews]
+    mode_sentiments = {}
+    for mode in modes:
+        advanced = mode == "advanced"
+        if preprocessed_both is not None:
+            preprocessed_reviews = [words[advanced] for words in preprocessed_both]
+        else:
+            preprocessed_reviews = [preprocess_review(review, advanced=advanced) for review in reviews]
+        mode_sentiments[mode] = compute_sentiment_batch(
+            preprocessed_reviews, word_counter, advanced=advanced, scorer=scorer
+        )
+    return mode_sentiments
+
+
+def positive_int(value: str) -> int:
+    """
+    An argparse type for counts that must be at least 1.
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Score movie reviews from a directory, glob, JSONL or CSV file without the interactive menu."
+    )
+    parser.add_argument("source", help="directory of .txt reviews, glob pattern, .jsonl or .csv file")
+    parser.add_argument("--mode", choices=sorted(MODES), default="both", help="analysis mode (default: both)")
+    parser.add_argument("--output", help="output .jsonl or .csv file (default: JSONL on standard output)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="output format (default: from --output extension)")
+    parser.add_argument("--scorer", choices=SCORERS, default=SENTIMENT_SCORER, help=f"scoring model (default: {SENTIMENT_SCORER})")
+    parser.add_argument("--batch-size", type=positive_int, default=BATCH_SIZE, help="reviews scored per batch")
+    parser.add_argument("--cache-size", type=int, default=0, help=f"in-memory result cache entries, e.g. {MAX_ENTRIES} (default: 0, disabled)")
+    parser.add_argument("--cache-path", help="SQLite file of a persistent result cache")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="JSON_PATH",
+        help="time the pipeline stages and print a report when finished, optionally exported as JSON",
+    )
+    parser.add_argument("--pos", default=POS_FILES_FEED, help="positive training files pattern")
+    parser.add_argument("--neg", default=NEG_FILES_FEED, help="negative training files pattern")
+    parser.add_argument("--snapshot", default=LEXICON_SNAPSHOT_PATH, help="lexicon snapshot path")
+    parser.add_argument("--workers", type=int, default=TRAINING_WORKERS, help="training processes")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> None:
+    options = parse_arguments(arguments)
+    if options.profile is not None:
+        instrumentation.enable()
+    try:
+        _score_source(options)
+    finally:
+        if options.profile is not None:
+            instrumentation.write_report(options.profile)
+
+
+def _score_source(options: argparse.Namespace) -> None:
+    output_format = options.format or ("csv" if (options.output or "").endswith(".csv") else "jsonl")
+
+    word_counter = WordCounter()
+    load_or_train_word_counter(
+        word_counter, options.pos, options.neg, options.snapshot, workers=options.workers
+    )
+
+    cache = None
+    if options.cache_size > 0 or options.cache_path is not None:
+        cache = ScoringCache(
+            word_counter, options.cache_size, options.cache_path, scorer=options.scorer
+        )
+
+    start = time.perf_counter()
+    if options.output:
+        stream = open(options.output, "w", encoding="utf-8", newline="")
+    else:
+        stream = sys.stdout
+    try:
+        writer = ResultWriter(stream, output_format, MODES[options.mode])
+        files = text_files(options.source)
+        if files is not None and cache is None:
+            scored = score_files(
+                files,
+                word_counter,
+                MODES[options.mode],
+                writer,
+                batch_size=options.batch_size,
+                scorer=options.scorer,
+            )
+        else:
+            # The cache is keyed by the review text, so it needs the whole review.
+            scored = score_reviews(
+                iter_reviews(options.source),
+                word_counter,
+                MODES[options.mode],
+                writer,
+                batch_size=options.batch_size,
+                cache=cache,
+                scorer=options.scorer,
+            )
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        if cache is not None:
+            cache.close()
+    elapsed = time.perf_counter() - start
+
+    docs_per_second = scored / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Scored {scored} reviews in {elapsed:.2f} s ({docs_per_second:.1f} reviews/s)",
+        file=sys.stderr,
+    )
+    if cache is not None:
+        print(f"Result cache: {cache.stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""
+Performance benchmarks for the sentiment analysis pipeline.
+
+The suite generates a deterministic synthetic corpus, times the main pipeline stages on it
+and reports operations per second, documents per second and peak memory. Results can be
+written as JSON so that runs on different versions can be compared.
+
+Run `python benchmark.py` to print the results, `python benchmark.py --help` for the options.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from preprocessing import NegationCues, mark_negations
+
+NEGATION_SCALING_SIZES: List[int] = [1250, 2500, 5000, 10000]
+NGRAM_TABLE_SIZES: List[int] = [1 << 12, 1 << 16, 1 << 20]
+POSITIVE_WORDS: List[str] = ["great", "wonderful", "excellent", "moving", "brilliant", "fun"]
+NEGATIVE_WORDS: List[str] = ["terrible", "boring", "awful", "dull", "weak", "waste"]
+NEGATORS: List[str] = ["not", "never", "didn't", "wasn't", "no"]
+SENTENCE_ENDINGS: List[str] = [".", ".", ".", "!", "?"]
+
+
+class SyntheticCorpusConfig:
+    """
+    Parameters of a synthetic review corpus. Identical parameters always produce identical reviews.
+    - review_count: number of reviews, half of them positive
+    - mean_words, length_sigma: review lengths follow a log-normal distribution around mean_words
+    - vocabulary_size: number of distinct filler words, drawn with a Zipf-like frequency
+    - negation_density: probability that a sentence contains a negation
+    """
+
+    def __init__(
+        self,
+        review_count: int = 1000,
+        mean_words: int = 230,
+        length_sigma: float = 0.6,
+        vocabulary_size: int = 20000,
+        negation_density: float = 0.2,
+        seed: int = 0,
+    ):
+        self.review_count = review_count
+        self.mean_words = mean_words
+        self.length_sigma = length_sigma
+        self.vocabulary_size = vocabulary_size
+        self.negation_density = negation_density
+        self.seed = seed
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(vars(self))
+
+
+def generate_reviews(config: SyntheticCorpusConfig) -> Iterator[Tuple[bool, str]]:
+    """
+    Yields (is_positive, review text) pairs of a synthetic corpus with IMDB-like punctuation and markup.
+    """
+    rng = random.Random(config.seed)
+    vocabulary = [f"word{i}" for i in range(config.vocabulary_size)]
+    cumulative_weights = []
+    total = 0.0
+    for rank in range(1, config.vocabulary_size + 1):
+        total += 1.0 / rank
+        cumulative_weights.append(total)
+    mu = math.log(config.mean_words) - config.length_sigma ** 2 / 2
+
+    for number in range(config.review_count):
+        is_positive = number % 2 == 0
+        own_words, other_words = (
+            (POSITIVE_WORDS, NEGATIVE_WORDS) if is_positive else (NEGATIVE_WORDS, POSITIVE_WORDS)
+        )
+        length = max(1, int(rng.lognormvariate(mu, config.length_sigma)))
+        sentences = []
+        while length > 0:
+            sentence_length = min(length, rng.randint(4, 20))
+            length -= sentence_length
+            words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=sentence_length)
+            words[rng.randrange(sentence_length)] = rng.choice(
+                own_words if rng.random() < 0.8 else other_words
+            )
+            if rng.random() < config.negation_density:
+                words.insert(rng.randrange(len(words)), rng.choice(NEGATORS))
+            if rng.random() < 0.3:
+                words[-1] += ","
+            sentence = " ".join(words)
+            sentences.append(sentence[0].upper() + sentence[1:] + rng.choice(SENTENCE_ENDINGS))
+        yield is_positive, (" <br /><br />" if rng.random() < 0.2 else " ").join(sentences)
+
+
+def write_synthetic_corpus(config: SyntheticCorpusConfig, directory: str) -> Tuple[str, str]:
+    """
+    Writes the synthetic corpus as <directory>/pos/*.txt and <directory>/neg/*.txt, like the IMDB
+    training set, and returns the positive and negative glob patterns.
+    """
+    for label in ("pos", "neg"):
+        os.makedirs(os.path.join(directory, label), exist_ok=True)
+    for number, (is_positive, review) in enumerate(generate_reviews(config)):
+        label = "pos" if is_positive else "neg"
+        with open(os.path.join(directory, label, f"{number}_0.txt"), "w", encoding="utf-8") as stream:
+            stream.write(review)
+    return os.path.join(directory, "pos", "*.txt"), os.path.join(directory, "neg", "*.txt")
+
+
+def mark_negations_by_index(words: List[str]) -> List[str]:
+    """
+    The original advanced-mode negation pass, which looks words up with words.index().
+    Kept as the baseline for the negation scaling benchmark.
+    """
+    advanced_words = []
+    negate = False
+    for word in words:
+        if (word in ["not", "no", "never", "neither", "nor"] or "n't" in word) or (
+            "far" in word
+            and len(words) > words.index(word) + 1
+            and words[words.index(word) + 1] == "from"
+        ):
+            negate = True
+        elif word == "only" and words[words.index(word) - 1] == "not":
+            negate = False
+        elif negate and word not in ["but", "however", "nevertheless"]:
+            word = "not_" + word
+        else:
+            negate = False
+        advanced_words.append(word)
+    return advanced_words
+
+
+def pathological_sentence(word_count: int) -> List[str]:
+    """
+    Returns one long sentence, as found in scraped reviews without punctuation: a rambling first half
+    followed by cues that need a neighbouring word ("far from", "not only").
+    """
+    filler = ["the", "plot", "was", "long", "and", "the", "cast", "tried", "hard"]
+    cues = ["it", "was", "far", "from", "good", "and", "not", "only", "dull"]
+    half = word_count // 2
+    return [filler[i % len(filler)] for i in range(half)] + [
+        cues[i % len(cues)] for i in range(word_count - half)
+    ]
+
+
+def time_call(function: Callable[[], object], repeat: int = 3) -> float:
+    """
+    Returns the best wall clock time of several calls, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_negation_scaling(sizes: List[int] = NEGATION_SCALING_SIZES) -> List[Dict[str, float]]:
+    """
+    Times the negation pass on single-sentence reviews of growing length.
+    A linear implementation keeps the time per word constant as the sentence grows.
+    """
+    cues = NegationCues()
+    results = []
+    for size in sizes:
+        words = pathological_sentence(size)
+        by_index = time_call(lambda: mark_negations_by_index(words))
+        single_pass = time_call(lambda: mark_negations(words, cues))
+        results.append(
+            {
+                "words": size,
+                "by_index_seconds": by_index,
+                "single_pass_seconds": single_pass,
+                "single_pass_ns_per_word": single_pass / size * 1e9,
+            }
+        )
+    return results
+
+
+def measure(
+    name: str, function: Callable[[], object], operations: int, documents: int, repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Times a benchmark case and measures its peak traced memory in a separate run,
+    so that tracing does not distort the timings.
+    """
+    seconds = time_call(function, repeat)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "name": name,
+        "seconds": seconds,
+        "operations": operations,
+        "ops_per_second": operations / seconds if seconds > 0 else 0.0,
+        "docs_per_second": documents / seconds if seconds > 0 else 0.0,
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_suite(config: SyntheticCorpusConfig, review_files: int = 200, repeat: int = 3) -> Dict[str, object]:
+    """
+    Runs every pipeline benchmark on a synthetic corpus generated from config and returns
+    a JSON-serializable report.
+    """
+    from main import get_next_review_file, list_review_files
+    from preprocessing import preprocess_review, remove_punctuations
+    from sentiment_analysis import NAIVE_BAYES_SCORER, WordCounter, compute_sentiment
+
+    reviews = [review for _, review in generate_reviews(config)]
+    documents = len(reviews)
+    words = sum(len(review.split()) for review in reviews)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        pos_pattern, neg_pattern = write_synthetic_corpus(config, os.path.join(directory, "train"))
+
+        def train() -> WordCounter:
+            word_counter = WordCounter()
+            word_counter.count_words(pos_pattern, is_positive=True)
+            word_counter.count_words(neg_pattern, is_positive=False)
+            return word_counter
+
+        results.append(measure("count_words", train, documents, documents, repeat))
+        word_counter = train()
+
+        results.append(
+            measure(
+                "remove_punctuations",
+                lambda: [remove_punctuations(review) for review in reviews],
+                documents,
+                documents,
+                repeat,
+            )
+        )
+        for advanced in (False, True):
+            mode = "advanced" if advanced else "basic"
+            results.append(
+                measure(
+                    f"preprocess_review[{mode}]",
+                    lambda: [preprocess_review(review, advanced=advanced) for review in reviews],
+                    documents,
+                    documents,
+                    repeat,
+                )
+            )
+            preprocessed_reviews = [
+                preprocess_review(review, advanced=advanced) for review in reviews
+            ]
+            results.append(
+                measure(
+                    f"compute_sentiment[{mode}]",
+                    lambda: [
+                        compute_sentiment(review, word_counter, advanced=advanced)
+                        for review in preprocessed_reviews
+                        if review
+                    ],
+                    documents,
+                    documents,
+                    repeat,
+                )
+            )
+            results.append(
+                measure(
+                    f"{NAIVE_BAYES_SCORER}[{mode}]",
+                    lambda: [
+                        compute_sentiment(
+                            review, word_counter, advanced=advanced, scorer=NAIVE_BAYES_SCORER
+                        )
+                        for review in preprocessed_reviews
+                    ],
+                    documents,
+                    documents,
+                    repeat,
+                )
+            )
+
+        review_files_path = os.path.join(directory, "reviews")
+        os.makedirs(review_files_path)
+        for number, review in enumerate(reviews[:review_files], 1):
+            with open(os.path.join(review_files_path, f"Review{number}.txt"), "w", encoding="utf-8") as stream:
+                stream.write(review)
+
+        def list_quietly() -> None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                list_review_files(review_files_path, page_size=0)
+
+        saved = min(review_files, documents)
+        results.append(measure("list_review_files", list_quietly, 1, saved, repeat))
+        results.append(
+            measure(
+                "get_next_review_file",
+                lambda: get_next_review_file(review_files_path),
+                1,
+                saved,
+                repeat,
+            )
+        )
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": dict(config.as_dict(), words=words),
+        "results": results,
+    }
+
+
+def print_suite(report: Dict[str, object]) -> None:
+    print("\n------------------------------------------------------------------------------")
+    print(f"Synthetic corpus: {report['corpus']['review_count']} reviews, {report['corpus']['words']} words")
+    print("------------------------------------------------------------------------------")
+    print(f"{'benchmark':<28} {'seconds':>10} {'ops/s':>12} {'docs/s':>12} {'peak MiB':>10}")
+    for result in report["results"]:
+        print(
+            f"{result['name']:<28} {result['seconds']:>10.4f} {result['ops_per_second']:>12.1f}"
+            f" {result['docs_per_second']:>12.1f} {result['peak_memory_bytes'] / 2 ** 20:>10.2f}"
+        )
+    print("------------------------------------------------------------------------------")
+
+
+def benchmark_vocabulary_memory(config: SyntheticCorpusConfig) -> Dict[str, object]:
+    """
+    Compares the memory held by a trained WordCounter with dict counters and with a
+    CompactVocabulary, together with the time of looking up every word in both layouts.
+    """
+    import gc
+
+    from sentiment_analysis import WordCounter
+
+    reviews = list(generate_reviews(config))
+    layouts = {}
+    for layout in ("dict", "compact"):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            word_counter = WordCounter()
+            word_counter.count_documents(reviews)
+            if layout == "compact":
+                word_counter.compact()
+            gc.collect()
+            retained, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        pos_words_count = word_counter.pos_words_count
+        words = list(pos_words_count.keys() | word_counter.neg_words_count.keys())
+        lookup_seconds = time_call(lambda: [pos_words_count.get(word, 0) for word in words])
+        layouts[layout] = {
+            "retained_bytes": retained,
+            "bytes_per_word": retained / len(words) if words else 0.0,
+            "lookup_ns": lookup_seconds / len(words) * 1e9 if words else 0.0,
+        }
+        del word_counter, pos_words_count
+    return {"vocabulary_size": len(words), "layouts": layouts}
+
+
+def print_vocabulary_memory(result: Dict[str, object]) -> None:
+    print("\n--------------------------------------------------------------")
+    print(f"WordCounter memory, {result['vocabulary_size']} words:")
+    print("--------------------------------------------------------------")
+    print(f"{'layout':<10} {'retained MiB':>14} {'bytes/word':>12} {'lookup ns':>12}")
+    for layout, measurement in result["layouts"].items():
+        print(
+            f"{layout:<10} {measurement['retained_bytes'] / 2 ** 20:>14.2f}"
+            f" {measurement['bytes_per_word']:>12.1f} {measurement['lookup_ns']:>12.1f}"
+        )
+    print("--------------------------------------------------------------")
+
+
+def benchmark_ngram_tables(
+    config: SyntheticCorpusConfig, table_sizes: List[int] = NGRAM_TABLE_SIZES
+) -> List[Dict[str, float]]:
+    """
+    Trains on the synthetic corpus and measures the accuracy of every scorer on a held-out corpus
+    (the next seed), as evaluate.py does, with words only and with hashed bigrams and trigrams for every table size,
+    together with the memory of the n-gram table and the scoring time per review.
+    """
+    from preprocessing import preprocess_review
+    from sentiment_analysis import SCORERS, WordCounter, compute_sentiment, sentiment_verdict
+
+    train_reviews = list(generate_reviews(config))
+    test_config = SyntheticCorpusConfig(**dict(config.as_dict(), seed=config.seed + 1))
+    test_reviews = [
+        (is_positive, preprocess_review(review, advanced=True))
+        for is_positive, review in generate_reviews(test_config)
+    ]
+
+    results = []
+    for table_size in [0] + table_sizes:
+        word_counter = WordCounter()
+        if table_size:
+            word_counter.enable_ngrams(table_size=table_size)
+        word_counter.count_documents(train_reviews)
+        for scorer in SCORERS:
+            start = time.perf_counter()
+            # Like evaluate.py: a review without words scores 0.0, and a neutral verdict is an error.
+            correct = sum(
+                sentiment_verdict(
+                    compute_sentiment(words, word_counter, advanced=True, scorer=scorer)[0]
+                    if words
+                    else 0.0
+                )
+                == ("positive" if is_positive else "negative")
+                for is_positive, words in test_reviews
+            )
+            seconds = time.perf_counter() - start
+            results.append(
+                {
+                    "table_size": table_size,
+                    "scorer": scorer,
+                    "table_bytes": word_counter.ngrams.nbytes if table_size else 0,
+                    "accuracy": correct / len(test_reviews),
+                    "us_per_review": seconds / len(test_reviews) * 1e6,
+                }
+            )
+    return results
+
+
+def print_ngram_tables(results: List[Dict[str, float]]) -> None:
+    print("\n--------------------------------------------------------------")
+    print("Hashed bigrams and trigrams (table size 0: words only):")
+    print("--------------------------------------------------------------")
+    print(f"{'table size':>12} {'scorer':>12} {'table MiB':>11} {'accuracy':>10} {'us/review':>11}")
+    for result in results:
+        print(
+            f"{result['table_size']:>12} {result['scorer']:>12} {result['table_bytes'] / 2 ** 20:>11.2f}"
+            f" {result['accuracy']:>10.4f} {result['us_per_review']:>11.1f}"
+        )
+    print("--------------------------------------------------------------")
+
+
+def print_negation_scaling(results: List[Dict[str, float]]) -> None:
+    print("\n--------------------------------------------------------------")
+    print("Negation pass on single-sentence reviews:")
+    print("--------------------------------------------------------------")
+    print(f"{'words':>8} {'by index (s)':>14} {'single pass (s)':>16} {'ns/word':>10}")
+    for result in results:
+        print(
+            f"{result['words']:>8} {result['by_index_seconds']:>14.4f}"
+            f" {result['single_pass_seconds']:>16.4f} {result['single_pass_ns_per_word']:>10.1f}"
+        )
+    print("--------------------------------------------------------------")
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    defaults = SyntheticCorpusConfig()
+    parser = argparse.ArgumentParser(description="Benchmark the sentiment analysis pipeline.")
+    parser.add_argument("--reviews", type=int, default=defaults.review_count, help="synthetic review count")
+    parser.add_argument("--mean-words", type=int, default=defaults.mean_words, help="mean review length in words")
+    parser.add_argument("--length-sigma", type=float, default=defaults.length_sigma, help="log-normal length spread")
+    parser.add_argument("--vocabulary", type=int, default=defaults.vocabulary_size, help="filler vocabulary size")
+    parser.add_argument("--negation-density", type=float, default=defaults.negation_density, help="negated sentence ratio")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="corpus random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best is kept")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> None:
+    options = parse_arguments(arguments)
+    config = SyntheticCorpusConfig(
+        review_count=options.reviews,
+        mean_words=options.mean_words,
+        length_sigma=options.length_sigma,
+        vocabulary_size=options.vocabulary,
+        negation_density=options.negation_density,
+        seed=options.seed,
+    )
+    report = run_suite(config, repeat=options.repeat)
+    report["negation_scaling"] = benchmark_negation_scaling()
+    report["vocabulary_memory"] = benchmark_vocabulary_memory(config)
+    report["ngram_tables"] = benchmark_ngram_tables(config)
+    print_suite(report)
+    print_negation_scaling(report["negation_scaling"])
+    print_vocabulary_memory(report["vocabulary_memory"])
+    print_ngram_tables(report["ngram_tables"])
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as stream:
+            json.dump(report, stream, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Paths and defaults shared by the interactive menu (main.py) and the command-line tools,
+which import them from here rather than from the menu program.
+"""
+
+import os
+
+POS_FILES_FEED: str = r"train\pos\*.txt"
+NEG_FILES_FEED: str = r"train\neg\*.txt"
+LEXICON_SNAPSHOT_PATH: str = r"train\lexicon.snapshot"
+TRAINING_WORKERS: int = os.cpu_count() or 1
+# "polarity" or "naive_bayes", see sentiment_analysis.SCORERS.
+SENTIMENT_SCORER: str = "polarity"
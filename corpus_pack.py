@@ -0,0 +1,270 @@
+"""
+Packed labeled corpus: one contiguous data file plus an offsets/labels index.
+
+Reading train/pos/*.txt and train/neg/*.txt opens, reads and closes tens of thousands of tiny
+files on every training or evaluation run, which costs far more in syscalls than in bytes.
+pack_corpus concatenates the reviews once into a single data file; CorpusPack memory-maps it and
+yields the documents as slices of the mapping, so a run is one sequential read of one file.
+
+    <path>        the utf-8 reviews, back to back, without separators
+    <path>.idx    header    struct HEADER_FORMAT
+                  offsets   int64 * (documents + 1), document d is data[offsets[d]:offsets[d + 1]]
+                  labels    uint8 * documents, 1 for positive and 0 for negative reviews
+                  checksums uint32 * documents, the CRC-32 of every document
+
+A pack is appendable: new documents are written after the data described by the index and the
+index is then replaced, through a temporary file, as a whole. A crash while appending leaves the
+previous pack intact; the unindexed tail is cut off by the next append. CorpusPack.verify checks
+every document against its checksum.
+
+Run `python corpus_pack.py train.pack` to pack the training corpus,
+`python corpus_pack.py test.pack --pos "test\\pos\\*.txt" --neg "test\\neg\\*.txt"` for the test split,
+`--append` to add reviews to an existing pack and `--verify` to check one.
+"""
+
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from lexicon_snapshot import Fingerprint, load_lexicon_snapshot, save_lexicon_snapshot
+from sentiment_analysis import read_files
+
+PACK_MAGIC: bytes = b"WCPACKIX"
+PACK_VERSION: int = 1
+INDEX_SUFFIX: str = ".idx"
+# magic, version, documents, data size
+HEADER_FORMAT: str = "<8sIQQ"
+HEADER_SIZE: int = struct.calcsize(HEADER_FORMAT)
+
+
+class CorpusPack:
+    """
+    A packed corpus opened for reading, with its data file memory-mapped.
+    Raises OSError if the pack is missing and ValueError if its index is damaged.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets, self.labels, self.checksums, index_digest = _read_index(path + INDEX_SUFFIX)
+        self.data_size = self.offsets[-1]
+        self._digest = index_digest
+        with open(path, "rb") as stream:
+            if os.fstat(stream.fileno()).st_size < self.data_size:
+                raise ValueError(f"the data file of {path} is shorter than its index")
+            # mmap cannot map an empty file; an empty pack has nothing to map anyway.
+            self._mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) if self.data_size else None
+        self.data = memoryview(self._mapped if self._mapped is not None else b"")
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __enter__(self) -> "CorpusPack":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Unmaps the data file. Document views handed out by document must have been released.
+        """
+        self.data.release()
+        if self._mapped is not None:
+            self._mapped.close()
+
+    @property
+    def fingerprint(self) -> Fingerprint:
+        """
+        The (documents, data size, digest of the index) fingerprint of the pack, which changes with
+        every append, for example to key a lexicon snapshot trained on it.
+        """
+        return len(self.labels), self.data_size, self._digest
+
+    def document(self, document: int) -> memoryview:
+        """
+        Returns the utf-8 bytes of a document as a view into the mapped file, without copying.
+        """
+        return self.data[self.offsets[document] : self.offsets[document + 1]]
+
+    def text(self, document: int) -> str:
+        with self.document(document) as view:
+            return str(view, "utf-8")
+
+    def is_positive(self, document: int) -> bool:
+        return self.labels[document] == 1
+
+    def iter_documents(self, documents: Optional[Iterable[int]] = None) -> Iterator[Tuple[bool, str]]:
+        """
+        Yields (is_positive, review text) pairs, for all documents in pack order or for the given ones,
+        in the form taken by WordCounter.count_documents.
+        """
+        if documents is None:
+            documents = range(len(self.labels))
+        data = self.data
+        offsets = self.offsets
+        labels = self.labels
+        for document in documents:
+            # The slice is a view of the mapping; only decoding the text copies the bytes.
+            yield labels[document] == 1, str(data[offsets[document] : offsets[document + 1]], "utf-8")
+
+    def verify(self) -> List[int]:
+        """
+        Recomputes the checksum of every document and returns the numbers of the damaged ones.
+        """
+        data = self.data
+        offsets = self.offsets
+        crc32 = zlib.crc32
+        return [
+            document
+            for document, checksum in enumerate(self.checksums)
+            if crc32(data[offsets[document] : offsets[document + 1]]) != checksum
+        ]
+
+
+def _read_index(index_path: str) -> Tuple[array, array, array, bytes]:
+    with open(index_path, "rb") as stream:
+        index = stream.read()
+    try:
+        magic, version, documents, data_size = struct.unpack_from(HEADER_FORMAT, index, 0)
+    except struct.error:
+        raise ValueError(f"{index_path} is not a corpus pack index")
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        raise ValueError(f"{index_path} is not a corpus pack index")
+
+    offset = HEADER_SIZE
+    columns = []
+    for typecode, length in (("q", documents + 1), ("B", documents), ("I", documents)):
+        column = array(typecode)
+        end = offset + column.itemsize * length
+        if end > len(index):
+            raise ValueError(f"{index_path} is truncated")
+        column.frombytes(index[offset:end])
+        if sys.byteorder == "big" and column.itemsize > 1:
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    offsets = columns[0]
+    if offset != len(index) or offsets[0] != 0 or offsets[-1] != data_size:
+        raise ValueError(f"{index_path} is inconsistent")
+    return offsets, columns[1], columns[2], hashlib.sha256(index).digest()
+
+
+def _write_index(index_path: str, offsets: array, labels: array, checksums: array) -> None:
+    header = struct.pack(HEADER_FORMAT, PACK_MAGIC, PACK_VERSION, len(labels), offsets[-1])
+    temporary_path = index_path + ".tmp"
+    with open(temporary_path, "wb") as stream:
+        stream.write(header)
+        for column in (offsets, labels, checksums):
+            if sys.byteorder == "big" and column.itemsize > 1:
+                column = array(column.typecode, column)
+                column.byteswap()
+            stream.write(column.tobytes())
+    os.replace(temporary_path, index_path)
+
+
+def write_pack(path: str, documents: Iterable[Tuple[bool, str]], append: bool = False) -> int:
+    """
+    Writes (is_positive, review text) pairs to the pack at path and returns how many were written.
+    With append, the documents are added after those of an existing pack (a new pack is created if
+    there is none); otherwise any existing pack is replaced.
+    Raises ValueError if the pack to append to is damaged.
+    """
+    index_path = path + INDEX_SUFFIX
+    if append and os.path.exists(index_path):
+        offsets, labels, checksums, _ = _read_index(index_path)
+        try:
+            stream = open(path, "r+b")
+        except FileNotFoundError:
+            raise ValueError(f"{path} is a damaged pack, its index has no data file")
+        # Drop whatever a previous append wrote without getting to index it.
+        stream.truncate(offsets[-1])
+        stream.seek(offsets[-1])
+    else:
+        offsets, labels, checksums = array("q", [0]), array("B"), array("I")
+        if os.path.exists(index_path):
+            # The index of the replaced pack must not describe the new data if packing is interrupted.
+            os.remove(index_path)
+        stream = open(path, "wb")
+
+    written = 0
+    with stream:
+        position = offsets[-1]
+        for is_positive, content in documents:
+            data = content.encode("utf-8")
+            stream.write(data)
+            position += len(data)
+            offsets.append(position)
+            labels.append(1 if is_positive else 0)
+            checksums.append(zlib.crc32(data))
+            written += 1
+        stream.flush()
+        os.fsync(stream.fileno())
+    _write_index(index_path, offsets, labels, checksums)
+    return written
+
+
+def pack_corpus(pos_path_pattern: str, neg_path_pattern: str, path: str, append: bool = False) -> int:
+    """
+    Packs the positive, then the negative review files into the pack at path, in sorted file order.
+    Returns the number of packed reviews.
+    """
+    import glob
+
+    documents = chain(
+        ((True, content) for content in read_files(sorted(glob.glob(pos_path_pattern)))),
+        ((False, content) for content in read_files(sorted(glob.glob(neg_path_pattern)))),
+    )
+    return write_pack(path, documents, append)
+
+
+def load_or_train_from_pack(word_counter, pack_path: str, snapshot_path: str) -> None:
+    """
+    Loads word_counter from the snapshot at snapshot_path if it was trained on the current content
+    of the pack, otherwise trains it on the packed reviews and refreshes the snapshot.
+    """
+    with CorpusPack(pack_path) as pack:
+        fingerprint = pack.fingerprint
+        if load_lexicon_snapshot(snapshot_path, word_counter, fingerprint):
+            return
+        word_counter.count_documents(pack.iter_documents())
+    word_counter.compact()
+    try:
+        save_lexicon_snapshot(word_counter, snapshot_path, fingerprint)
+    except OSError:
+        print("Could not save the lexicon snapshot, the model will be retrained on the next start.")
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    from config import NEG_FILES_FEED, POS_FILES_FEED
+
+    parser = argparse.ArgumentParser(description="Pack a labeled review corpus into one memory-mappable file.")
+    parser.add_argument("pack", help="pack file to write (its index is written next to it with the .idx suffix)")
+    parser.add_argument("--pos", default=POS_FILES_FEED, help="positive review files pattern")
+    parser.add_argument("--neg", default=NEG_FILES_FEED, help="negative review files pattern")
+    parser.add_argument("--append", action="store_true", help="add the reviews to an existing pack")
+    parser.add_argument("--verify", action="store_true", help="only check the checksums of an existing pack")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> int:
+    options = parse_arguments(arguments)
+    if not options.verify:
+        written = pack_corpus(options.pos, options.neg, options.pack, options.append)
+        print(f"Packed {written} reviews into {options.pack}")
+    with CorpusPack(options.pack) as pack:
+        damaged = pack.verify()
+        print(f"{options.pack}: {len(pack)} reviews, {pack.data_size} bytes, {len(damaged)} damaged")
+    for document in damaged:
+        print(f"    review {document} does not match its checksum")
+    return 1 if damaged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
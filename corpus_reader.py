@@ -0,0 +1,61 @@
+"""
+Streaming readers for labeled review corpora stored in archives.
+
+The Large Movie Review Dataset is distributed as aclImdb_v1.tar.gz with reviews stored as
+aclImdb/<split>/<pos|neg>/<id>_<rating>.txt. The readers below iterate the members of such an
+archive (tar, tar.gz, tar.bz2, tar.xz or zip) in archive order and yield one labeled document
+at a time, so the corpus never has to be extracted and only one review is held in memory.
+"""
+
+import tarfile
+import zipfile
+from typing import Iterator, Optional, Tuple
+
+LABELS = {"pos": True, "neg": False}
+
+
+def document_label(member_name: str, split: str) -> Optional[bool]:
+    """
+    Returns True for a positive and False for a negative review of the given split,
+    or None for any other archive member (other splits, unlabeled reviews, metadata files).
+    """
+    parts = member_name.replace("\\", "/").split("/")
+    if len(parts) < 3 or not parts[-1].endswith(".txt") or parts[-3] != split:
+        return None
+    return LABELS.get(parts[-2])
+
+
+def iter_archive_documents(archive_path: str, split: str = "train") -> Iterator[Tuple[bool, str]]:
+    """
+    Yields (is_positive, review text) pairs for the labeled reviews of a split in an archive.
+    """
+    if zipfile.is_zipfile(archive_path):
+        yield from _iter_zip_documents(archive_path, split)
+    else:
+        yield from _iter_tar_documents(archive_path, split)
+
+
+def _iter_tar_documents(archive_path: str, split: str) -> Iterator[Tuple[bool, str]]:
+    # Stream mode ("r|*") reads the archive strictly sequentially, which suits compressed
+    # archives on network filesystems: no seeking back and no member index kept in memory.
+    with tarfile.open(archive_path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            is_positive = document_label(member.name, split)
+            if is_positive is None:
+                continue
+            stream = archive.extractfile(member)
+            yield is_positive, stream.read().decode("utf-8")
+
+
+def _iter_zip_documents(archive_path: str, split: str) -> Iterator[Tuple[bool, str]]:
+    with zipfile.ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            is_positive = document_label(member.filename, split)
+            if is_positive is None:
+                continue
+            with archive.open(member) as stream:
+                yield is_positive, stream.read().decode("utf-8")
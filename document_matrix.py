@@ -0,0 +1,272 @@
+"""
+Sparse document-term matrix of a labeled training corpus.
+
+WordCounter.count_words reduces the corpus to document frequencies on the fly, so every
+experiment that needs something else (re-weighting, cross-validation, other scorers) has to
+read and tokenize the raw files again. compile_corpus reads them once and keeps the corpus as a
+DocumentTermMatrix in CSR layout:
+    indptr    int64 * (documents + 1), row d spans indices[indptr[d]:indptr[d + 1]]
+    indices   int32 * non-zeros, the token ids of every row in ascending order
+    data      uint32 * non-zeros, how often the token occurs in the document
+    labels    uint8 * documents, 1 for positive and 0 for negative reviews
+    words     the vocabulary, token id i is words[i]
+WordCounter.count_document_matrix derives the word counters from its column sums.
+
+The matrix is saved in a little-endian binary file that is memory-mapped on load, with the
+fingerprint of the training corpus in its header like a lexicon snapshot:
+    header    struct HEADER_FORMAT
+    indptr, indices, data, labels
+    words     utf-8 words joined with newlines
+
+Run `python document_matrix.py --output corpus.dtm` to compile the training corpus.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from lexicon_snapshot import Fingerprint, corpus_fingerprint
+from preprocessing import tokenize
+from sentiment_analysis import read_files
+
+MATRIX_MAGIC: bytes = b"WCDOCMTX"
+MATRIX_VERSION: int = 1
+# magic, version, file count, total corpus size, corpus digest, documents, non-zeros, vocabulary size, vocabulary bytes
+HEADER_FORMAT: str = "<8sIIQ32sQQIQ"
+HEADER_SIZE: int = struct.calcsize(HEADER_FORMAT)
+NO_FINGERPRINT: Fingerprint = (0, 0, bytes(32))
+
+
+class DocumentTermMatrix:
+    """
+    Term counts of labeled documents in compressed sparse row layout.
+    """
+
+    def __init__(
+        self,
+        words: List[str],
+        indptr: array,
+        indices: array,
+        data: array,
+        labels: array,
+        fingerprint: Fingerprint = NO_FINGERPRINT,
+    ):
+        self.words = words
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.labels = labels
+        self.fingerprint = fingerprint
+        if len(indptr) != len(labels) + 1 or indptr[-1] != len(indices) or len(indices) != len(data):
+            raise ValueError("inconsistent document-term matrix")
+
+    @classmethod
+    def from_documents(
+        cls, documents: Iterable[Tuple[bool, str]], fingerprint: Fingerprint = NO_FINGERPRINT
+    ) -> "DocumentTermMatrix":
+        """
+        Builds the matrix from (is_positive, text) pairs in one pass, tokenizing like WordCounter.
+        Token ids are assigned in order of first occurrence.
+        """
+        word_ids: Dict[str, int] = {}
+        words: List[str] = []
+        indptr = array("q", [0])
+        indices = array("i")
+        data = array("I")
+        labels = array("B")
+        for is_positive, content in documents:
+            term_counts = Counter(tokenize(content))
+            row = []
+            for word, count in term_counts.items():
+                word_id = word_ids.get(word)
+                if word_id is None:
+                    word_id = word_ids[word] = len(words)
+                    words.append(word)
+                row.append((word_id, count))
+            row.sort()
+            indices.extend([word_id for word_id, _ in row])
+            data.extend([count for _, count in row])
+            indptr.append(len(indices))
+            labels.append(1 if is_positive else 0)
+        return cls(words, indptr, indices, data, labels, fingerprint)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.labels), len(self.words)
+
+    def row(self, document: int) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        Returns the token ids and term counts of a document.
+        """
+        start, end = self.indptr[document], self.indptr[document + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def document_frequencies(
+        self, is_positive: bool, documents: Optional[Iterable[int]] = None
+    ) -> array:
+        """
+        Returns the number of positive (or negative) documents containing every token id, that is
+        the column sums of the binarized rows with that label. Only the given documents are
+        counted if any are given, for example the training folds of a cross-validation.
+        """
+        label = 1 if is_positive else 0
+        if documents is None:
+            documents = range(len(self.labels))
+        indptr = self.indptr
+        indices = self.indices
+        labels = self.labels
+        # Counter counts the concatenated rows at C speed; the ids of a row are distinct.
+        column_sums = Counter(
+            chain.from_iterable(
+                indices[indptr[document] : indptr[document + 1]]
+                for document in documents
+                if labels[document] == label
+            )
+        )
+        frequencies = array("I", bytes(4 * len(self.words)))
+        for word_id, count in column_sums.items():
+            frequencies[word_id] = count
+        return frequencies
+
+    def save(self, path: str) -> None:
+        """
+        Writes the matrix to path, through a temporary file moved into place like a lexicon snapshot.
+        """
+        vocabulary = "\n".join(self.words).encode("utf-8")
+        file_count, total_size, digest = self.fingerprint
+        header = struct.pack(
+            HEADER_FORMAT,
+            MATRIX_MAGIC,
+            MATRIX_VERSION,
+            file_count,
+            total_size,
+            digest,
+            len(self.labels),
+            len(self.indices),
+            len(self.words),
+            len(vocabulary),
+        )
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as stream:
+            stream.write(header)
+            for column in (self.indptr, self.indices, self.data, self.labels):
+                if sys.byteorder == "big" and column.itemsize > 1:
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                stream.write(column.tobytes())
+            stream.write(vocabulary)
+        os.replace(temporary_path, path)
+
+
+def load_document_matrix(path: str, fingerprint: Fingerprint = None) -> Optional[DocumentTermMatrix]:
+    """
+    Loads a matrix saved by DocumentTermMatrix.save. If a fingerprint is given, the matrix is only
+    used when it was compiled from the same corpus. Returns None when the file is missing, stale or damaged.
+    """
+    try:
+        with open(path, "rb") as stream:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return _read_matrix(mapped, fingerprint)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _read_matrix(mapped: mmap.mmap, fingerprint: Fingerprint) -> Optional[DocumentTermMatrix]:
+    (
+        magic,
+        version,
+        file_count,
+        total_size,
+        digest,
+        documents,
+        non_zeros,
+        vocabulary_size,
+        vocabulary_length,
+    ) = struct.unpack_from(HEADER_FORMAT, mapped, 0)
+    if magic != MATRIX_MAGIC or version != MATRIX_VERSION:
+        return None
+    if fingerprint is not None and (file_count, total_size, digest) != fingerprint:
+        return None
+
+    offset = HEADER_SIZE
+    columns = []
+    with memoryview(mapped) as view:
+        for typecode, length in (("q", documents + 1), ("i", non_zeros), ("I", non_zeros), ("B", documents)):
+            column = array(typecode)
+            end = offset + column.itemsize * length
+            column.frombytes(view[offset:end])
+            if sys.byteorder == "big" and column.itemsize > 1:
+                column.byteswap()
+            columns.append(column)
+            offset = end
+        if len(mapped) != offset + vocabulary_length:
+            return None
+        vocabulary = str(view[offset:], "utf-8")
+
+    words = vocabulary.split("\n") if vocabulary_size else []
+    if len(words) != vocabulary_size:
+        return None
+    return DocumentTermMatrix(words, *columns, fingerprint=(file_count, total_size, digest))
+
+
+def compile_corpus(pos_path_pattern: str, neg_path_pattern: str) -> DocumentTermMatrix:
+    """
+    Reads the positive and negative training files once into a DocumentTermMatrix,
+    stamped with the corpus fingerprint.
+    """
+    import glob
+
+    fingerprint = corpus_fingerprint(pos_path_pattern, neg_path_pattern)
+    documents = chain(
+        ((True, content) for content in read_files(sorted(glob.glob(pos_path_pattern)))),
+        ((False, content) for content in read_files(sorted(glob.glob(neg_path_pattern)))),
+    )
+    return DocumentTermMatrix.from_documents(documents, fingerprint)
+
+
+def load_or_compile_corpus(
+    pos_path_pattern: str, neg_path_pattern: str, matrix_path: str
+) -> DocumentTermMatrix:
+    """
+    Loads the matrix at matrix_path if it was compiled from the current training corpus,
+    otherwise compiles the corpus and saves the matrix there.
+    """
+    matrix = load_document_matrix(matrix_path, corpus_fingerprint(pos_path_pattern, neg_path_pattern))
+    if matrix is None:
+        matrix = compile_corpus(pos_path_pattern, neg_path_pattern)
+        try:
+            matrix.save(matrix_path)
+        except OSError:
+            print("Could not save the document-term matrix, the corpus will be compiled again next time.")
+    return matrix
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    from config import NEG_FILES_FEED, POS_FILES_FEED
+
+    parser = argparse.ArgumentParser(description="Compile the training corpus into a document-term matrix.")
+    parser.add_argument("--pos", default=POS_FILES_FEED, help="positive training files pattern")
+    parser.add_argument("--neg", default=NEG_FILES_FEED, help="negative training files pattern")
+    parser.add_argument("--output", required=True, help="matrix file to write")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> None:
+    options = parse_arguments(arguments)
+    matrix = compile_corpus(options.pos, options.neg)
+    matrix.save(options.output)
+    documents, vocabulary_size = matrix.shape
+    print(f"Compiled {documents} documents, {vocabulary_size} words, {len(matrix.indices)} non-zeros into {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Accuracy and throughput evaluation on a labeled review split.
+
+The reviews of a split such as aclImdb test/pos and test/neg are streamed in shards to a pool of
+worker processes and scored in basic and/or advanced mode. The model is trained (or loaded) once:
+every worker maps the lexicon snapshot written by the parent instead of training its own copy.
+With --pack the split is read from a corpus_pack pack that every worker memory-maps, so the shards
+are ranges of document numbers rather than lists of files; --train-pack trains from a pack too.
+For every mode the report gives the accuracy, the confusion matrix of actual labels against the
+verdicts (positive, neutral or negative, where neutral counts as an error), the per-document
+latency percentiles of reading (review files only), preprocessing and scoring, and the overall documents per second.
+
+Example:
+    python evaluate.py --workers 8 --json evaluation.json
+    python evaluate.py --pack test.pack --train-pack train.pack
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import (
+    LEXICON_SNAPSHOT_PATH,
+    NEG_FILES_FEED,
+    POS_FILES_FEED,
+    SENTIMENT_SCORER,
+    TRAINING_WORKERS,
+)
+from corpus_pack import CorpusPack, load_or_train_from_pack
+from lexicon_snapshot import load_lexicon_snapshot, load_or_train_word_counter
+from percentiles import percentile
+from preprocessing import preprocess_review
+from sentiment_analysis import (
+    SCORERS,
+    WordCounter,
+    compute_file_sentiment,
+    compute_file_sentiment_both,
+    compute_sentiment,
+    sentiment_verdict,
+)
+
+TEST_POS_FEED: str = r"test\pos\*.txt"
+TEST_NEG_FEED: str = r"test\neg\*.txt"
+SHARD_SIZE: int = 64
+MODES: Dict[str, List[str]] = {
+    "basic": ["basic"],
+    "advanced": ["advanced"],
+    "both": ["basic", "advanced"],
+}
+VERDICTS: List[str] = ["positive", "neutral", "negative"]
+
+# (is_positive, [(verdict, latency in seconds) per mode]) of one scored review.
+ScoredReview = Tuple[bool, List[Tuple[str, float]]]
+
+# The model and the evaluation pack (if any) of a worker process, loaded once by _init_worker.
+_word_counter: Optional[WordCounter] = None
+_pack: Optional[CorpusPack] = None
+
+
+class ModeResults:
+    """
+    Confusion matrix and per-document latencies of one analysis mode.
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.confusion: Dict[str, Dict[str, int]] = {
+            label: {verdict: 0 for verdict in VERDICTS} for label in ("positive", "negative")
+        }
+        self.latencies: List[float] = []
+
+    def add(self, is_positive: bool, verdict: str, latency: float) -> None:
+        self.confusion["positive" if is_positive else "negative"][verdict] += 1
+        self.latencies.append(latency)
+
+    @property
+    def documents(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def accuracy(self) -> float:
+        correct = self.confusion["positive"]["positive"] + self.confusion["negative"]["negative"]
+        return correct / self.documents if self.documents else 0.0
+
+    def summary(self) -> Dict[str, object]:
+        cpu_seconds = sum(self.latencies)
+        return {
+            "documents": self.documents,
+            "accuracy": self.accuracy,
+            "confusion": self.confusion,
+            "docs_per_cpu_second": self.documents / cpu_seconds if cpu_seconds > 0 else 0.0,
+            "p50_ms": percentile(self.latencies, 0.50) * 1e3,
+            "p95_ms": percentile(self.latencies, 0.95) * 1e3,
+            "p99_ms": percentile(self.latencies, 0.99) * 1e3,
+        }
+
+
+def iter_labeled_files(pos_path_pattern: str, neg_path_pattern: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Yields (path, is_positive) for the positive files, then for the negative files.
+    """
+    import glob
+
+    for path_pattern, is_positive in ((pos_path_pattern, True), (neg_path_pattern, False)):
+        for file in sorted(glob.glob(path_pattern)):
+            yield file, is_positive
+
+
+def _shards(files: Iterator[Tuple[str, bool]], shard_size: int) -> Iterator[List[Tuple[str, bool]]]:
+    while True:
+        shard = list(islice(files, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def _pack_shards(documents: int, shard_size: int) -> Iterator[range]:
+    for start in range(0, documents, shard_size):
+        yield range(start, min(start + shard_size, documents))
+
+
+def _init_worker(
+    snapshot_path: str,
+    scorer: str,
+    pack_path: Optional[str] = None,
+    ngram_layout: Optional[Tuple[Tuple[int, ...], int]] = None,
+) -> None:
+    global _word_counter, _pack
+    if pack_path is not None:
+        _pack = CorpusPack(pack_path)
+    word_counter = WordCounter()
+    if ngram_layout is not None:
+        word_counter.enable_ngrams(*ngram_layout)
+    if not load_lexicon_snapshot(snapshot_path, word_counter):
+        raise RuntimeError(f"could not load the lexicon snapshot {snapshot_path}")
+    # Build the scoring tables now, so that they do not count as the latency of the first reviews.
+    word_counter.scoring_index(scorer)
+    _word_counter = word_counter
+
+
+def score_files(files: List[Tuple[str, bool]], modes: List[str], scorer: str) -> List[ScoredReview]:
+    """
+    Scores a shard of labeled review files in every mode with the model of this process.
+    Every file is streamed through compute_file_sentiment, so a large file is never held in memory
+    whole; the latency of a review covers reading, preprocessing and scoring it. With both modes
+    the file is scored in one pass by compute_file_sentiment_both, and each mode is given half
+    of its latency.
+    This is the unit of work executed by every worker process.
+    """
+    scored = []
+    for file, is_positive in files:
+        if len(modes) > 1:
+            start = time.perf_counter()
+            basic, advanced = compute_file_sentiment_both(file, _word_counter, scorer=scorer)
+            latency = (time.perf_counter() - start) / len(modes)
+            sentiments = {"basic": basic, "advanced": advanced}
+            results = [(sentiment_verdict(sentiments[mode]), latency) for mode in modes]
+        else:
+            results = []
+            for mode in modes:
+                start = time.perf_counter()
+                sentiment = compute_file_sentiment(
+                    file, _word_counter, advanced=mode == "advanced", scorer=scorer
+                )
+                latency = time.perf_counter() - start
+                results.append((sentiment_verdict(sentiment), latency))
+        scored.append((is_positive, results))
+    return scored
+
+
+def score_packed(documents: Iterable[int], modes: List[str], scorer: str) -> List[ScoredReview]:
+    """
+    Scores a shard of documents of the evaluation pack like score_files, reading them from the mapped pack.
+    """
+    return [
+        (is_positive, _score_review(review, modes, scorer))
+        for is_positive, review in _pack.iter_documents(documents)
+    ]
+
+
+def _score_review(review: str, modes: List[str], scorer: str) -> List[Tuple[str, float]]:
+    results = []
+    for mode in modes:
+        advanced = mode == "advanced"
+        start = time.perf_counter()
+        words = preprocess_review(review, advanced=advanced)
+        sentiment = (
+            compute_sentiment(words, _word_counter, advanced=advanced, scorer=scorer)[0]
+            if words
+            else 0.0
+        )
+        latency = time.perf_counter() - start
+        results.append((sentiment_verdict(sentiment), latency))
+    return results
+
+
+def evaluate(
+    word_counter: WordCounter,
+    files: Optional[Iterator[Tuple[str, bool]]],
+    modes: List[str],
+    scorer: str = SENTIMENT_SCORER,
+    workers: int = 1,
+    snapshot_path: Optional[str] = None,
+    shard_size: int = SHARD_SIZE,
+    pack_path: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Scores the labeled files in every mode and returns the JSON-serializable report.
+    If pack_path is given, the documents of that corpus pack are scored instead of the files.
+    With more than one worker, the files are scored in worker processes that load the model from
+    the lexicon snapshot at snapshot_path, which must hold the counters of word_counter.
+    """
+    global _word_counter, _pack
+    results = {mode: ModeResults(mode) for mode in modes}
+    if pack_path is not None:
+        with CorpusPack(pack_path) as pack:
+            documents = len(pack)
+        shards = _pack_shards(documents, shard_size)
+        score_shard = score_packed
+    else:
+        shards = _shards(iter(files), shard_size)
+        score_shard = score_files
+
+    start = time.perf_counter()
+    if workers > 1 and snapshot_path is not None:
+        ngrams = word_counter.ngrams
+        ngram_layout = (ngrams.orders, ngrams.table_size) if ngrams is not None else None
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(snapshot_path, scorer, pack_path, ngram_layout),
+        ) as executor:
+            scored_shards = executor.map(score_shard, shards, repeat(modes), repeat(scorer))
+            _collect(scored_shards, modes, results)
+    else:
+        workers = 1
+        word_counter.scoring_index(scorer)
+        _word_counter = word_counter
+        if pack_path is not None:
+            _pack = CorpusPack(pack_path)
+        try:
+            _collect((score_shard(shard, modes, scorer) for shard in shards), modes, results)
+        finally:
+            if _pack is not None:
+                _pack.close()
+                _pack = None
+    elapsed = time.perf_counter() - start
+
+    documents = results[modes[0]].documents if modes else 0
+    return {
+        "scorer": scorer,
+        "workers": workers,
+        "documents": documents,
+        "seconds": elapsed,
+        "docs_per_second": documents / elapsed if elapsed > 0 else 0.0,
+        "modes": {mode: mode_results.summary() for mode, mode_results in results.items()},
+    }
+
+
+def _collect(
+    scored_shards: Iterator[List[ScoredReview]], modes: List[str], results: Dict[str, ModeResults]
+) -> None:
+    for scored in scored_shards:
+        for is_positive, mode_results in scored:
+            for mode, (verdict, latency) in zip(modes, mode_results):
+                results[mode].add(is_positive, verdict, latency)
+
+
+def print_report(report: Dict[str, object]) -> None:
+    print("\n------------------------------------------------------------------------------")
+    print(
+        f"Evaluated {report['documents']} reviews with the {report['scorer']} scorer in "
+        f"{report['seconds']:.2f} s ({report['docs_per_second']:.1f} docs/s, {report['workers']} workers)"
+    )
+    print("------------------------------------------------------------------------------")
+    for mode, summary in report["modes"].items():
+        print(
+            f"{mode}: accuracy {summary['accuracy']:.4f}, {summary['docs_per_cpu_second']:.1f} docs/s per worker,"
+            f" latency p50 {summary['p50_ms']:.3f} ms, p95 {summary['p95_ms']:.3f} ms, p99 {summary['p99_ms']:.3f} ms"
+        )
+        print(f"    {'actual / verdict':<18}" + "".join(f"{verdict:>10}" for verdict in VERDICTS))
+        for label, row in summary["confusion"].items():
+            print(f"    {label:<18}" + "".join(f"{row[verdict]:>10}" for verdict in VERDICTS))
+    print("------------------------------------------------------------------------------")
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the accuracy and throughput of the sentiment analysis on a labeled split.")
+    parser.add_argument("--pos", default=TEST_POS_FEED, help="positive evaluation files pattern")
+    parser.add_argument("--neg", default=TEST_NEG_FEED, help="negative evaluation files pattern")
+    parser.add_argument("--pack", help="evaluate the reviews of this corpus pack instead of --pos and --neg")
+    parser.add_argument("--mode", choices=sorted(MODES), default="both", help="analysis mode (default: both)")
+    parser.add_argument("--scorer", choices=SCORERS, default=SENTIMENT_SCORER, help=f"scoring model (default: {SENTIMENT_SCORER})")
+    parser.add_argument("--workers", type=int, default=TRAINING_WORKERS, help="scoring and training processes")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="reviews per unit of work")
+    parser.add_argument("--json", help="also write the report as JSON to this file")
+    parser.add_argument("--train-pos", default=POS_FILES_FEED, help="positive training files pattern")
+    parser.add_argument("--train-neg", default=NEG_FILES_FEED, help="negative training files pattern")
+    parser.add_argument("--train-pack", help="train on the reviews of this corpus pack instead of --train-pos and --train-neg")
+    parser.add_argument(
+        "--snapshot",
+        help=f"lexicon snapshot path (default: {LEXICON_SNAPSHOT_PATH}, or <train pack>.snapshot with --train-pack)",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> Dict[str, object]:
+    options = parse_arguments(arguments)
+    word_counter = WordCounter()
+    if options.train_pack:
+        # A model trained on the pack must not replace the snapshot main.py trains from the files.
+        snapshot_path = options.snapshot or options.train_pack + ".snapshot"
+        load_or_train_from_pack(word_counter, options.train_pack, snapshot_path)
+    else:
+        snapshot_path = options.snapshot or LEXICON_SNAPSHOT_PATH
+        load_or_train_word_counter(
+            word_counter, options.train_pos, options.train_neg, snapshot_path, workers=options.workers
+        )
+    if options.workers > 1 and not load_lexicon_snapshot(snapshot_path, WordCounter()):
+        print("The lexicon snapshot is not available, evaluating in a single process.", file=sys.stderr)
+        snapshot_path = None
+
+    report = evaluate(
+        word_counter,
+        None if options.pack else iter_labeled_files(options.pos, options.neg),
+        MODES[options.mode],
+        scorer=options.scorer,
+        workers=options.workers,
+        snapshot_path=snapshot_path,
+        shard_size=options.shard_size,
+        pack_path=options.pack,
+    )
+    print_report(report)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as stream:
+            json.dump(report, stream, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
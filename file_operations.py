@@ -1,40 +1,44 @@
-import os
-import re
 from typing import List
 
+from instrumentation import stage
+from review_store import open_review_store
+
 REVIEW_FILES_PATH = r"reviews"
+REVIEW_PAGE_SIZE = 20
 
 
-def list_review_files(review_files_path: str) -> List[str]:
+def list_review_files(review_files_path: str, page_size: int = REVIEW_PAGE_SIZE) -> List[str]:
     try:
-        files = [
-            file for file in os.listdir(review_files_path) if file.endswith(".txt")
-        ]
-        if not files:
-            print("\nNo review files found.")
-            return []
-        
-        sorted_files = sorted(
-            files, key=lambda x: int(x.split("Review")[1].split(".")[0])
-        )
-        
-        for i, file_name in enumerate(sorted_files, 1):
-            with open(
-                os.path.join(review_files_path, file_name), "r", encoding="utf-8"
-            ) as file:
-                content = file.read()
-                sentences = re.split(r"[.!?]", content)
-                if len(sentences) > 1:
-                    first_sentence = sentences[0] + ("..." if sentences[1] else "")
-                else:
-                    first_sentence = content.strip()
-                print(f"{i}. {file_name} - {first_sentence}")
-                
-        return sorted_files
-
+        store = open_review_store(review_files_path)
     except FileNotFoundError:
         print("\nDirectory not found. Please make sure the directory exists.\n")
         return []
+    except OSError as error:
+        print(f"\n{error}\n")
+        return []
+    try:
+        limit = page_size if page_size > 0 else None
+        files = []
+        with stage("review_list"):
+            page = store.list_review_files(0, limit)
+        if not page:
+            print("\nNo review files found.")
+            return []
+
+        while page:
+            for summary in page:
+                files.append(summary.file_name)
+                print(f"{len(files)}. {summary.file_name} - {summary.first_sentence}")
+            if limit is None or len(page) < limit:
+                break
+            with stage("review_list"):
+                page = store.list_review_files(len(files), limit)
+            if page and input("\nPress Enter for more review files or q to stop listing:").strip().lower() == "q":
+                break
+
+        return files
+    finally:
+        store.close()
 
 
 def get_user_choice(files, prompt):
@@ -63,36 +67,30 @@ def read_review_file(review_files_path: str) -> str:
     if choice is None:
         return ""
     
-    chosen_file = os.path.join(review_files_path, files[choice - 1])
-    with open(chosen_file, "r", encoding="utf-8") as stream:
-        review_content = stream.read()
+    store = open_review_store(review_files_path)
+    try:
+        with stage("review_read"):
+            review_content = store.read_review_file(files[choice - 1])
+    finally:
+        store.close()
 
     return review_content
 
 
 def save_review(review: str, review_files_path: str) -> None:
-    def get_next_review_file() -> str:
-        try:
-            files = os.listdir(review_files_path)
-            existing_numbers = [
-                int(file.split("Review")[1].split(".")[0])
-                for file in files
-                if file.startswith("Review")
-            ]
-            next_number = 1
-            while next_number in existing_numbers:
-                next_number += 1
-            return f"Review{next_number}.txt"
-        except FileNotFoundError:
-            print("Directory not found.")
-            return None
-
-    next_file = get_next_review_file()
-    if not next_file:
+    try:
+        store = open_review_store(review_files_path)
+    except FileNotFoundError:
+        print("Directory not found.")
         return
-    
-    with open(os.path.join(review_files_path, next_file), "w", encoding="utf-8") as stream:
-        stream.write(review)
+    except OSError as error:
+        print(error)
+        return
+    try:
+        with stage("review_save"):
+            next_file = store.save_review(review)
+    finally:
+        store.close()
     
     print(f"\nReview saved to {next_file}.")
 
@@ -108,8 +106,12 @@ def delete_review_file(review_files_path: str) -> None:
     if choice is None:
         return
 
-    chosen_file = os.path.join(review_files_path, files[choice - 1])
-    os.remove(chosen_file)
+    store = open_review_store(review_files_path)
+    try:
+        with stage("review_delete"):
+            store.delete_review_file(files[choice - 1])
+    finally:
+        store.close()
 
     print(f"\nReview file '{files[choice - 1]}' has been deleted.")
     input("\nPress enter to return to the main menu... ")
\ No newline at end of file
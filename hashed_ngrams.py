@@ -0,0 +1,159 @@
+"""
+Hashed n-gram features with a fixed memory footprint.
+
+Phrases such as "waste of time" or "must see" carry sentiment their words do not. Counting every
+bigram and trigram in dicts would grow the model with the corpus; instead every n-gram is hashed
+with CRC-32 into one of table_size buckets, and the positive and negative document frequencies of
+the buckets are kept in two uint32 arrays. The model costs 8 * table_size bytes whatever the corpus,
+at the price of unrelated n-grams sharing a bucket when the table is small.
+"""
+
+import math
+import zlib
+from array import array
+from collections import Counter
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+NGRAM_ORDERS: Tuple[int, ...] = (2, 3)
+NGRAM_TABLE_SIZE: int = 1 << 20
+
+
+def ngrams(words: Sequence[str], orders: Iterable[int] = NGRAM_ORDERS) -> List[str]:
+    """
+    Returns the space-joined n-grams of the given orders, in order of appearance.
+    """
+    result = []
+    for order in orders:
+        result.extend(" ".join(words[i : i + order]) for i in range(len(words) - order + 1))
+    return result
+
+
+class NgramWindow:
+    """
+    The n-grams of a word stream given piece by piece: push returns the n-grams ending in the
+    pushed words, using the last words of the previous pieces as context.
+    Together they are the n-grams of the whole stream, grouped by order within every piece.
+    """
+
+    def __init__(self, orders: Iterable[int] = NGRAM_ORDERS):
+        self.orders: Tuple[int, ...] = tuple(orders)
+        self.context_size = max(self.orders, default=1) - 1
+        self.context: List[str] = []
+
+    def push(self, words: Sequence[str]) -> List[str]:
+        combined = self.context + list(words)
+        start = len(self.context)
+        result = []
+        for order in self.orders:
+            result.extend(
+                " ".join(combined[i : i + order])
+                for i in range(max(0, start - order + 1), len(combined) - order + 1)
+            )
+        self.context = combined[len(combined) - self.context_size :] if self.context_size else []
+        return result
+
+
+class HashedNgramCounter:
+    """
+    Positive and negative document frequencies of hashed n-grams.
+    """
+
+    def __init__(self, orders: Iterable[int] = NGRAM_ORDERS, table_size: int = NGRAM_TABLE_SIZE):
+        self.orders: Tuple[int, ...] = tuple(orders)
+        self.table_size = table_size
+        self.pos_counts = array("I", bytes(4 * table_size))
+        self.neg_counts = array("I", bytes(4 * table_size))
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.pos_counts) + len(self.neg_counts)) * self.pos_counts.itemsize
+
+    def bucket(self, ngram: str) -> int:
+        return zlib.crc32(ngram.encode("utf-8")) % self.table_size
+
+    def buckets(self, words: Sequence[str]) -> List[int]:
+        table_size = self.table_size
+        crc32 = zlib.crc32
+        return [crc32(ngram.encode("utf-8")) % table_size for ngram in ngrams(words, self.orders)]
+
+    def count_document(self, words: Sequence[str], is_positive: bool) -> None:
+        """
+        Adds one to every distinct bucket hit by the n-grams of a document's words.
+        """
+        self.count_buckets(set(self.buckets(words)), is_positive)
+
+    def count_buckets(self, buckets: Iterable[int], is_positive: bool) -> None:
+        """
+        Adds one to every given bucket, the distinct buckets of one document.
+        """
+        counts = self.pos_counts if is_positive else self.neg_counts
+        for bucket in buckets:
+            counts[bucket] += 1
+
+    def bucket_counts(self, is_positive: bool) -> Counter:
+        """
+        Returns the counts of the touched buckets only, e.g. to send the counts of a worker process
+        back without pickling the whole mostly empty table.
+        """
+        counts = self.pos_counts if is_positive else self.neg_counts
+        # compress skips the empty buckets at C speed.
+        return Counter({bucket: counts[bucket] for bucket in compress(range(self.table_size), counts)})
+
+    def add_bucket_counts(self, bucket_counts: Dict[int, int], is_positive: bool) -> None:
+        """
+        Adds the counts returned by bucket_counts of a counter with the same orders and table size.
+        """
+        counts = self.pos_counts if is_positive else self.neg_counts
+        for bucket, count in bucket_counts.items():
+            counts[bucket] += count
+
+    def log_odds_weights(self, smoothing: float = 1.0) -> array:
+        """
+        Returns the naive Bayes weight log(P(bucket | positive) / P(bucket | negative)) of every
+        bucket, with additive smoothing over the buckets seen in training, and 0.0 for empty buckets.
+        """
+        seen = sum(1 for pos_count, neg_count in zip(self.pos_counts, self.neg_counts) if pos_count or neg_count)
+        pos_total = sum(self.pos_counts) + smoothing * seen
+        neg_total = sum(self.neg_counts) + smoothing * seen
+        log_prior_ratio = math.log(neg_total / pos_total) if seen else 0.0
+        weights = array("d", bytes(8 * self.table_size))
+        for bucket, (pos_count, neg_count) in enumerate(zip(self.pos_counts, self.neg_counts)):
+            if pos_count or neg_count:
+                weights[bucket] = math.log((pos_count + smoothing) / (neg_count + smoothing)) + log_prior_ratio
+        return weights
+
+    def score(self, ngram: str, weights: Optional[array] = None) -> Optional[float]:
+        """
+        Returns the polarity (or weight) of one n-gram like features, None if its bucket is empty.
+        """
+        bucket = self.bucket(ngram)
+        pos_count = self.pos_counts[bucket]
+        neg_count = self.neg_counts[bucket]
+        if not (pos_count or neg_count):
+            return None
+        if weights is not None:
+            return weights[bucket]
+        return (pos_count - neg_count) / (pos_count + neg_count)
+
+    def features(self, words: Sequence[str], weights: Optional[array] = None) -> List[Tuple[str, float]]:
+        """
+        Returns (n-gram, polarity) for the n-grams of the words whose bucket was seen in training,
+        with the polarity (pos - neg) / (pos + neg) of the bucket, or its weight if weights
+        (such as the log_odds_weights) are given.
+        """
+        pos_counts = self.pos_counts
+        neg_counts = self.neg_counts
+        table_size = self.table_size
+        crc32 = zlib.crc32
+        result = []
+        for ngram in ngrams(words, self.orders):
+            bucket = crc32(ngram.encode("utf-8")) % table_size
+            pos_count = pos_counts[bucket]
+            neg_count = neg_counts[bucket]
+            if pos_count or neg_count:
+                if weights is not None:
+                    result.append((ngram, weights[bucket]))
+                else:
+                    result.append((ngram, (pos_count - neg_count) / (pos_count + neg_count)))
+        return result
@@ -0,0 +1,168 @@
+"""
+Opt-in stage timers for profiling the analysis pipeline.
+
+The pipeline stages (file reads, punctuation removal, sentence splitting, the negation pass,
+polarity lookups, output formatting, ...) are marked with the instrumented decorator or the
+stage context manager. When enabled, every call of a stage records its duration, and report()
+summarizes the call count, total, mean, p50 and p95 of every stage.
+
+Instrumentation is disabled by default. The wrapper of an instrumented function then only checks
+the module's enabled flag before calling the function, and the stage context manager, meant for
+coarser blocks such as file reads, does the same. enable() and disable() just flip the flag.
+
+Callers opt in: main.py and batch_scoring.py call enable() for --profile and write_report() when
+they finish.
+
+Stage times are inclusive: a stage that calls another stage (preprocess_review calls
+remove_punctuations, for example) includes the time spent in it.
+"""
+
+import functools
+import json
+import sys
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from percentiles import percentile
+
+SAMPLES_PER_STAGE: int = 10000
+
+
+class StageStats:
+    """
+    Call count and total time of a stage, with the most recent durations kept for percentiles.
+    """
+
+    __slots__ = ("calls", "total", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLES_PER_STAGE)
+
+    def add(self, seconds: float) -> None:
+        self.calls += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+
+_enabled: bool = False
+_stages: Dict[str, StageStats] = {}
+_clock = time.perf_counter
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    _stages.clear()
+
+
+def record(name: str, seconds: float) -> None:
+    stats = _stages.get(name)
+    if stats is None:
+        stats = _stages[name] = StageStats()
+    stats.add(seconds)
+
+
+def instrumented(name: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator timing every call of a function as the stage 'name' while instrumentation is enabled.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = _clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, _clock() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class stage:
+    """
+    Context manager timing a block of code as the stage 'name' while instrumentation is enabled.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = None
+
+    def __enter__(self) -> "stage":
+        if _enabled:
+            self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.start is not None:
+            record(self.name, _clock() - self.start)
+
+
+def report() -> Dict[str, Dict[str, float]]:
+    """
+    Returns the statistics of every recorded stage, in seconds, ordered by total time.
+    Percentiles are computed over the last SAMPLES_PER_STAGE calls of a stage.
+    """
+    summary = {}
+    for name, stats in sorted(_stages.items(), key=lambda item: -item[1].total):
+        summary[name] = {
+            "calls": stats.calls,
+            "total_seconds": stats.total,
+            "mean_seconds": stats.total / stats.calls,
+            "p50_seconds": percentile(stats.samples, 0.50),
+            "p95_seconds": percentile(stats.samples, 0.95),
+        }
+    return summary
+
+
+def print_report(stream=None) -> None:
+    stream = stream or sys.stderr
+    print("\n------------------------------------------------------------------------", file=stream)
+    print("Stage profile (inclusive times):", file=stream)
+    print("------------------------------------------------------------------------", file=stream)
+    print(f"{'stage':<24} {'calls':>9} {'total ms':>11} {'p50 us':>10} {'p95 us':>10}", file=stream)
+    for name, stats in report().items():
+        print(
+            f"{name:<24} {stats['calls']:>9} {stats['total_seconds'] * 1e3:>11.2f}"
+            f" {stats['p50_seconds'] * 1e6:>10.1f} {stats['p95_seconds'] * 1e6:>10.1f}",
+            file=stream,
+        )
+    print("------------------------------------------------------------------------", file=stream)
+
+
+def export_json(path: str) -> None:
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump(report(), stream, indent=2)
+
+
+def write_report(output_path: Optional[str] = None) -> None:
+    """
+    Prints the report of the recorded stages, also exported as JSON to output_path if given.
+    This is what the --profile flags call when the program finishes.
+    """
+    if not _stages:
+        return
+    print_report()
+    if output_path:
+        export_json(output_path)
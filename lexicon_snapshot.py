@@ -0,0 +1,249 @@
+"""
+Compiled binary snapshot of a trained WordCounter.
+
+The snapshot stores the vocabulary together with its positive and negative usage
+counters in a compact little-endian layout that is memory-mapped on load. The mapping only
+makes loading fast: the columns are copied out of it, because the CompactVocabulary they fill
+is updated in place by further training, so every process holds its own copy of the model
+rather than sharing the mapped pages with other processes. A header
+records a fingerprint of the training corpus (file count, total size and a digest of
+every file's path, size and modification time), so the snapshot is only rebuilt when
+the training files change. If the WordCounter counts n-grams, their hashed table is stored
+too, and a snapshot is only loaded into a WordCounter with the same n-gram orders and table size.
+
+Layout:
+    header            struct HEADER_FORMAT
+    pos counts        uint32 * vocabulary_size
+    neg counts        uint32 * vocabulary_size
+    n-gram pos counts uint32 * ngram_table_size (0 without n-grams)
+    n-gram neg counts uint32 * ngram_table_size
+    vocabulary        utf-8 words joined with newlines, in sorted order
+"""
+
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from vocabulary import CompactVocabulary
+
+SNAPSHOT_MAGIC: bytes = b"WCLEXSNP"
+SNAPSHOT_VERSION: int = 2
+# magic, version, file count, total corpus size, corpus digest, vocabulary size, vocabulary bytes,
+# n-gram orders (bit n set for order n), n-gram table size
+HEADER_FORMAT: str = "<8sIIQ32sIQIQ"
+HEADER_SIZE: int = struct.calcsize(HEADER_FORMAT)
+
+Fingerprint = Tuple[int, int, bytes]
+
+
+def corpus_fingerprint(pos_path_pattern: str, neg_path_pattern: str) -> Fingerprint:
+    """
+    Returns the (file count, total size, digest) fingerprint of the training corpus.
+    Only file metadata is read, the file contents are never opened.
+    """
+    digest = hashlib.sha256()
+    file_count = 0
+    total_size = 0
+    for label, path_pattern in (("pos", pos_path_pattern), ("neg", neg_path_pattern)):
+        for file in sorted(glob.glob(path_pattern)):
+            stat = os.stat(file)
+            digest.update(f"{label}\t{file}\t{stat.st_size}\t{stat.st_mtime_ns}\n".encode("utf-8"))
+            file_count += 1
+            total_size += stat.st_size
+    return file_count, total_size, digest.digest()
+
+
+def save_lexicon_snapshot(word_counter, snapshot_path: str, fingerprint: Fingerprint) -> None:
+    """
+    Writes the word counters of a trained WordCounter to snapshot_path.
+    The file is written next to its destination first and then moved into place,
+    so readers never observe a half-written snapshot.
+    """
+    pos_words_count: Dict[str, int] = word_counter.pos_words_count
+    neg_words_count: Dict[str, int] = word_counter.neg_words_count
+    words = sorted(pos_words_count.keys() | neg_words_count.keys())
+    pos_counts = array("I", [pos_words_count.get(word, 0) for word in words])
+    neg_counts = array("I", [neg_words_count.get(word, 0) for word in words])
+    if sys.byteorder == "big":
+        pos_counts.byteswap()
+        neg_counts.byteswap()
+    vocabulary = "\n".join(words).encode("utf-8")
+    ngram_orders, ngram_table_size = _ngram_layout(word_counter.ngrams)
+    ngram_counts = []
+    if word_counter.ngrams is not None:
+        ngram_counts = [word_counter.ngrams.pos_counts, word_counter.ngrams.neg_counts]
+        if sys.byteorder == "big":
+            ngram_counts = [array("I", counts) for counts in ngram_counts]
+            for counts in ngram_counts:
+                counts.byteswap()
+
+    file_count, total_size, digest = fingerprint
+    header = struct.pack(
+        HEADER_FORMAT,
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        file_count,
+        total_size,
+        digest,
+        len(words),
+        len(vocabulary),
+        ngram_orders,
+        ngram_table_size,
+    )
+
+    temporary_path = snapshot_path + ".tmp"
+    with open(temporary_path, "wb") as stream:
+        stream.write(header)
+        stream.write(pos_counts.tobytes())
+        stream.write(neg_counts.tobytes())
+        for counts in ngram_counts:
+            stream.write(counts.tobytes())
+        stream.write(vocabulary)
+    os.replace(temporary_path, snapshot_path)
+
+
+def load_lexicon_snapshot(
+    snapshot_path: str, word_counter, fingerprint: Fingerprint = None
+) -> bool:
+    """
+    Fills the word counters of word_counter from the snapshot at snapshot_path.
+    If a fingerprint is given, the snapshot is only used when it was built from the same corpus.
+    The n-gram counts are filled too; the snapshot is only used when it has the n-gram orders and
+    table size of word_counter, or no n-grams if word_counter does not count them.
+    Returns False, leaving word_counter untouched, when the snapshot is missing, stale or damaged.
+    """
+    try:
+        with open(snapshot_path, "rb") as stream:
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                snapshot = _read_snapshot(mapped, fingerprint, _ngram_layout(word_counter.ngrams))
+    except (OSError, ValueError, struct.error):
+        return False
+    if snapshot is None:
+        return False
+
+    counters, ngram_counts = snapshot
+    if ngram_counts is not None:
+        word_counter.ngrams.pos_counts, word_counter.ngrams.neg_counts = ngram_counts
+    word_counter.vocabulary = counters
+    return True
+
+
+def _ngram_layout(ngrams) -> Tuple[int, int]:
+    """
+    Returns the (orders bit mask, table size) of a HashedNgramCounter as stored in the header,
+    (0, 0) for None.
+    """
+    if ngrams is None:
+        return 0, 0
+    orders = 0
+    for order in ngrams.orders:
+        orders |= 1 << order
+    return orders, ngrams.table_size
+
+
+def _read_snapshot(
+    mapped: mmap.mmap, fingerprint: Fingerprint, ngram_layout: Tuple[int, int] = (0, 0)
+) -> Optional[Tuple[CompactVocabulary, Optional[Tuple[array, array]]]]:
+    """
+    Decodes a memory-mapped snapshot into a CompactVocabulary and the n-gram pos and neg counts
+    (None without n-grams).
+    Returns None if the header does not match the expected format, fingerprint or n-gram layout.
+    """
+    (
+        magic,
+        version,
+        file_count,
+        total_size,
+        digest,
+        vocabulary_size,
+        vocabulary_length,
+        ngram_orders,
+        ngram_table_size,
+    ) = struct.unpack_from(HEADER_FORMAT, mapped, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    if fingerprint is not None and (file_count, total_size, digest) != fingerprint:
+        return None
+    if (ngram_orders, ngram_table_size) != ngram_layout:
+        return None
+
+    counts_length = 4 * vocabulary_size
+    ngram_counts_length = 4 * ngram_table_size
+    vocabulary_start = HEADER_SIZE + 2 * counts_length + 2 * ngram_counts_length
+    if len(mapped) != vocabulary_start + vocabulary_length:
+        return None
+
+    with memoryview(mapped) as view:
+        pos_counts = _read_counts(view[HEADER_SIZE : HEADER_SIZE + counts_length])
+        neg_counts = _read_counts(
+            view[HEADER_SIZE + counts_length : HEADER_SIZE + 2 * counts_length]
+        )
+        ngram_counts = None
+        if ngram_table_size:
+            ngram_start = HEADER_SIZE + 2 * counts_length
+            ngram_counts = (
+                _read_counts(view[ngram_start : ngram_start + ngram_counts_length]),
+                _read_counts(
+                    view[ngram_start + ngram_counts_length : ngram_start + 2 * ngram_counts_length]
+                ),
+            )
+        vocabulary = str(view[vocabulary_start:], "utf-8")
+
+    words: List[str] = vocabulary.split("\n") if vocabulary_size else []
+    if len(words) != vocabulary_size:
+        return None
+
+    return CompactVocabulary(words, pos_counts, neg_counts), ngram_counts
+
+
+def _read_counts(view: memoryview) -> array:
+    """
+    Returns a private, writable copy of the uint32 counters stored in a slice of the mapped snapshot.
+    """
+    counts = array("I")
+    counts.frombytes(view)
+    if sys.byteorder == "big":
+        counts.byteswap()
+    return counts
+
+
+def load_or_train_word_counter(
+    word_counter,
+    pos_path_pattern: str,
+    neg_path_pattern: str,
+    snapshot_path: str,
+    workers: int = 1,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """
+    Loads word_counter from the snapshot at snapshot_path if it matches the current training corpus.
+    Otherwise trains it on the positive and negative reviews, using 'workers' processes, and refreshes the snapshot.
+    A progress callback is called with (files counted, total files) across both classes while training.
+    """
+    fingerprint = corpus_fingerprint(pos_path_pattern, neg_path_pattern)
+    if load_lexicon_snapshot(snapshot_path, word_counter, fingerprint):
+        return
+
+    pos_progress = neg_progress = None
+    if progress is not None:
+        pos_files = len(glob.glob(pos_path_pattern))
+        total_files = fingerprint[0]
+        pos_progress = lambda counted, _: progress(counted, total_files)
+        neg_progress = lambda counted, _: progress(pos_files + counted, total_files)
+
+    word_counter.count_words(
+        pos_path_pattern, is_positive=True, workers=workers, progress=pos_progress
+    )
+    word_counter.count_words(
+        neg_path_pattern, is_positive=False, workers=workers, progress=neg_progress
+    )
+    word_counter.compact()
+    try:
+        save_lexicon_snapshot(word_counter, snapshot_path, fingerprint)
+    except OSError:
+        print("Could not save the lexicon snapshot, the model will be retrained on the next start.")
@@ -2,166 +2,38 @@
 This Python project performs sentiment analysis on movie reviews using a basic bag-of-words approach. It counts the occurrences of positive and negative words in the reviews to determine their sentiment. Reviews can be manually entered or loaded from saved text files. An advanced mode analysis is also possible which can detect negation in the analysed review and inverse sentiments of affected words thus improving the whole review sentiment analysis.
 """
 
-import glob
-import os
-import re
-from typing import List, Tuple, Dict
-
-POS_FILES_FEED: str = r"train\pos\*.txt"
-NEG_FILES_FEED: str = r"train\neg\*.txt"
+import argparse
+from typing import List, Tuple
+
+from background_training import BackgroundTrainer
+from config import (
+    LEXICON_SNAPSHOT_PATH,
+    NEG_FILES_FEED,
+    POS_FILES_FEED,
+    SENTIMENT_SCORER,
+    TRAINING_WORKERS,
+)
+import instrumentation
+from instrumentation import instrumented, stage
+from lexicon_snapshot import load_or_train_word_counter
+from preprocessing import PUNCTUATIONS, remove_punctuations, preprocess_review
+from review_store import open_review_store
+from sentiment_analysis import SCORERS, WordCounter, analyze_review, compute_sentiment, sentiment_verdict
+
+# A directory of ReviewX.txt files, or a .db/.sqlite file for the SQLite review store.
 REVIEW_FILES_PATH: str = r"reviews"
-PUNCTUATIONS: List[str] = [
-    ".",
-    ",",
-    "?",
-    "!",
-    ":",
-    ";",
-    " - ",
-    " '",
-    "' ",
-    '"',
-    "(",
-    ")",
-    "[",
-    "]",
-    "{",
-    "}",
-    "@",
-    "#",
-    "$",
-    "%",
-    "^",
-    "&",
-    "*",
-    "<br />",
-]
-
-
-class WordCounter:
-    """
-    A class to count word occurrences in a set of text files. It maintains separate
-    dictionaries to store word counts for positive and negative reviews, allowing
-    for sentiment analysis based on these counts.
-    """
-
-    def __init__(self):
-        self.pos_words_count: Dict[str, int] = {}
-        self.neg_words_count: Dict[str, int] = {}
-
-    def count_words(self, path_pattern: str, is_positive: bool) -> None:
-        """
-        Calculates the number of times a word has been used in training positive and negative reviews.
-        Updates dictionaries with review words and usage counters.
-        """
-        files = glob.glob(path_pattern)
-        for file in files:
-            with open(file, encoding="utf-8") as stream:
-                content = stream.read()
-            preprocessed_review = remove_punctuations(content).lower().split()
-            for word in set(preprocessed_review):
-                if is_positive:
-                    self.pos_words_count[word] = self.pos_words_count.get(word, 0) + 1
-                else:
-                    self.neg_words_count[word] = self.neg_words_count.get(word, 0) + 1
-
-
-def remove_punctuations(review: str) -> str:
-    """
-    Removes specified punctuations from a given review.
-    """
-    for punctuation in PUNCTUATIONS:
-        review = review.replace(punctuation, " ")
-    return review
-
-
-def preprocess_review(review: str, advanced: bool = False) -> List[str]:
-    """
-    Splits the review into sentences using a regular expression to account for multiple delimiters.
-    Returns a list of lower-case words without punctuations listed in PUNCTUATIONS.
-    If 'advanced' is True, it adds a "not_" prefix to words following negations unless special cases are detected that cancel negations.
-    """
-    sentences = re.split(r"[.!?]", review)
-
-    all_words = []
-
-    for sentence in sentences:
-        sentence = sentence.strip()
-        sentence = remove_punctuations(sentence)
-        words = sentence.lower().split()
-
-        if not advanced:
-            all_words.extend(words)
-            continue
-
-        advanced_words = []
-        negate = False
-
-        for word in words:
-            if (word in ["not", "no", "never", "neither", "nor"] or "n't" in word) or (
-                "far" in word
-                and len(words) > words.index(word) + 1
-                and words[words.index(word) + 1] == "from"
-            ):
-                negate = True
-            elif word == "only" and words[words.index(word) - 1] == "not":
-                negate = False
-            elif negate and word not in ["but", "however", "nevertheless"]:
-                word = "not_" + word
-            else:
-                negate = False
-
-            advanced_words.append(word)
-
-        all_words.extend(advanced_words)
-
-    return all_words
-
-
-def compute_sentiment(
-    review: List[str],
-    word_counter: WordCounter,
-    advanced: bool = False,
-) -> Tuple[float, List[Tuple[str, float]]]:
-    """
-    Compute the sentiment of a review based on positive and negative word counts.
-    """
-    cumulative_sentiment = 0
-    sentiment_details = []
-    for word in review:
-        if advanced and word.startswith("not_"):
-            original_word = word[4:]  # Remove "not_" prefix
-        else:
-            original_word = word
-        pos_counter = word_counter.pos_words_count.get(original_word, 0)
-        neg_counter = word_counter.neg_words_count.get(original_word, 0)
-        total = pos_counter + neg_counter
-        if total == 0:
-            word_sentiment = 0
-        else:
-            if advanced and word.startswith("not_"):
-                word_sentiment = -1 * (pos_counter - neg_counter) / total
-            else:
-                word_sentiment = (pos_counter - neg_counter) / total
-        cumulative_sentiment += word_sentiment
-        sentiment_details.append((word, word_sentiment))
-    average_sentiment = cumulative_sentiment / len(review)
-    return average_sentiment, sentiment_details
+REVIEW_PAGE_SIZE: int = 20
 
 
+@instrumented("output")
 def print_sentiment(sentiment: float) -> None:
-    rounded_sentiment = round(sentiment, 2)
-    if rounded_sentiment > 0:
-        verdict = "positive"
-    elif rounded_sentiment == 0:
-        verdict = "neutral"
-    else:
-        verdict = "negative"
+    verdict = sentiment_verdict(sentiment)
     print("\n------------------------------------------")
     print(f"This review is {verdict}, sentiment = {sentiment:.2f}")
     print("------------------------------------------")
 
 
+@instrumented("output")
 def print_sentiment_details(sentiment_details: List[Tuple[str, float]]) -> None:
     print("\n---------------------------")
     print("Per word sentiment details:")
@@ -171,41 +43,53 @@ def print_sentiment_details(sentiment_details: List[Tuple[str, float]]) -> None:
     print("---------------------------")
 
 
-def list_review_files(review_files_path: str) -> List[str]:
+def list_review_files(
+    review_files_path: str, page_size: int = REVIEW_PAGE_SIZE
+) -> List[str]:
     """
-    Lists the review files available in the provided path along with their first sentences.
+    Lists the review files available in the provided path along with their first sentences,
+    page_size files at a time (all at once if page_size is 0), and returns the listed file names.
+    Pages are fetched from the review store one by one, so only the listed summaries are loaded.
     """
     try:
-        files = [
-            file for file in os.listdir(review_files_path) if file.endswith(".txt")
-        ]
-        if not files:
+        store = open_review_store(review_files_path)
+    except FileNotFoundError:
+
+        print("\nDirectory not found. Please make sure the directory exists.\n")
+        return None
+    except OSError as error:
+        print(f"\n{error}\n")
+        return None
+    try:
+        limit = page_size if page_size > 0 else None
+        with stage("review_list"):
+            page = store.list_review_files(0, limit)
+        if not page:
             print("\nNo review files found.")
             input("\nPress enter to the main menu... ")
             return None
-        sorted_files = sorted(
-            files, key=lambda x: int(x.split("Review")[1].split(".")[0])
-        )
         print("\n--------------------------------------")
         print("Review files found in the directory:")
         print("--------------------------------------")
-        for i, file_name in enumerate(sorted_files, 1):
-            with open(
-                os.path.join(review_files_path, file_name), "r", encoding="utf-8"
-            ) as file:
-                content = file.read()
-                sentences = re.split(r"[.!?]", content)
-                if len(sentences) > 1:
-                    first_sentence = sentences[0] + ("..." if sentences[1] else "")
-                else:
-                    first_sentence = content.strip()
-                print(f"{i}. {file_name} - {first_sentence}")
+        files = []
+        while page:
+            for summary in page:
+                files.append(summary.file_name)
+                print(f"{len(files)}. {summary.file_name} - {summary.first_sentence}")
+            if limit is None or len(page) < limit:
+                break
+            with stage("review_list"):
+                page = store.list_review_files(len(files), limit)
+            if page:
+                more = input(
+                    "\nPress enter to list more review files or type q to stop listing: "
+                )
+                if more.strip().lower() == "q":
+                    break
         print("--------------------------------------")
-        return sorted_files
-    except FileNotFoundError:
-
-        print("\nDirectory not found. Please make sure the directory exists.\n")
-        return None
+        return files
+    finally:
+        store.close()
 
 
 def get_user_choice(files: List[str], prompt: str) -> int:
@@ -247,9 +131,12 @@ def read_review_file(review_files_path: str) -> str:
     if choice is None:
         return None
 
-    chosen_file = os.path.join(review_files_path, files[choice - 1])
-    with open(chosen_file, "r", encoding="utf-8") as stream:
-        review_content = stream.read()
+    store = open_review_store(review_files_path)
+    try:
+        with stage("review_read"):
+            review_content = store.read_review_file(files[choice - 1])
+    finally:
+        store.close()
 
     print("\n--------------------------------------")
     print("Review file content:")
@@ -260,10 +147,12 @@ def read_review_file(review_files_path: str) -> str:
 
 
 def enter_or_read_review_for_analysis(
-    word_counter: WordCounter, is_enter_review: bool
+    trainer: BackgroundTrainer, is_enter_review: bool, scorer: str = SENTIMENT_SCORER
 ) -> None:
     """
     Prompts the user to enter a review for analysis or reads a review file for analysis based on the is_enter_review parameter.
+    The review is obtained first, then the analysis waits for the background training to finish if necessary.
+    The review is scored with the given compute_sentiment scorer, in basic and advanced mode at once.
     """
     if is_enter_review:
         review = input("\nProvide your review: ")
@@ -276,38 +165,36 @@ def enter_or_read_review_for_analysis(
         if not review:
             return
 
+    word_counter = trainer.wait()
+    if word_counter is None:
+        input("\nPress enter to return to the main menu... ")
+        return
+
     advanced_analysis = input(
         "\nDo you want to perform advanced sentiment analysis? [y/n]: "
     )
     advanced = advanced_analysis.lower() == "y"
 
-    preprocessed_review = preprocess_review(review, advanced=advanced)
-
-    sentiment, sentiment_details = compute_sentiment(
-        preprocessed_review, word_counter, advanced=advanced
-    )
+    # Both modes are scored in one pass, so asking for advanced analysis "after all" costs nothing more.
+    analysis = analyze_review(review, word_counter, scorer)
 
-    print_sentiment(sentiment)
+    print_sentiment(analysis.sentiment(advanced))
 
     preference = input("\nAre you interested in per word sentiment details? [y/n]: ")
     if preference.lower() == "y":
-        print_sentiment_details(sentiment_details)
+        print_sentiment_details(analysis.details(advanced))
 
     if not advanced:
         advanced_choice = input(
             "\nDo you want to perform advanced sentiment analysis after all? [y/n]: "
         )
         if advanced_choice.lower() == "y":
-            preprocessed_review = preprocess_review(review, advanced=True)
-            advanced_sentiment, advanced_sentiment_details = compute_sentiment(
-                preprocessed_review, word_counter, True
-            )
-            print_sentiment(advanced_sentiment)
+            print_sentiment(analysis.advanced_sentiment)
             preference = input(
                 "\nAre you interested in per word sentiment details? [y/n]: "
             )
             if preference.lower() == "y":
-                print_sentiment_details(advanced_sentiment_details)
+                print_sentiment_details(analysis.details(advanced=True))
 
     if is_enter_review:
         save_review_choice = input("\nDo you want to save this review? [y/n]: ")
@@ -322,31 +209,39 @@ def get_next_review_file(review_files_path: str) -> str:
     Returns the name of the next available review file (ReviewX.txt) in the REVIEW_FILES_PATH directory, where X is the smallest available integer starting with 1.
     """
     try:
-        files = os.listdir(review_files_path)
-        existing_numbers = [
-            int(file.split("Review")[1].split(".")[0])
-            for file in files
-            if file.startswith("Review")
-        ]
-        next_number = 1
-        while next_number in existing_numbers:
-            next_number += 1
-        return f"Review{next_number}.txt"
+        store = open_review_store(review_files_path)
     except FileNotFoundError:
         print("Directory not found. Please make sure the directory exists.")
         return None
+    except OSError as error:
+        print(error)
+        return None
+    try:
+        with stage("review_next_name"):
+            return store.next_review_file()
+    finally:
+        store.close()
 
 
 def save_review(review: str, review_files_path: str) -> None:
     """
     Saves the provided review in the REVIEW_FILES_PATH location using the ReviewX.txt pattern,
     where X is the smallest available integer starting with 1 if there is no review file yet.
+    The file is created exclusively, so concurrent saves never overwrite each other.
     """
-    next_file = get_next_review_file(review_files_path)
-    with open(
-        os.path.join(review_files_path, next_file), "w", encoding="utf-8"
-    ) as stream:
-        stream.write(review)
+    try:
+        store = open_review_store(review_files_path)
+    except FileNotFoundError:
+        print("Directory not found. Please make sure the directory exists.")
+        return None
+    except OSError as error:
+        print(error)
+        return None
+    try:
+        with stage("review_save"):
+            next_file = store.save_review(review)
+    finally:
+        store.close()
     print("\n--------------------------------------")
     print(f"Review saved to {next_file}.")
     print("--------------------------------------")
@@ -368,8 +263,12 @@ def delete_review_file(review_files_path: str) -> None:
     if choice is None:
         return None
 
-    chosen_file = os.path.join(review_files_path, files[choice - 1])
-    os.remove(chosen_file)
+    store = open_review_store(review_files_path)
+    try:
+        with stage("review_delete"):
+            store.delete_review_file(files[choice - 1])
+    finally:
+        store.close()
 
     print("\n--------------------------------------")
     print(f"Review file '{files[choice - 1]}' has been deleted.")
@@ -377,16 +276,51 @@ def delete_review_file(review_files_path: str) -> None:
     input("\nPress a enter to return to the main menu...")
 
 
-def main() -> None:
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Interactive movie review sentiment analysis.")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        metavar="JSON_PATH",
+        help="time the pipeline stages and print a report when finished, optionally exported as JSON",
+    )
+    parser.add_argument(
+        "--scorer",
+        choices=SCORERS,
+        default=SENTIMENT_SCORER,
+        help=f"scoring model (default: {SENTIMENT_SCORER})",
+    )
+    return parser.parse_args(arguments)
+
 
-    word_counter = WordCounter()
-    word_counter.count_words(POS_FILES_FEED, is_positive=True)
-    word_counter.count_words(NEG_FILES_FEED, is_positive=False)
+def main(arguments: List[str] = None) -> None:
+    options = parse_arguments(arguments)
+    if options.profile is not None:
+        instrumentation.enable()
+    try:
+        _run_menu(options)
+    finally:
+        if options.profile is not None:
+            instrumentation.write_report(options.profile)
+
+
+def _run_menu(options: argparse.Namespace) -> None:
+    trainer = BackgroundTrainer(
+        POS_FILES_FEED,
+        NEG_FILES_FEED,
+        LEXICON_SNAPSHOT_PATH,
+        workers=TRAINING_WORKERS,
+    )
+    trainer.start()
 
     while True:
         print("\n----------")
         print("Main Menu:")
         print("----------")
+        if not trainer.is_ready or trainer.error is not None:
+            print(trainer.status())
+            print("----------")
         print("1. Enter your review for analysis")
         print("2. Read a review file for analysis")
         print("3. Delete a review file")
@@ -396,10 +330,10 @@ def main() -> None:
         choice = input("Enter your choice (1/2/3/4): ")
 
         if choice == "1":
-            enter_or_read_review_for_analysis(word_counter, is_enter_review=True)
+            enter_or_read_review_for_analysis(trainer, is_enter_review=True, scorer=options.scorer)
 
         elif choice == "2":
-            enter_or_read_review_for_analysis(word_counter, is_enter_review=False)
+            enter_or_read_review_for_analysis(trainer, is_enter_review=False, scorer=options.scorer)
 
         elif choice == "3":
             delete_review_file(REVIEW_FILES_PATH)
@@ -1,12 +1,14 @@
 from sentiment_analysis import WordCounter
 from file_operations import delete_review_file
 from review_analysis import enter_or_read_review_for_analysis
+from lexicon_snapshot import load_or_train_word_counter
 
 
 def main():
     word_counter = WordCounter()
-    word_counter.count_words(r"train\pos\*.txt", True)
-    word_counter.count_words(r"train\neg\*.txt", False)
+    load_or_train_word_counter(
+        word_counter, r"train\pos\*.txt", r"train\neg\*.txt", r"train\lexicon.snapshot"
+    )
 
     while True:
         print("\nMain Menu:")
@@ -0,0 +1,18 @@
+"""
+Nearest-rank percentiles of latency samples, shared by the benchmark, the evaluation report,
+the scoring service statistics and the stage instrumentation.
+"""
+
+import math
+from typing import Iterable
+
+
+def percentile(values: Iterable[float], fraction: float) -> float:
+    """
+    Returns the value below which the given fraction of the values lies (nearest rank), 0.0 for no values.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
@@ -1,5 +1,7 @@
 import re
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+from instrumentation import instrumented, stage
 
 PUNCTUATIONS = [
     ".",
@@ -28,44 +30,387 @@ PUNCTUATIONS = [
     "<br />",
 ]
 
+NEGATION_WORDS = ["not", "no", "never", "neither", "nor"]
+NEGATION_SUFFIXES = ["n't"]
+NEGATION_PHRASES = [("far", "from")]
+NEGATION_CANCELLERS = [("not", "only")]
+SCOPE_BREAKERS = ["but", "however", "nevertheless"]
+SENTENCE_DELIMITERS = re.compile(r"[.!?]")
+# Marks sentence boundaries while a whole review goes through remove_punctuations at once.
+# It is not part of any entry of PUNCTUATIONS, so no punctuation can be matched across it.
+SENTENCE_SEPARATOR = "\x00"
+# Characters read at a time by the streaming readers.
+CHUNK_SIZE = 1 << 16
+
+
+@instrumented("remove_punctuations")
 def remove_punctuations(review: str) -> str:
+    """
+    Removes specified punctuations from a given review.
+    """
     for punctuation in PUNCTUATIONS:
         review = review.replace(punctuation, " ")
     return review
 
 
-def preprocess_review(review: str, advanced: bool = False) -> List[str]:
-    sentences = re.split(r"[.!?]", review)
+def tokenize(text: str) -> List[str]:
+    """
+    Returns the lower-case words of a text without punctuations listed in PUNCTUATIONS.
+    This is the tokenizer shared by training and scoring.
+    """
+    return remove_punctuations(text).lower().split()
+
+
+@instrumented("sentence_split")
+def tokenize_sentences(review: str) -> List[List[str]]:
+    """
+    Splits the review into sentences and returns the words of every sentence, as tokenize would.
+    The stripped sentences are joined with SENTENCE_SEPARATOR so that punctuations are removed
+    in one pass over the whole review instead of once per sentence.
+    """
+    sentences = SENTENCE_DELIMITERS.split(review)
+    if SENTENCE_SEPARATOR in review:
+        return [tokenize(sentence.strip()) for sentence in sentences]
+
+    joined = SENTENCE_SEPARATOR.join([sentence.strip() for sentence in sentences])
+    return [
+        sentence.split()
+        for sentence in remove_punctuations(joined).lower().split(SENTENCE_SEPARATOR)
+    ]
+
+
+class NegationCues:
+    """
+    The cue lists that drive negation scoping in advanced mode:
+    - negation_words start a negation, as does any word containing one of negation_suffixes
+    - negation_phrases start a negation at their first word when the whole phrase follows
+    - negation_cancellers are (previous word, word) pairs that end a negation, like "not only"
+    - scope_breakers end a negation, like "but"
+    """
+
+    def __init__(
+        self,
+        negation_words: List[str] = NEGATION_WORDS,
+        negation_suffixes: List[str] = NEGATION_SUFFIXES,
+        negation_phrases: List[Tuple[str, ...]] = NEGATION_PHRASES,
+        negation_cancellers: List[Tuple[str, str]] = NEGATION_CANCELLERS,
+        scope_breakers: List[str] = SCOPE_BREAKERS,
+    ):
+        self.negation_words: Set[str] = set(negation_words)
+        self.negation_suffixes: List[str] = list(negation_suffixes)
+        self.negation_phrases: Dict[str, List[Tuple[str, ...]]] = {}
+        for phrase in negation_phrases:
+            self.negation_phrases.setdefault(phrase[0], []).append(tuple(phrase[1:]))
+        self.negation_cancellers: Dict[str, Set[str]] = {}
+        for previous_word, word in negation_cancellers:
+            self.negation_cancellers.setdefault(word, set()).add(previous_word)
+        self.scope_breakers: Set[str] = set(scope_breakers)
+
+
+DEFAULT_NEGATION_CUES = NegationCues()
+
+
+@instrumented("negation")
+def mark_negations(words: List[str], cues: NegationCues = DEFAULT_NEGATION_CUES) -> List[str]:
+    """
+    Adds a "not_" prefix to the words of one sentence that are in the scope of a negation.
+    Every word is visited once and phrases are matched by position, so the cost is linear in the sentence length.
+    """
+    negation_words = cues.negation_words
+    negation_suffixes = cues.negation_suffixes
+    # The common single-suffix case is checked inline, which is considerably cheaper than any().
+    negation_suffix = negation_suffixes[0] if len(negation_suffixes) == 1 else None
+    negation_phrases = cues.negation_phrases
+    negation_cancellers = cues.negation_cancellers
+    scope_breakers = cues.scope_breakers
+
+    marked_words = []
+    negate = False
+    previous_word = None
+
+    for position, word in enumerate(words):
+        if (
+            word in negation_words
+            or (
+                negation_suffix in word
+                if negation_suffix is not None
+                else any(suffix in word for suffix in negation_suffixes)
+            )
+            or (
+                word in negation_phrases
+                and _starts_negation_phrase(words, position, negation_phrases[word])
+            )
+        ):
+            negate = True
+            marked_words.append(word)
+        elif (
+            negate
+            and word not in scope_breakers
+            and not (
+                word in negation_cancellers
+                and previous_word in negation_cancellers[word]
+            )
+        ):
+            marked_words.append("not_" + word)
+        else:
+            negate = False
+            marked_words.append(word)
+        previous_word = word
+
+    return marked_words
+
+
+def _starts_negation_phrase(
+    words: List[str], position: int, tails: List[Tuple[str, ...]]
+) -> bool:
+    """
+    Checks whether the words after the given position continue one of the negation phrases.
+    """
+    start = position + 1
+    return any(tuple(words[start : start + len(tail)]) == tail for tail in tails)
+
+
+@instrumented("preprocess_review")
+def preprocess_review(
+    review: str, advanced: bool = False, cues: NegationCues = DEFAULT_NEGATION_CUES
+) -> List[str]:
+    """
+    Splits the review into sentences using a regular expression to account for multiple delimiters.
+    Returns a list of lower-case words without punctuations listed in PUNCTUATIONS.
+    If 'advanced' is True, it adds a "not_" prefix to words following negations unless special cases are detected that cancel negations.
+    The negation cue lists can be replaced through 'cues'.
+    """
+    if not advanced:
+        # A newline keeps the words of neighbouring sentences apart without taking part in any punctuation.
+        sentences = SENTENCE_DELIMITERS.split(review)
+        return tokenize("\n".join([sentence.strip() for sentence in sentences]))
+
     all_words = []
+    for words in tokenize_sentences(review):
+        all_words.extend(mark_negations(words, cues))
+    return all_words
+
+
+@instrumented("preprocess_review_both")
+def preprocess_review_both(
+    review: str, cues: NegationCues = DEFAULT_NEGATION_CUES
+) -> Tuple[List[str], List[str]]:
+    """
+    Returns the words of preprocess_review in basic and in advanced mode from one pass:
+    the review is split into sentences and tokenized once, and the advanced words are the
+    basic words of every sentence with the negations marked.
+    """
+    basic_words = []
+    advanced_words = []
+    for words in tokenize_sentences(review):
+        basic_words.extend(words)
+        advanced_words.extend(mark_negations(words, cues))
+    return basic_words, advanced_words
+
+
+class NegationMarker:
+    """
+    mark_negations for a sentence whose words arrive in pieces: feed the pieces in order and
+    call finish at the end of the sentence. The concatenated results equal mark_negations
+    of the whole sentence. A word that may start a negation phrase is held back until enough
+    of the following words have been fed to match the phrase.
+    """
 
-    for sentence in sentences:
-        sentence = sentence.strip()
-        sentence = remove_punctuations(sentence)
-        words = sentence.lower().split()
+    def __init__(self, cues: NegationCues = DEFAULT_NEGATION_CUES):
+        self.cues = cues
+        self.lookahead = max(
+            (len(tail) for tails in cues.negation_phrases.values() for tail in tails), default=0
+        )
+        self.pending: List[str] = []
+        self.negate = False
+        self.previous_word: Optional[str] = None
 
-        if not advanced:
-            all_words.extend(words)
-            continue
+    def feed(self, words: List[str]) -> List[str]:
+        self.pending.extend(words)
+        return self._mark(final=False)
 
-        advanced_words = []
-        negate = False
+    def finish(self) -> List[str]:
+        marked_words = self._mark(final=True)
+        self.negate = False
+        self.previous_word = None
+        return marked_words
 
-        for word in words:
-            if (word in ["not", "no", "never", "neither", "nor"] or "n't" in word) or (
-                "far" in word
-                and len(words) > words.index(word) + 1
-                and words[words.index(word) + 1] == "from"
+    def _mark(self, final: bool) -> List[str]:
+        cues = self.cues
+        negation_words = cues.negation_words
+        negation_suffixes = cues.negation_suffixes
+        negation_suffix = negation_suffixes[0] if len(negation_suffixes) == 1 else None
+        negation_phrases = cues.negation_phrases
+        negation_cancellers = cues.negation_cancellers
+        scope_breakers = cues.scope_breakers
+        pending = self.pending
+        # Phrase heads closer than this to the end of the pending words wait for more words.
+        undecided = len(pending) if final else len(pending) - self.lookahead
+        negate = self.negate
+        previous_word = self.previous_word
+
+        marked_words = []
+        position = 0
+        # The same decisions as mark_negations, word by word.
+        for position, word in enumerate(pending):
+            if word in negation_phrases and position >= undecided:
+                break
+            if (
+                word in negation_words
+                or (
+                    negation_suffix in word
+                    if negation_suffix is not None
+                    else any(suffix in word for suffix in negation_suffixes)
+                )
+                or (
+                    word in negation_phrases
+                    and _starts_negation_phrase(pending, position, negation_phrases[word])
+                )
             ):
                 negate = True
-            elif word == "only" and words[words.index(word) - 1] == "not":
-                negate = False
-            elif negate and word not in ["but", "however", "nevertheless"]:
-                word = "not_" + word
+                marked_words.append(word)
+            elif (
+                negate
+                and word not in scope_breakers
+                and not (
+                    word in negation_cancellers
+                    and previous_word in negation_cancellers[word]
+                )
+            ):
+                marked_words.append("not_" + word)
             else:
                 negate = False
+                marked_words.append(word)
+            previous_word = word
+        else:
+            position = len(pending)
+
+        del pending[:position]
+        self.negate = negate
+        self.previous_word = previous_word
+        return marked_words
+
+
+def _unsafe_cut_characters() -> Set[str]:
+    """
+    The characters a chunk must not start with: those preceded by whitespace inside an entry of
+    PUNCTUATIONS (such as "-" in " - " or "/" in "<br />"), so that no punctuation spans two chunks.
+    """
+    return {
+        punctuation[i]
+        for punctuation in PUNCTUATIONS
+        for i in range(1, len(punctuation))
+        if punctuation[i - 1].isspace() and not punctuation[i].isspace()
+    }
+
+
+def _last_safe_cut(text: str, start: int, unsafe: Set[str]) -> int:
+    """
+    Returns the last position at or after start where text can be cut, 0 if there is none.
+    A cut follows whitespace and precedes a character that is neither whitespace, a sentence
+    delimiter nor one of the unsafe characters, so that words, punctuations and sentence ends
+    are never split and the text before the cut ends with whitespace.
+    """
+    for position in range(len(text) - 1, max(start, 1) - 1, -1):
+        character = text[position]
+        if (
+            text[position - 1].isspace()
+            and not character.isspace()
+            and character not in unsafe
+            and not SENTENCE_DELIMITERS.match(character)
+        ):
+            return position
+    return 0
+
+
+def iter_text_chunks(stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Reads a text stream chunk_size characters at a time and yields it in chunks cut at safe positions
+    (see _last_safe_cut), so that tokenizing every chunk gives the words of the whole text.
+    Only a run of text without a safe cut, such as one giant word, makes a chunk grow beyond chunk_size.
+    """
+    unsafe = None
+    buffer = ""
+    while True:
+        with stage("file_read"):
+            data = stream.read(chunk_size)
+        if len(data) < chunk_size:
+            # A short read is the end of the stream.
+            if buffer or data:
+                yield buffer + data
+            return
+        if unsafe is None:
+            unsafe = _unsafe_cut_characters()
+        searched = len(buffer)
+        buffer += data
+        cut = _last_safe_cut(buffer, searched, unsafe)
+        if cut:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+
+
+def iter_file_tokens(file: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[str]]:
+    """
+    Yields the words of tokenize applied to a file, piece by piece, reading the file in chunks.
+    """
+    with open(file, encoding="utf-8") as stream:
+        for chunk in iter_text_chunks(stream, chunk_size):
+            yield tokenize(chunk)
+
+
+def iter_review_words(
+    chunks: Iterable[str], advanced: bool = False, cues: NegationCues = DEFAULT_NEGATION_CUES
+) -> Iterator[List[str]]:
+    """
+    Yields the words of preprocess_review applied to the concatenated chunks, piece by piece.
+    The chunks must be cut at safe positions, as iter_text_chunks does. Sentences are stripped
+    where they start and end, as preprocess_review strips them, and in advanced mode the negation
+    scope is carried from one chunk to the next by a NegationMarker.
+    """
+    marker = NegationMarker(cues) if advanced else None
+    for words in _iter_sentence_words(chunks):
+        if words is None:
+            if marker is not None:
+                yield marker.finish()
+        else:
+            yield marker.feed(words) if marker is not None else words
+
 
-            advanced_words.append(word)
+def iter_review_words_both(
+    chunks: Iterable[str], cues: NegationCues = DEFAULT_NEGATION_CUES
+) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Yields pieces of the basic and the advanced words of iter_review_words from one pass over
+    the chunks, like preprocess_review_both: every sentence is tokenized once.
+    """
+    marker = NegationMarker(cues)
+    for words in _iter_sentence_words(chunks):
+        if words is None:
+            yield [], marker.finish()
+        else:
+            yield words, marker.feed(words)
 
-        all_words.extend(advanced_words)
 
-    return all_words
\ No newline at end of file
+def _iter_sentence_words(chunks: Iterable[str]) -> Iterator[Optional[List[str]]]:
+    """
+    Yields the tokenized pieces of the sentences of the chunks, and None after every sentence.
+    """
+    at_sentence_start = True
+    chunks = iter(chunks)
+    chunk = next(chunks, None)
+    while chunk is not None:
+        next_chunk = next(chunks, None)
+        sentences = SENTENCE_DELIMITERS.split(chunk)
+        for i, sentence in enumerate(sentences):
+            if i:
+                # The previous sentence ended with a delimiter.
+                yield None
+                at_sentence_start = True
+            if at_sentence_start:
+                sentence = sentence.lstrip()
+                at_sentence_start = not sentence
+            if i < len(sentences) - 1 or next_chunk is None:
+                sentence = sentence.rstrip()
+            yield tokenize(sentence)
+        chunk = next_chunk
+    yield None
@@ -1,6 +1,5 @@
-from sentiment_analysis import WordCounter, compute_sentiment
+from sentiment_analysis import WordCounter, analyze_review
 from file_operations import read_review_file, save_review
-from preprocessing import preprocess_review
 
 
 def enter_or_read_review_for_analysis(word_counter: WordCounter, is_enter_review: bool):
@@ -19,11 +18,10 @@ def enter_or_read_review_for_analysis(word_counter: WordCounter, is_enter_review
     )
     advanced = advanced_analysis.lower() == "y"
 
-    preprocessed_review = preprocess_review(review, advanced=advanced)
-
-    sentiment, sentiment_details = compute_sentiment(
-        preprocessed_review, word_counter, advanced=advanced
-    )
+    # Both modes are scored in one pass, so the advanced analysis "after all" is already done.
+    analysis = analyze_review(review, word_counter)
+    sentiment = analysis.sentiment(advanced)
+    sentiment_details = analysis.details(advanced)
 
     rounded_sentiment = round(sentiment, 2)
     verdict = "positive" if rounded_sentiment > 0 else "neutral" if rounded_sentiment == 0 else "negative"
@@ -37,10 +35,8 @@ def enter_or_read_review_for_analysis(word_counter: WordCounter, is_enter_review
 
     if not advanced:
         if input("\nPerform advanced sentiment analysis after all? [y/n]: ").lower() == "y":
-            preprocessed_review = preprocess_review(review, advanced=True)
-            sentiment, sentiment_details = compute_sentiment(
-                preprocessed_review, word_counter, True
-            )
+            sentiment = analysis.advanced_sentiment
+            sentiment_details = analysis.details(advanced=True)
             rounded_sentiment = round(sentiment, 2)
             verdict = "positive" if rounded_sentiment > 0 else "neutral" if rounded_sentiment == 0 else "negative"
             print(f"\nThis review is {verdict}, sentiment = {sentiment:.2f}")
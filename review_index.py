@@ -0,0 +1,287 @@
+"""
+Sidecar index of the saved review files.
+
+Listing the reviews directory used to open and read every ReviewN.txt just to print its first
+sentence. The index file kept inside the directory caches, per review file, its size, modification
+time and first sentence. Saving and deleting a review update the index directly, and every listing
+heals it: only files whose size or mtime changed since they were indexed are read again, files that
+disappeared are dropped and files added behind the program's back are picked up.
+
+New review numbers come from a ReviewNumberAllocator, which hands out the smallest free number
+without rescanning the directory and creates the file exclusively, so concurrent writers never
+overwrite each other's reviews.
+"""
+
+import heapq
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+INDEX_FILE_NAME: str = ".reviews.index"
+INDEX_VERSION: int = 1
+REVIEW_FILE_PATTERN = re.compile(r"Review(\d+)\.txt")
+SENTENCE_DELIMITERS = re.compile(r"[.!?]")
+READ_CHUNK_SIZE: int = 4096
+
+
+class ReviewIndexEntry(NamedTuple):
+    file_name: str
+    size: int
+    mtime_ns: int
+    first_sentence: str
+
+
+def review_number(file_name: str) -> Optional[int]:
+    """
+    Returns X for a ReviewX.txt file name, or None for any other file.
+    """
+    match = REVIEW_FILE_PATTERN.fullmatch(file_name)
+    return int(match.group(1)) if match else None
+
+
+def first_sentence(content: str) -> str:
+    """
+    Returns the first sentence of a review followed by "..." when more text follows.
+    """
+    sentences = SENTENCE_DELIMITERS.split(content)
+    if len(sentences) > 1:
+        return sentences[0] + ("..." if sentences[1] else "")
+    return content.strip()
+
+
+def read_first_sentence(path: str) -> str:
+    """
+    Returns first_sentence of a review file's content, reading only as much of the file
+    as needed to decide it.
+    """
+    content = ""
+    with open(path, "r", encoding="utf-8") as stream:
+        while True:
+            chunk = stream.read(READ_CHUNK_SIZE)
+            content += chunk
+            delimiter = SENTENCE_DELIMITERS.search(content)
+            # One character past the delimiter tells whether the next sentence is empty.
+            if delimiter and delimiter.end() < len(content):
+                following = content[delimiter.end()]
+                return content[: delimiter.start()] + (
+                    "" if SENTENCE_DELIMITERS.match(following) else "..."
+                )
+            if not chunk:
+                return content[: delimiter.start()] if delimiter else content.strip()
+
+
+def index_path(review_files_path: str) -> str:
+    return os.path.join(review_files_path, INDEX_FILE_NAME)
+
+
+def load_review_index(review_files_path: str) -> Dict[str, ReviewIndexEntry]:
+    """
+    Reads the index of a reviews directory. A missing, unreadable or outdated index is empty.
+    """
+    try:
+        with open(index_path(review_files_path), "r", encoding="utf-8") as stream:
+            data = json.load(stream)
+        if data.get("version") != INDEX_VERSION:
+            return {}
+        return {
+            entry[0]: ReviewIndexEntry(*entry) for entry in data["entries"]
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def save_review_index(review_files_path: str, entries: Dict[str, ReviewIndexEntry]) -> None:
+    """
+    Writes the index atomically, so an interrupted write never leaves a truncated index behind.
+    Concurrent writers each use their own temporary file; the last one to finish wins and
+    anything it missed is picked up by the next refresh.
+    """
+    path = index_path(review_files_path)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as stream:
+        json.dump(
+            {"version": INDEX_VERSION, "entries": [list(entry) for entry in entries.values()]},
+            stream,
+            ensure_ascii=False,
+        )
+    os.replace(temporary_path, path)
+
+
+def index_review_file(review_files_path: str, file_name: str) -> ReviewIndexEntry:
+    path = os.path.join(review_files_path, file_name)
+    stat = os.stat(path)
+    return ReviewIndexEntry(file_name, stat.st_size, stat.st_mtime_ns, read_first_sentence(path))
+
+
+def refresh_review_index(review_files_path: str) -> List[ReviewIndexEntry]:
+    """
+    Brings the index in line with the directory and returns its entries ordered by review number.
+    Raises FileNotFoundError when the directory does not exist.
+    """
+    entries = load_review_index(review_files_path)
+    refreshed = {}
+    changed = False
+    with os.scandir(review_files_path) as directory:
+        for file in directory:
+            if review_number(file.name) is None or not file.is_file():
+                continue
+            stat = file.stat()
+            entry = entries.get(file.name)
+            if entry is None or entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+                entry = ReviewIndexEntry(
+                    file.name,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    read_first_sentence(file.path),
+                )
+                changed = True
+            refreshed[file.name] = entry
+    if changed or len(refreshed) != len(entries):
+        save_review_index(review_files_path, refreshed)
+    return sorted(refreshed.values(), key=lambda entry: review_number(entry.file_name))
+
+
+def add_to_review_index(review_files_path: str, file_name: str) -> None:
+    """
+    Records a newly written or modified review file in the index.
+    """
+    entries = load_review_index(review_files_path)
+    entries[file_name] = index_review_file(review_files_path, file_name)
+    save_review_index(review_files_path, entries)
+
+
+def remove_from_review_index(review_files_path: str, file_name: str) -> None:
+    """
+    Drops a deleted review file from the index.
+    """
+    entries = load_review_index(review_files_path)
+    if entries.pop(file_name, None) is not None:
+        save_review_index(review_files_path, entries)
+
+
+def iter_pages(entries: List[ReviewIndexEntry], page_size: int) -> Iterator[List[ReviewIndexEntry]]:
+    """
+    Yields the entries in pages of page_size, or all of them at once when page_size is not positive.
+    """
+    if page_size <= 0:
+        page_size = max(len(entries), 1)
+    for start in range(0, len(entries), page_size):
+        yield entries[start : start + page_size]
+
+
+class ReviewNumberAllocator:
+    """
+    Allocates ReviewX.txt numbers for one reviews directory.
+    The directory is scanned once; afterwards the free numbers are kept as a heap of gaps below
+    a high-water mark, so allocating and releasing a number costs O(log gaps) instead of a scan.
+    The directory is scanned again when its modification time shows that files were added or
+    deleted by someone else. Files are created with exclusive create: if another process took a
+    number in the meantime, the allocator treats it as used and moves on to the next one.
+    """
+
+    def __init__(self, review_files_path: str):
+        self.review_files_path = review_files_path
+        self.lock = threading.Lock()
+        self._scan()
+
+    def _scan(self) -> None:
+        # The mtime is read first, so that a change during the scan triggers another one.
+        self.mtime = os.stat(self.review_files_path).st_mtime_ns
+        numbers = {review_number(file) for file in os.listdir(self.review_files_path)}
+        numbers.discard(None)
+        self.high_water = max(numbers, default=0)
+        self.gaps = [number for number in range(1, self.high_water) if number not in numbers]
+        self.free = set(self.gaps)
+
+    def _sync(self) -> None:
+        """
+        Scans the directory again if it changed since the last scan or change of this allocator.
+        Must be called with the lock held.
+        """
+        if os.stat(self.review_files_path).st_mtime_ns != self.mtime:
+            self._scan()
+
+    def _changed(self) -> None:
+        """
+        Records the modification time after a file created by this allocator, which needs no scan.
+        Must be called with the lock held.
+        """
+        self.mtime = os.stat(self.review_files_path).st_mtime_ns
+
+    def peek(self) -> int:
+        """
+        Returns the number the next allocation will try first.
+        """
+        with self.lock:
+            self._sync()
+            return self.gaps[0] if self.gaps else self.high_water + 1
+
+    def _take(self) -> int:
+        with self.lock:
+            self._sync()
+            if self.gaps:
+                number = heapq.heappop(self.gaps)
+                self.free.discard(number)
+                return number
+            self.high_water += 1
+            return self.high_water
+
+    def _give_back(self, number: int) -> None:
+        with self.lock:
+            if number <= self.high_water and number not in self.free:
+                heapq.heappush(self.gaps, number)
+                self.free.add(number)
+
+    def create(self, review: str) -> str:
+        """
+        Writes the review to a new ReviewX.txt file and returns its name.
+        If the file cannot be written, its number is given back before the error is raised.
+        """
+        while True:
+            number = self._take()
+            file_name = f"Review{number}.txt"
+            path = os.path.join(self.review_files_path, file_name)
+            try:
+                with open(path, "x", encoding="utf-8") as stream:
+                    stream.write(review)
+            except FileExistsError:
+                continue
+            except BaseException:
+                if os.path.exists(path):
+                    # The file was created but not written: remove it so the number is free again.
+                    os.remove(path)
+                self._give_back(number)
+                raise
+            with self.lock:
+                self._changed()
+            return file_name
+
+    def release(self, file_name: str) -> None:
+        """
+        Makes the number of a deleted review file available again. The deletion changed the
+        directory, which is scanned again: other changes may have happened before it.
+        """
+        number = review_number(file_name)
+        with self.lock:
+            self._sync()
+        if number is not None:
+            self._give_back(number)
+
+
+_allocators: Dict[str, ReviewNumberAllocator] = {}
+_allocators_lock = threading.Lock()
+
+
+def review_number_allocator(review_files_path: str) -> ReviewNumberAllocator:
+    """
+    Returns the process-wide allocator of a reviews directory.
+    Raises FileNotFoundError when the directory does not exist.
+    """
+    key = os.path.abspath(review_files_path)
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = _allocators[key] = ReviewNumberAllocator(review_files_path)
+        return allocator
@@ -0,0 +1,285 @@
+"""
+Storage backends for saved reviews.
+
+A ReviewStore saves, lists, reads and deletes reviews addressed by ReviewX.txt names. Two backends
+are available:
+- DirectoryReviewStore: the original layout, one ReviewX.txt file per review in a directory,
+  listed through the directory's review index.
+- SQLiteReviewStore: all reviews in a single SQLite database, for collections of hundreds of
+  thousands of reviews where one file per review makes listing, deleting and bulk loading slow.
+open_review_store picks the backend from the location: a .db, .sqlite or .sqlite3 path is a
+database, anything else a directory. import_directory and export_directory convert between them.
+"""
+
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from review_index import (
+    ReviewIndexEntry,
+    add_to_review_index,
+    first_sentence,
+    refresh_review_index,
+    remove_from_review_index,
+    review_number,
+    review_number_allocator,
+)
+
+SQLITE_SUFFIXES: Tuple[str, ...] = (".db", ".sqlite", ".sqlite3")
+BULK_INSERT_BATCH_SIZE: int = 10000
+
+
+class ReviewSummary(NamedTuple):
+    file_name: str
+    first_sentence: str
+
+
+class ReviewStore(ABC):
+    """
+    Interface of the review storage backends.
+    """
+
+    @abstractmethod
+    def save_review(self, review: str) -> str:
+        """
+        Stores a review under the next free ReviewX.txt name and returns that name.
+        """
+
+    def save_reviews(self, reviews: Iterable[str]) -> int:
+        """
+        Stores many reviews and returns how many were stored.
+        """
+        saved = 0
+        for review in reviews:
+            self.save_review(review)
+            saved += 1
+        return saved
+
+    @abstractmethod
+    def list_review_files(self, offset: int = 0, limit: Optional[int] = None) -> List[ReviewSummary]:
+        """
+        Returns a page of review summaries ordered by review number.
+        """
+
+    @abstractmethod
+    def read_review_file(self, file_name: str) -> str:
+        """
+        Returns the review stored under file_name. Raises KeyError if there is none.
+        """
+
+    @abstractmethod
+    def delete_review_file(self, file_name: str) -> None:
+        """
+        Deletes the review stored under file_name. Raises KeyError if there is none.
+        """
+
+    @abstractmethod
+    def next_review_file(self) -> str:
+        """
+        Returns the name the next saved review will most likely get.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Returns the number of stored reviews.
+        """
+
+    def iter_reviews(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields (file name, review) pairs ordered by review number.
+        """
+        for summary in self.list_review_files():
+            yield summary.file_name, self.read_review_file(summary.file_name)
+
+    def close(self) -> None:
+        pass
+
+
+class DirectoryReviewStore(ReviewStore):
+    """
+    One ReviewX.txt file per review. Raises FileNotFoundError when the directory does not exist.
+    The directory is scanned once, on the first listing of the store, and later pages are taken
+    from that index: open a new store to see files changed by other programs since.
+    """
+
+    def __init__(self, review_files_path: str):
+        self.review_files_path = review_files_path
+        self.allocator = review_number_allocator(review_files_path)
+        self._entries: Optional[List[ReviewIndexEntry]] = None
+
+    def _index_entries(self) -> List[ReviewIndexEntry]:
+        if self._entries is None:
+            self._entries = refresh_review_index(self.review_files_path)
+        return self._entries
+
+    def save_review(self, review: str) -> str:
+        file_name = self.allocator.create(review)
+        add_to_review_index(self.review_files_path, file_name)
+        self._entries = None
+        return file_name
+
+    def list_review_files(self, offset: int = 0, limit: Optional[int] = None) -> List[ReviewSummary]:
+        entries = self._index_entries()
+        stop = None if limit is None else offset + limit
+        return [
+            ReviewSummary(entry.file_name, entry.first_sentence) for entry in entries[offset:stop]
+        ]
+
+    def read_review_file(self, file_name: str) -> str:
+        try:
+            with open(
+                os.path.join(self.review_files_path, file_name), "r", encoding="utf-8"
+            ) as stream:
+                return stream.read()
+        except FileNotFoundError:
+            raise KeyError(file_name) from None
+
+    def delete_review_file(self, file_name: str) -> None:
+        try:
+            os.remove(os.path.join(self.review_files_path, file_name))
+        except FileNotFoundError:
+            raise KeyError(file_name) from None
+        remove_from_review_index(self.review_files_path, file_name)
+        self.allocator.release(file_name)
+        self._entries = None
+
+    def next_review_file(self) -> str:
+        return f"Review{self.allocator.peek()}.txt"
+
+    def count(self) -> int:
+        return len(self._index_entries())
+
+
+class SQLiteReviewStore(ReviewStore):
+    """
+    All reviews in one SQLite database. The review number is the table's integer primary key,
+    so lookups, deletes and paged listings use the primary key index. The first sentence is
+    stored next to the review so that listing never touches the review texts.
+    New reviews get the highest number plus one, so the number of a deleted review is only
+    given out again when it was the highest one.
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self.connection = sqlite3.connect(database_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS reviews ("
+            "number INTEGER PRIMARY KEY, review TEXT NOT NULL, first_sentence TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def save_review(self, review: str) -> str:
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO reviews (review, first_sentence) VALUES (?, ?)",
+                (review, first_sentence(review)),
+            )
+        return f"Review{cursor.lastrowid}.txt"
+
+    def save_reviews(
+        self, reviews: Iterable[str], batch_size: int = BULK_INSERT_BATCH_SIZE
+    ) -> int:
+        """
+        Inserts the reviews in transactions of batch_size rows.
+        """
+        return self._insert_batches(((None, review) for review in reviews), batch_size)
+
+    def _insert_batches(
+        self, rows: Iterable[Tuple[Optional[int], str]], batch_size: int = BULK_INSERT_BATCH_SIZE
+    ) -> int:
+        rows = iter(rows)
+        saved = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return saved
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO reviews (number, review, first_sentence) VALUES (?, ?, ?)",
+                    [(number, review, first_sentence(review)) for number, review in batch],
+                )
+            saved += len(batch)
+
+    def list_review_files(self, offset: int = 0, limit: Optional[int] = None) -> List[ReviewSummary]:
+        rows = self.connection.execute(
+            "SELECT number, first_sentence FROM reviews ORDER BY number LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        )
+        return [ReviewSummary(f"Review{number}.txt", sentence) for number, sentence in rows]
+
+    def read_review_file(self, file_name: str) -> str:
+        row = self.connection.execute(
+            "SELECT review FROM reviews WHERE number = ?", (review_number(file_name),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(file_name)
+        return row[0]
+
+    def delete_review_file(self, file_name: str) -> None:
+        with self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM reviews WHERE number = ?", (review_number(file_name),)
+            )
+        if cursor.rowcount == 0:
+            raise KeyError(file_name)
+
+    def next_review_file(self) -> str:
+        (highest,) = self.connection.execute("SELECT MAX(number) FROM reviews").fetchone()
+        return f"Review{(highest or 0) + 1}.txt"
+
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+    def iter_reviews(self) -> Iterator[Tuple[str, str]]:
+        rows = self.connection.execute("SELECT number, review FROM reviews ORDER BY number")
+        for number, review in rows:
+            yield f"Review{number}.txt", review
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def open_review_store(location: str) -> ReviewStore:
+    """
+    Opens the SQLite store for a .db, .sqlite or .sqlite3 path and the directory store otherwise.
+    Raises OSError (FileNotFoundError for a missing directory) when the store cannot be opened.
+    """
+    if location.lower().endswith(SQLITE_SUFFIXES):
+        try:
+            return SQLiteReviewStore(location)
+        except sqlite3.Error as error:
+            raise OSError(f"Cannot open the review database {location}: {error}") from error
+    return DirectoryReviewStore(location)
+
+
+def import_directory(store: SQLiteReviewStore, review_files_path: str) -> int:
+    """
+    Copies the ReviewX.txt files of a directory into a SQLite store, keeping their numbers,
+    in bulk transactions. Returns the number of imported reviews.
+    """
+    directory = DirectoryReviewStore(review_files_path)
+
+    def rows() -> Iterator[Tuple[int, str]]:
+        for file_name, review in directory.iter_reviews():
+            yield review_number(file_name), review
+
+    return store._insert_batches(rows())
+
+
+def export_directory(store: ReviewStore, review_files_path: str) -> int:
+    """
+    Writes every review of a store as a ReviewX.txt file into a directory, keeping their numbers.
+    Returns the number of exported reviews.
+    """
+    os.makedirs(review_files_path, exist_ok=True)
+    exported = 0
+    for file_name, review in store.iter_reviews():
+        with open(os.path.join(review_files_path, file_name), "w", encoding="utf-8") as stream:
+            stream.write(review)
+        exported += 1
+    refresh_review_index(review_files_path)
+    return exported
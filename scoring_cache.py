@@ -0,0 +1,288 @@
+"""
+Content-addressed cache of sentiment scores.
+
+Reposted and duplicated reviews are scored once: the basic and advanced sentiments of a review are
+looked up together by the SHA-256 of the model fingerprint, the scorer and the review text.
+Recently used results are kept in an in-memory LRU; an optional SQLite file adds a persistent
+tier shared between runs and processes.
+Retraining the WordCounter changes its fingerprint, which drops the in-memory entries and makes
+the persisted results of the previous model unreachable until they are evicted.
+
+The cache pays off for inputs with many duplicates. It is off by default in batch_scoring.py and
+scoring_service.py (--cache-size 0), because for unique reviews the lookups only add work.
+"""
+
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from preprocessing import preprocess_review, preprocess_review_both
+from sentiment_analysis import POLARITY_SCORER, WordCounter, compute_sentiment, compute_sentiment_batch
+
+MAX_ENTRIES: int = 10000
+MAX_DISK_ENTRIES: int = 1000000
+# New rows written between two evictions of the persistent tier, which count its rows in SQLite.
+EVICTION_INTERVAL: int = 1000
+# Part of every key, so that rows persisted in an older layout are never read back.
+RESULT_FORMAT: int = 3
+
+ScoringResult = Tuple[float, List[Tuple[str, float]]]
+
+
+def model_fingerprint(word_counter: WordCounter) -> bytes:
+    """
+    Returns a digest of the word counter's trained counts, including its n-gram table if it counts
+    n-grams, identical across processes for the same model.
+    """
+    digest = hashlib.sha256()
+    for words_count in (word_counter.pos_words_count, word_counter.neg_words_count):
+        for word in sorted(words_count):
+            digest.update(f"{word}\t{words_count[word]}\n".encode("utf-8"))
+        digest.update(b"\x00")
+    ngrams = word_counter.ngrams
+    if ngrams is not None:
+        digest.update(f"ngrams\t{ngrams.orders}\t{ngrams.table_size}\n".encode("utf-8"))
+        for counts in (ngrams.pos_counts, ngrams.neg_counts):
+            if sys.byteorder == "big":
+                counts = array("I", counts)
+                counts.byteswap()
+            digest.update(counts.tobytes())
+    return digest.digest()
+
+
+class ScoringCache:
+    """
+    Scores reviews like preprocess_review followed by compute_sentiment, reusing earlier results.
+    - max_entries: size of the in-memory LRU (0 disables it)
+    - disk_path: optional SQLite file of the persistent tier
+    - max_disk_entries: size of the persistent tier, least recently used rows are evicted first
+    - scorer: the compute_sentiment scorer, part of the cache key
+    - eviction_interval: new rows written between two evictions of the persistent tier, which
+      may exceed max_disk_entries by that much in between; rows are also evicted on close
+    Only the sentiments are cached, those of both modes in one entry per review.
+    Per-word details are computed when they are asked for.
+    """
+
+    def __init__(
+        self,
+        word_counter: WordCounter,
+        max_entries: int = MAX_ENTRIES,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = MAX_DISK_ENTRIES,
+        scorer: str = POLARITY_SCORER,
+        eviction_interval: int = EVICTION_INTERVAL,
+    ):
+        self.word_counter = word_counter
+        self.scorer = scorer
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries: "OrderedDict[bytes, Tuple[float, float]]" = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.eviction_interval = eviction_interval
+        # Rows of the persistent tier as counted at the last eviction plus the rows written since.
+        self._disk_count = 0
+        self._inserts_since_eviction = 0
+        self._model_version: Optional[int] = None
+        self._fingerprint = b""
+        self.connection: Optional[sqlite3.Connection] = None
+        if disk_path is not None:
+            self.connection = sqlite3.connect(disk_path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key BLOB PRIMARY KEY, result TEXT NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)"
+            )
+            self.connection.commit()
+            self._disk_count = self._count_disk_entries()
+
+    def key(self, review: str) -> bytes:
+        if self._model_version != self.word_counter.version:
+            # The model was retrained (or this is the first lookup): results of the old model are stale.
+            self._fingerprint = model_fingerprint(self.word_counter)
+            self._model_version = self.word_counter.version
+            self.entries.clear()
+        digest = hashlib.sha256(self._fingerprint)
+        digest.update(f"{RESULT_FORMAT}\x00{self.scorer}\x00".encode("ascii"))
+        digest.update(review.encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    def score(self, review: str, advanced: bool = False) -> ScoringResult:
+        """
+        Returns (sentiment, per word details) of a review. An empty review scores 0.0.
+        """
+        return self.score_many([review], advanced, details=True)[0]
+
+    def score_many(
+        self, reviews: List[str], advanced: bool = False, details: bool = False
+    ) -> List[ScoringResult]:
+        """
+        Scores a batch of reviews in one mode, see sentiments_many.
+        The per-word details are only computed if details is True, otherwise they are empty.
+        """
+        sentiments, preprocessed_reviews = self._score_both(reviews)
+        results = []
+        for i, (review, both_sentiments) in enumerate(zip(reviews, sentiments)):
+            sentiment_details: List[Tuple[str, float]] = []
+            if details:
+                if i in preprocessed_reviews:
+                    words = preprocessed_reviews[i][advanced]
+                else:
+                    words = preprocess_review(review, advanced=advanced)
+                if words:
+                    sentiment_details = compute_sentiment(
+                        words, self.word_counter, advanced=advanced, scorer=self.scorer
+                    )[1]
+            results.append((both_sentiments[advanced], sentiment_details))
+        return results
+
+    def sentiments_many(self, reviews: List[str]) -> List[Tuple[float, float]]:
+        """
+        Returns the (basic, advanced) sentiments of a batch of reviews. Both modes are cached in
+        one entry: a review missing from the cache is tokenized once with preprocess_review_both,
+        the misses are scored together with compute_sentiment_batch in both modes, and new
+        persistent entries are committed once for the whole batch.
+        """
+        return self._score_both(reviews)[0]
+
+    def _score_both(
+        self, reviews: List[str]
+    ) -> Tuple[List[Tuple[float, float]], Dict[int, Tuple[List[str], List[str]]]]:
+        """
+        Returns the sentiments of sentiments_many and the words of the reviews that were scored.
+        """
+        keys = [self.key(review) for review in reviews]
+        # A review repeated within the batch is looked up and scored once.
+        first_indexes: Dict[bytes, int] = {}
+        for i, key in enumerate(keys):
+            first_indexes.setdefault(key, i)
+        found = {key: self._lookup(key) for key in first_indexes}
+        preprocessed_reviews: Dict[int, Tuple[List[str], List[str]]] = {
+            first_indexes[key]: preprocess_review_both(reviews[first_indexes[key]])
+            for key, both_sentiments in found.items()
+            if both_sentiments is None
+        }
+        if preprocessed_reviews:
+            basic_sentiments, advanced_sentiments = (
+                compute_sentiment_batch(
+                    [words[advanced] for words in preprocessed_reviews.values()],
+                    self.word_counter,
+                    advanced=advanced,
+                    scorer=self.scorer,
+                )
+                for advanced in (False, True)
+            )
+            for i, basic, advanced in zip(preprocessed_reviews, basic_sentiments, advanced_sentiments):
+                found[keys[i]] = (basic, advanced)
+                self._store(keys[i], (basic, advanced))
+        self._commit()
+        return [found[key] for key in keys], preprocessed_reviews
+
+    def _lookup(self, key: bytes) -> Optional[Tuple[float, float]]:
+        sentiments = self.entries.get(key)
+        if sentiments is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return sentiments
+        if self.connection is not None:
+            row = self.connection.execute("SELECT result FROM scores WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE scores SET last_used = ? WHERE key = ?", (time.time_ns(), key)
+                )
+                basic, advanced = json.loads(row[0])
+                sentiments = (basic, advanced)
+                self._remember(key, sentiments)
+                self.disk_hits += 1
+                return sentiments
+        self.misses += 1
+        return None
+
+    def _store(self, key: bytes, sentiments: Tuple[float, float]) -> None:
+        self._remember(key, sentiments)
+        if self.connection is not None:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO scores (key, result, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(sentiments), time.time_ns()),
+            )
+            self._disk_count += cursor.rowcount
+            self._inserts_since_eviction += cursor.rowcount
+
+    def _commit(self) -> None:
+        """
+        Commits the persistent tier, evicting rows every eviction_interval new rows.
+        """
+        if self.connection is None:
+            return
+        if self._inserts_since_eviction >= self.eviction_interval:
+            self._evict()
+        self.connection.commit()
+
+    def _evict(self) -> None:
+        """
+        Evicts the least recently used rows beyond max_disk_entries. The rows are counted in the
+        database, which other processes may share, and the running count is re-synced with it.
+        """
+        self._disk_count = self._count_disk_entries()
+        self._inserts_since_eviction = 0
+        excess = self._disk_count - self.max_disk_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM scores WHERE key IN "
+                "(SELECT key FROM scores ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+            self._disk_count -= excess
+
+    def _count_disk_entries(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def _remember(self, key: bytes, sentiments: Tuple[float, float]) -> None:
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = sentiments
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            # Rows written by other processes since the last eviction are not included.
+            "disk_entries": self._disk_count,
+        }
+
+    def clear(self) -> None:
+        """
+        Drops every cached result, including the persistent tier.
+        """
+        self.entries.clear()
+        if self.connection is not None:
+            with self.connection:
+                self.connection.execute("DELETE FROM scores")
+            self._disk_count = 0
+            self._inserts_since_eviction = 0
+
+    def close(self) -> None:
+        if self.connection is not None:
+            if self._inserts_since_eviction:
+                self._evict()
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,458 @@
+"""
+Asyncio HTTP scoring service with micro-batching.
+
+The trained WordCounter is loaded once at startup. Concurrent requests are queued and coalesced
+into micro-batches (up to max_batch_size reviews, waiting at most max_wait seconds for a batch
+to fill) that are scored together with compute_sentiment_batch. With a ScoringCache (--cache-size
+or --cache-path), repeated reviews are answered from the cache instead.
+
+Endpoints:
+    POST /score    {"review": "..."} or {"reviews": ["...", ...]}
+                   optional "advanced": true for negation handling, "details": true for per-word details
+    GET  /stats    request and batch counters with latency percentiles
+    GET  /health   liveness check
+
+Run `python scoring_service.py serve` to start the service and
+`python scoring_service.py load-test` to measure it locally.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import (
+    LEXICON_SNAPSHOT_PATH,
+    NEG_FILES_FEED,
+    POS_FILES_FEED,
+    SENTIMENT_SCORER,
+    TRAINING_WORKERS,
+)
+from lexicon_snapshot import load_or_train_word_counter
+from percentiles import percentile
+from preprocessing import preprocess_review
+from scoring_cache import MAX_ENTRIES, ScoringCache
+from sentiment_analysis import (
+    SCORERS,
+    WordCounter,
+    compute_sentiment,
+    compute_sentiment_batch,
+    sentiment_verdict,
+)
+
+DEFAULT_HOST: str = "127.0.0.1"
+DEFAULT_PORT: int = 8080
+MAX_BATCH_SIZE: int = 64
+MAX_WAIT: float = 0.005
+LATENCY_SAMPLES: int = 10000
+MAX_BODY_SIZE: int = 16 * 1024 * 1024
+STATUS_TEXTS: Dict[int, str] = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class MicroBatcher:
+    """
+    Collects reviews submitted by concurrent requests and scores them in batches.
+    """
+
+    def __init__(
+        self,
+        word_counter: WordCounter,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT,
+        cache: Optional[ScoringCache] = None,
+        scorer: str = SENTIMENT_SCORER,
+    ):
+        self.word_counter = word_counter
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = cache
+        self.queue: "asyncio.Queue[Tuple[str, bool, bool, asyncio.Future]]" = asyncio.Queue()
+        self.batches = 0
+        self.batched_reviews = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def score(self, review: str, advanced: bool, details: bool) -> Dict[str, object]:
+        """
+        Queues one review and waits until the batch containing it has been scored.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((review, advanced, details, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                self._score_batch(batch)
+            except Exception as error:
+                # Fail the requests of this batch instead of the batcher, which must keep serving.
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _score_batch(self, batch: List[Tuple[str, bool, bool, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.batched_reviews += len(batch)
+        for advanced in (False, True):
+            items = [item for item in batch if item[1] == advanced]
+            if not items:
+                continue
+            reviews = [review for review, *_ in items]
+            preprocessed_reviews = None
+            if self.cache is not None:
+                sentiments = [sentiment for sentiment, _ in self.cache.score_many(reviews, advanced)]
+            else:
+                preprocessed_reviews = [preprocess_review(review, advanced=advanced) for review in reviews]
+                sentiments = compute_sentiment_batch(
+                    preprocessed_reviews, self.word_counter, advanced=advanced, scorer=self.scorer
+                )
+            for i, ((review, _, details, future), sentiment) in enumerate(zip(items, sentiments)):
+                result: Dict[str, object] = {
+                    "verdict": sentiment_verdict(sentiment),
+                    "sentiment": sentiment,
+                }
+                if details:
+                    # Details are only computed for the requests that ask for them.
+                    words = (
+                        preprocessed_reviews[i]
+                        if preprocessed_reviews is not None
+                        else preprocess_review(review, advanced=advanced)
+                    )
+                    result["details"] = (
+                        compute_sentiment(
+                            words, self.word_counter, advanced=advanced, scorer=self.scorer
+                        )[1]
+                        if words
+                        else []
+                    )
+                if not future.done():
+                    future.set_result(result)
+
+
+class ScoringService:
+    """
+    A minimal HTTP/1.1 server (with keep-alive) in front of a MicroBatcher.
+    """
+
+    def __init__(
+        self,
+        word_counter: WordCounter,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait: float = MAX_WAIT,
+        cache: Optional[ScoringCache] = None,
+        scorer: str = SENTIMENT_SCORER,
+    ):
+        self.batcher = MicroBatcher(word_counter, max_batch_size, max_wait, cache, scorer)
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> int:
+        """
+        Starts listening and returns the bound port (useful with port 0).
+        """
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    def stats(self) -> Dict[str, object]:
+        latencies = list(self.latencies)
+        batches = self.batcher.batches
+        stats = {
+            "requests": self.requests,
+            "batches": batches,
+            "average_batch_size": self.batcher.batched_reviews / batches if batches else 0.0,
+            "latency_ms": {
+                "p50": percentile(latencies, 0.50) * 1000,
+                "p95": percentile(latencies, 0.95) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+            },
+        }
+        if self.batcher.cache is not None:
+            stats["cache"] = self.batcher.cache.stats()
+        return stats
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                if body is None:
+                    # The oversized body was not read, so the connection cannot be reused.
+                    _write_response(writer, 413, {"error": "request body too large"}, False)
+                    await writer.drain()
+                    break
+                start = time.perf_counter()
+                status, payload = await self._route(method, path, body)
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if path == "/score":
+                    self.requests += 1
+                    self.latencies.append(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, self.stats()
+        if path != "/score":
+            return 404, {"error": "unknown path"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            payload = json.loads(body or b"{}")
+            advanced = bool(payload.get("advanced", False))
+            details = bool(payload.get("details", False))
+            if "reviews" in payload:
+                reviews = [str(review) for review in payload["reviews"]]
+            else:
+                reviews = [str(payload["review"])]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": 'expected {"review": "..."} or {"reviews": ["...", ...]}'}
+
+        try:
+            results = await asyncio.gather(
+                *(self.batcher.score(review, advanced, details) for review in reviews)
+            )
+        except Exception as error:
+            return 500, {"error": f"scoring failed: {error}"}
+        if "reviews" in payload:
+            return 200, {"results": results}
+        return 200, results[0]
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Optional[bytes], bool]]:
+    """
+    Reads one HTTP request and returns (method, path, body, keep alive), or None when the client is gone.
+    The body is None, and left unread, if it is larger than MAX_BODY_SIZE.
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    method, path, version = request_line.decode("latin-1").split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = int(headers.get("content-length", 0))
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    if content_length > MAX_BODY_SIZE:
+        return method, path.split("?")[0], None, False
+    body = await reader.readexactly(content_length) if content_length else b""
+    return method, path.split("?")[0], body, keep_alive
+
+
+def _write_response(
+    writer: asyncio.StreamWriter, status: int, payload: object, keep_alive: bool
+) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXTS[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+async def post_json(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, payload: object
+) -> Tuple[int, object]:
+    """
+    Sends one keep-alive JSON POST request over an open connection and returns (status, response).
+    """
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1")
+        + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    response = await reader.readexactly(content_length)
+    return int(status_line.split()[1]), json.loads(response)
+
+
+async def load_test(
+    host: str,
+    port: int,
+    reviews: List[str],
+    concurrency: int = 32,
+    requests: int = 2000,
+) -> Dict[str, float]:
+    """
+    Sends 'requests' single-review requests over 'concurrency' keep-alive connections
+    and returns the throughput and client-side latency percentiles.
+    """
+    latencies: List[float] = []
+    counter = iter(range(requests))
+
+    async def client() -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for number in counter:
+                start = time.perf_counter()
+                await post_json(reader, writer, "/score", {"review": reviews[number % len(reviews)]})
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def load_word_counter(options: argparse.Namespace) -> WordCounter:
+    word_counter = WordCounter()
+    load_or_train_word_counter(
+        word_counter, options.pos, options.neg, options.snapshot, workers=options.workers
+    )
+    return word_counter
+
+
+def create_cache(options: argparse.Namespace, word_counter: WordCounter) -> Optional[ScoringCache]:
+    if options.cache_size <= 0 and options.cache_path is None:
+        return None
+    return ScoringCache(
+        word_counter, options.cache_size, options.cache_path, scorer=options.scorer
+    )
+
+
+def create_service(options: argparse.Namespace) -> ScoringService:
+    word_counter = load_word_counter(options)
+    return ScoringService(
+        word_counter,
+        options.max_batch_size,
+        options.max_wait,
+        create_cache(options, word_counter),
+        options.scorer,
+    )
+
+
+async def serve(options: argparse.Namespace) -> None:
+    service = create_service(options)
+    port = await service.start(options.host, options.port)
+    print(f"Scoring service listening on http://{options.host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+async def run_load_test(options: argparse.Namespace) -> None:
+    """
+    Starts the service in-process on a free port and load-tests it, so nothing external is needed.
+    """
+    service = create_service(options)
+    port = await service.start(DEFAULT_HOST, 0)
+    reviews = [
+        "A great movie with a wonderful cast.",
+        "This was not a good film. The plot was far from original!",
+        "Terrible acting, but the music was fine.",
+    ]
+    try:
+        result = await load_test(DEFAULT_HOST, port, reviews, options.concurrency, options.requests)
+    finally:
+        await service.stop()
+    print(json.dumps({"client": result, "server": service.stats()}, indent=2))
+
+
+def parse_arguments(arguments: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Asyncio HTTP sentiment scoring service.")
+    parser.add_argument("command", choices=["serve", "load-test"])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT, help="seconds to wait for a batch to fill")
+    parser.add_argument("--scorer", choices=SCORERS, default=SENTIMENT_SCORER, help=f"scoring model (default: {SENTIMENT_SCORER})")
+    parser.add_argument("--cache-size", type=int, default=0, help=f"in-memory result cache entries, e.g. {MAX_ENTRIES} (default: 0, disabled)")
+    parser.add_argument("--cache-path", help="SQLite file of a persistent result cache")
+    parser.add_argument("--concurrency", type=int, default=32, help="load-test connections")
+    parser.add_argument("--requests", type=int, default=2000, help="load-test requests")
+    parser.add_argument("--pos", default=POS_FILES_FEED, help="positive training files pattern")
+    parser.add_argument("--neg", default=NEG_FILES_FEED, help="negative training files pattern")
+    parser.add_argument("--snapshot", default=LEXICON_SNAPSHOT_PATH, help="lexicon snapshot path")
+    parser.add_argument("--workers", type=int, default=TRAINING_WORKERS, help="training processes")
+    return parser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> None:
+    options = parse_arguments(arguments)
+    try:
+        asyncio.run(serve(options) if options.command == "serve" else run_load_test(options))
+    except KeyboardInterrupt:
+        print("Stopping scoring service...")
+
+
+if __name__ == "__main__":
+    main()
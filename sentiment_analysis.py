@@ -1,59 +1,953 @@
-from typing import List, Tuple, Dict
-from preprocessing import remove_punctuations
+import math
+from array import array
+from functools import reduce
+from itertools import repeat
+from operator import add
+from typing import TYPE_CHECKING, Callable, List, Tuple, Dict, Iterator, Iterable, Optional, NamedTuple
+from hashed_ngrams import NGRAM_ORDERS, NGRAM_TABLE_SIZE, HashedNgramCounter, NgramWindow
+from instrumentation import instrumented, stage
+from preprocessing import (
+    CHUNK_SIZE,
+    DEFAULT_NEGATION_CUES,
+    NegationCues,
+    iter_file_tokens,
+    iter_review_words,
+    iter_review_words_both,
+    iter_text_chunks,
+    preprocess_review_both,
+    tokenize,
+)
+from vocabulary import CompactVocabulary
+
+if TYPE_CHECKING:
+    from document_matrix import DocumentTermMatrix
+
+SHARDS_PER_WORKER = 4
+
+# Scorers of compute_sentiment and compute_sentiment_batch:
+# - "polarity" averages the (pos - neg) / (pos + neg) polarity of the words
+# - "naive_bayes" sums smoothed log-likelihood ratios of the words (log-odds of a positive review)
+POLARITY_SCORER = "polarity"
+NAIVE_BAYES_SCORER = "naive_bayes"
+SCORERS = (POLARITY_SCORER, NAIVE_BAYES_SCORER)
+# Additive (Laplace) smoothing of the naive Bayes word counts.
+NAIVE_BAYES_SMOOTHING = 1.0
+
+# Called with (files counted so far, files to count) while count_words runs.
+ProgressCallback = Callable[[int, int], None]
+
+
+class ManifestEntry(NamedTuple):
+    """
+    What WordCounter.refresh remembers about a counted file: enough to detect changes cheaply
+    (size, modification time, content hash) and to take the file's contribution back out (words).
+    """
+
+    path_pattern: str
+    is_positive: bool
+    size: int
+    mtime_ns: int
+    content_hash: str
+    words: Tuple[str, ...]
 
 
 class WordCounter:
+    """
+    A class to count word occurrences in a set of text files. It maintains separate
+    dictionaries to store word counts for positive and negative reviews, allowing
+    for sentiment analysis based on these counts.
+    """
+
     def __init__(self):
-        self.pos_words_count: Dict[str, int] = {}
-        self.neg_words_count: Dict[str, int] = {}
+        self._pos_words_count: Dict[str, int] = {}
+        self._neg_words_count: Dict[str, int] = {}
+        self._polarity_table: Optional[Dict[str, float]] = None
+        self._log_odds_table: Optional[Dict[str, float]] = None
+        self._ngram_log_odds: Optional[array] = None
+        self._scoring_indexes: Dict[str, "PolarityIndex"] = {}
+        self._vocabulary: Optional[CompactVocabulary] = None
+        self.manifest: Dict[str, ManifestEntry] = {}
+        self.ngrams: Optional[HashedNgramCounter] = None
+        self.version = 0
+
+    @property
+    def pos_words_count(self) -> Dict[str, int]:
+        return self._pos_words_count
+
+    @pos_words_count.setter
+    def pos_words_count(self, words_count: Dict[str, int]) -> None:
+        self._pos_words_count = words_count
+        self._vocabulary = None
+        self.invalidate_polarity_table()
+
+    @property
+    def neg_words_count(self) -> Dict[str, int]:
+        return self._neg_words_count
+
+    @neg_words_count.setter
+    def neg_words_count(self, words_count: Dict[str, int]) -> None:
+        self._neg_words_count = words_count
+        self._vocabulary = None
+        self.invalidate_polarity_table()
+
+    @property
+    def vocabulary(self) -> Optional[CompactVocabulary]:
+        """
+        The CompactVocabulary behind pos_words_count and neg_words_count, or None while
+        the counters are plain dicts.
+        """
+        return self._vocabulary
+
+    @vocabulary.setter
+    def vocabulary(self, vocabulary: CompactVocabulary) -> None:
+        self._pos_words_count = vocabulary.pos_words_count
+        self._neg_words_count = vocabulary.neg_words_count
+        self._vocabulary = vocabulary
+        self.invalidate_polarity_table()
+
+    def compact(self) -> None:
+        """
+        Moves the counters into a CompactVocabulary, which stores every word once and the counts
+        in integer arrays. pos_words_count and neg_words_count become dict-like views that still
+        accept updates, only more slowly than dicts, so compact after training.
+        """
+        if self._vocabulary is None:
+            self.vocabulary = CompactVocabulary.from_counts(
+                self._pos_words_count, self._neg_words_count
+            )
+
+    def enable_ngrams(
+        self, orders: Iterable[int] = NGRAM_ORDERS, table_size: int = NGRAM_TABLE_SIZE
+    ) -> None:
+        """
+        Also counts the n-grams of the given orders (bigrams and trigrams by default) into a
+        HashedNgramCounter of table_size buckets, and scores them in compute_sentiment.
+        Enable before training: documents counted earlier contribute no n-grams.
+        """
+        self.ngrams = HashedNgramCounter(orders, table_size)
+        self.invalidate_polarity_table()
 
-    def count_words(self, path_pattern: str, is_positive: bool) -> None:
+    @property
+    def polarity_table(self) -> Dict[str, float]:
+        """
+        The finalized (pos - neg) / (pos + neg) polarity of every trained word.
+        Built on first use after training and rebuilt after the counters change.
+        """
+        if self._polarity_table is None:
+            if self._vocabulary is not None:
+                self._polarity_table = self._vocabulary.polarity_table()
+            else:
+                self._polarity_table = build_polarity_table(
+                    self._pos_words_count, self._neg_words_count
+                )
+        return self._polarity_table
+
+    @property
+    def log_odds_table(self) -> Dict[str, float]:
+        """
+        The naive Bayes weight of every trained word, see build_log_odds_table.
+        Built on first use after training and rebuilt after the counters change, like polarity_table.
+        """
+        if self._log_odds_table is None:
+            self._log_odds_table = build_log_odds_table(
+                self._pos_words_count, self._neg_words_count
+            )
+        return self._log_odds_table
+
+    @property
+    def ngram_log_odds(self) -> Optional[array]:
+        """
+        The naive Bayes weight of every bucket of the hashed n-gram table, or None without n-grams.
+        """
+        if self.ngrams is not None and self._ngram_log_odds is None:
+            self._ngram_log_odds = self.ngrams.log_odds_weights(NAIVE_BAYES_SMOOTHING)
+        return self._ngram_log_odds
+
+    @property
+    def polarity_index(self) -> "PolarityIndex":
+        """
+        The PolarityIndex used for batch scoring, built on first use like polarity_table.
+        """
+        return self.scoring_index(POLARITY_SCORER)
+
+    def scoring_index(self, scorer: str) -> "PolarityIndex":
+        """
+        The PolarityIndex holding the word weights of a scorer, built on first use.
+        """
+        if scorer not in self._scoring_indexes:
+            self._scoring_indexes[scorer] = PolarityIndex(self, scorer)
+        return self._scoring_indexes[scorer]
+
+    def invalidate_polarity_table(self) -> None:
+        """
+        Drops the derived scoring structures so they are rebuilt from the current counters.
+        count_words and assigning new counters call it automatically; call it yourself
+        after modifying pos_words_count or neg_words_count in place.
+        """
+        self._polarity_table = None
+        self._log_odds_table = None
+        self._ngram_log_odds = None
+        self._scoring_indexes = {}
+        self.version += 1
+
+    @instrumented("count_words")
+    def count_words(
+        self,
+        path_pattern: str,
+        is_positive: bool,
+        workers: int = 1,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        """
+        Calculates the number of times a word has been used in training positive and negative reviews.
+        Updates dictionaries with review words and usage counters.
+        If 'workers' is greater than 1, the files are split into shards which are counted in
+        separate worker processes and merged afterwards. The result is identical to the serial count.
+        If a progress callback is given, it is called with the number of files counted so far and
+        the total after every file (every shard when counting in parallel).
+        Files are read in chunks of CHUNK_SIZE characters, so large files are never held in memory whole.
+        """
         import glob
-        
+
         files = glob.glob(path_pattern)
-        for file in files:
+        words_count = self.pos_words_count if is_positive else self.neg_words_count
+
+        if workers > 1 and len(files) > 1:
+            counted = 0
+            for shard_size, (shard_count, shard_ngrams) in _count_shards_in_parallel(
+                files, workers, is_positive, self.ngrams
+            ):
+                for word, count in shard_count.items():
+                    words_count[word] = words_count.get(word, 0) + count
+                if shard_ngrams is not None:
+                    self.ngrams.add_bucket_counts(shard_ngrams, is_positive)
+                counted += shard_size
+                if progress is not None:
+                    progress(counted, len(files))
+        else:
+            documents = map(iter_file_tokens, files)
+            if progress is not None:
+                documents = _report_progress(documents, progress, len(files))
+            _count_document_words(words_count, documents, self.ngrams, is_positive)
+        self.invalidate_polarity_table()
+
+    def refresh(self, path_pattern: str, is_positive: bool) -> Dict[str, int]:
+        """
+        Incrementally brings the counters up to date with the files matching path_pattern.
+        Only new files are read and counted; files whose size or modification time changed are
+        re-read and recounted if their content hash changed; files that disappeared have their
+        contribution subtracted. The counters stay identical to a full rebuild.
+        Every file counted by refresh is recorded in the manifest, so a counter should be trained
+        through refresh from the start (or restored together with its manifest by load_manifest).
+        Returns how many files were added, modified, removed and left unchanged.
+        """
+        import glob
+        import hashlib
+        import os
+
+        if self.ngrams is not None:
+            raise ValueError(
+                "refresh() cannot take n-grams back out of a hashed n-gram table; "
+                "retrain the counter with count_words() instead"
+            )
+        if not self.manifest and (self.pos_words_count or self.neg_words_count):
+            raise ValueError(
+                "refresh() needs a manifest of the counted files; train this counter with refresh() "
+                "or restore its manifest with load_manifest() first"
+            )
+
+        summary = {"added": 0, "modified": 0, "removed": 0, "unchanged": 0}
+        files = set(glob.glob(path_pattern))
+
+        for file, entry in list(self.manifest.items()):
+            if entry.path_pattern == path_pattern and file not in files:
+                self._remove_manifest_entry(file)
+                summary["removed"] += 1
+
+        for file in sorted(files):
+            stat = os.stat(file)
+            entry = self.manifest.get(file)
+            if (
+                entry is not None
+                and entry.is_positive == is_positive
+                and entry.size == stat.st_size
+                and entry.mtime_ns == stat.st_mtime_ns
+            ):
+                summary["unchanged"] += 1
+                continue
+
+            with open(file, "rb") as stream:
+                data = stream.read()
+            content_hash = hashlib.sha1(data).hexdigest()
+            if entry is not None and entry.is_positive == is_positive and entry.content_hash == content_hash:
+                self.manifest[file] = entry._replace(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                summary["unchanged"] += 1
+                continue
+
+            if entry is not None:
+                self._remove_manifest_entry(file)
+                summary["modified"] += 1
+            else:
+                summary["added"] += 1
+
+            words = tuple(set(tokenize(data.decode("utf-8"))))
+            words_count = self.pos_words_count if is_positive else self.neg_words_count
+            for word in words:
+                words_count[word] = words_count.get(word, 0) + 1
+            self.manifest[file] = ManifestEntry(
+                path_pattern, is_positive, stat.st_size, stat.st_mtime_ns, content_hash, words
+            )
+
+        if summary["added"] or summary["modified"] or summary["removed"]:
+            self.invalidate_polarity_table()
+        return summary
+
+    def _remove_manifest_entry(self, file: str) -> None:
+        """
+        Subtracts the contribution of a counted file and forgets it.
+        """
+        entry = self.manifest.pop(file)
+        words_count = self.pos_words_count if entry.is_positive else self.neg_words_count
+        for word in entry.words:
+            count = words_count[word] - 1
+            if count:
+                words_count[word] = count
+            else:
+                del words_count[word]
+
+    def save_manifest(self, manifest_path: str) -> None:
+        """
+        Saves the manifest as JSON so that refresh can continue in another process,
+        for example after the counters were restored from a lexicon snapshot.
+        """
+        import json
+
+        with open(manifest_path, "w", encoding="utf-8") as stream:
+            json.dump({file: entry._asdict() for file, entry in self.manifest.items()}, stream)
+
+    def load_manifest(self, manifest_path: str) -> None:
+        """
+        Restores a manifest saved by save_manifest. The counters must match it.
+        """
+        import json
+
+        with open(manifest_path, encoding="utf-8") as stream:
+            manifest = json.load(stream)
+        self.manifest = {
+            file: ManifestEntry(**dict(entry, words=tuple(entry["words"])))
+            for file, entry in manifest.items()
+        }
+
+    def count_documents(self, documents: Iterable[Tuple[bool, str]]) -> None:
+        """
+        Counts labeled reviews given as (is_positive, text) pairs, for example the documents streamed
+        from a corpus archive by corpus_reader.iter_archive_documents. Documents are consumed one at a time.
+        """
+        for is_positive, content in documents:
+            words_count = self.pos_words_count if is_positive else self.neg_words_count
+            _update_document_frequencies(words_count, (content,), self.ngrams, is_positive)
+        self.invalidate_polarity_table()
+
+    def count_pack(self, pack_path: str, documents: Optional[Iterable[int]] = None) -> None:
+        """
+        Counts the reviews of a corpus_pack pack (all of them, or the given document numbers),
+        reading them from the one memory-mapped data file instead of a file per review.
+        """
+        from corpus_pack import CorpusPack
+
+        with CorpusPack(pack_path) as pack:
+            self.count_documents(pack.iter_documents(documents))
+
+    def count_document_matrix(
+        self, matrix: "DocumentTermMatrix", documents: Optional[Iterable[int]] = None
+    ) -> None:
+        """
+        Counts the documents of a compiled document_matrix.DocumentTermMatrix (all of them, or the
+        given row numbers) from its column sums, without reading the corpus files again.
+        The counters are identical to counting the same files with count_words.
+        The matrix holds no n-grams, so a counter that counts them cannot be trained from it.
+        """
+        if self.ngrams is not None:
+            raise ValueError(
+                "count_document_matrix() cannot count n-grams, the matrix only holds words; "
+                "retrain the counter with count_words() instead"
+            )
+        if documents is not None:
+            documents = list(documents)
+        for is_positive in (True, False):
+            words_count = self.pos_words_count if is_positive else self.neg_words_count
+            frequencies = matrix.document_frequencies(is_positive, documents)
+            for word, count in zip(matrix.words, frequencies):
+                if count:
+                    words_count[word] = words_count.get(word, 0) + count
+        self.invalidate_polarity_table()
+
+    def count_archive(self, archive_path: str, split: str = "train") -> None:
+        """
+        Counts the labeled reviews of a split directly from a tar, tar.gz or zip archive of the corpus.
+        """
+        from corpus_reader import iter_archive_documents
+
+        self.count_documents(iter_archive_documents(archive_path, split))
+
+
+def build_polarity_table(
+    pos_words_count: Dict[str, int], neg_words_count: Dict[str, int]
+) -> Dict[str, float]:
+    """
+    Returns the (pos - neg) / (pos + neg) polarity of every word with a non-zero total count.
+    """
+    polarity_table: Dict[str, float] = {}
+    for word in pos_words_count.keys() | neg_words_count.keys():
+        pos_counter = pos_words_count.get(word, 0)
+        neg_counter = neg_words_count.get(word, 0)
+        total = pos_counter + neg_counter
+        if total:
+            polarity_table[word] = (pos_counter - neg_counter) / total
+    return polarity_table
+
+
+def build_log_odds_table(
+    pos_words_count: Dict[str, int],
+    neg_words_count: Dict[str, int],
+    smoothing: float = NAIVE_BAYES_SMOOTHING,
+) -> Dict[str, float]:
+    """
+    Returns the naive Bayes weight log(P(word | positive) / P(word | negative)) of every word with
+    a non-zero total count. The probabilities are the word's document frequency in each class with
+    additive smoothing, divided by the smoothed total of the class over the whole vocabulary.
+    """
+    words = pos_words_count.keys() | neg_words_count.keys()
+    if not words:
+        return {}
+    pos_total = sum(pos_words_count.values()) + smoothing * len(words)
+    neg_total = sum(neg_words_count.values()) + smoothing * len(words)
+    log_prior_ratio = math.log(neg_total / pos_total)
+    log_odds_table: Dict[str, float] = {}
+    for word in words:
+        pos_counter = pos_words_count.get(word, 0)
+        neg_counter = neg_words_count.get(word, 0)
+        if pos_counter or neg_counter:
+            log_odds_table[word] = (
+                math.log((pos_counter + smoothing) / (neg_counter + smoothing)) + log_prior_ratio
+            )
+    return log_odds_table
+
+
+def count_document_frequencies(files: List[str]) -> Dict[str, int]:
+    """
+    Returns the number of files in which each word occurs.
+    """
+    words_count: Dict[str, int] = {}
+    _count_document_words(words_count, map(iter_file_tokens, files))
+    return words_count
+
+
+def _count_shard(
+    files: List[str], is_positive: bool, ngram_layout: Optional[Tuple[Tuple[int, ...], int]]
+) -> Tuple[Dict[str, int], Optional[Dict[int, int]]]:
+    """
+    Returns the document frequencies of the words of a shard of files and, if an n-gram layout
+    (orders, table size) is given, the counts of the n-gram buckets touched by the shard.
+    This is the unit of work executed by every worker process during parallel training.
+    """
+    if ngram_layout is None:
+        return count_document_frequencies(files), None
+    shard_ngrams = HashedNgramCounter(*ngram_layout)
+    words_count: Dict[str, int] = {}
+    _count_document_words(words_count, map(iter_file_tokens, files), shard_ngrams, is_positive)
+    return words_count, shard_ngrams.bucket_counts(is_positive)
+
+
+def read_files(files: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the content of the files one by one.
+    """
+    for file in files:
+        with stage("file_read"):
             with open(file, encoding="utf-8") as stream:
                 content = stream.read()
-            preprocessed_review = remove_punctuations(content).lower().split()
-            for word in set(preprocessed_review):
-                if is_positive:
-                    self.pos_words_count[word] = (
-                        self.pos_words_count.get(word, 0) + 1
-                    )
-                else:
-                    self.neg_words_count[word] = (
-                        self.neg_words_count.get(word, 0) + 1
-                    )
+        yield content
+
+
+def _report_progress(
+    documents: Iterable[Iterable[List[str]]], progress: ProgressCallback, total: int
+) -> Iterator[Iterable[List[str]]]:
+    """
+    Passes the documents through, reporting every finished document to the progress callback.
+    """
+    for counted, document in enumerate(documents):
+        yield document
+        progress(counted + 1, total)
+
 
+def _update_document_frequencies(
+    words_count: Dict[str, int],
+    contents: Iterable[str],
+    ngrams: Optional[HashedNgramCounter] = None,
+    is_positive: bool = True,
+) -> None:
+    """
+    Adds one to the counter of every distinct word of every document,
+    and to the n-gram buckets of every document if an n-gram counter is given.
+    """
+    for content in contents:
+        words = tokenize(content)
+        for word in set(words):
+            words_count[word] = words_count.get(word, 0) + 1
+        if ngrams is not None:
+            ngrams.count_document(words, is_positive)
 
+
+def _count_document_words(
+    words_count: Dict[str, int],
+    documents: Iterable[Iterable[List[str]]],
+    ngrams: Optional[HashedNgramCounter] = None,
+    is_positive: bool = True,
+) -> None:
+    """
+    Like _update_document_frequencies for documents given as their tokenized words in pieces,
+    such as the pieces of iter_file_tokens. A document is consumed as its pieces arrive.
+    """
+    for pieces in documents:
+        distinct_words = set()
+        buckets = set()
+        window = NgramWindow(ngrams.orders) if ngrams is not None else None
+        for words in pieces:
+            distinct_words.update(words)
+            if window is not None:
+                buckets.update(map(ngrams.bucket, window.push(words)))
+        for word in distinct_words:
+            words_count[word] = words_count.get(word, 0) + 1
+        if ngrams is not None:
+            ngrams.count_buckets(buckets, is_positive)
+
+
+def _count_shards_in_parallel(
+    files: List[str],
+    workers: int,
+    is_positive: bool = True,
+    ngrams: Optional[HashedNgramCounter] = None,
+) -> Iterator[Tuple[int, Tuple[Dict[str, int], Optional[Dict[int, int]]]]]:
+    """
+    Splits the files into shards and counts them in a pool of worker processes.
+    Several shards are handed to every worker so that uneven file sizes balance out.
+    Yields the number of files and the result of _count_shard for every shard, in shard order.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    shard_size = max(1, -(-len(files) // (workers * SHARDS_PER_WORKER)))
+    shards = [files[i : i + shard_size] for i in range(0, len(files), shard_size)]
+    # Workers get the layout of the n-gram table rather than the table itself.
+    ngram_layout = (ngrams.orders, ngrams.table_size) if ngrams is not None else None
+    # Workers are spawned rather than forked: training may run in a thread of a program with
+    # other threads, such as the BackgroundTrainer of the interactive menu.
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        yield from zip(
+            map(len, shards),
+            executor.map(_count_shard, shards, repeat(is_positive), repeat(ngram_layout)),
+        )
+
+
+@instrumented("polarity_lookup")
 def compute_sentiment(
     review: List[str],
     word_counter: WordCounter,
     advanced: bool = False,
+    scorer: str = POLARITY_SCORER,
 ) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Compute the sentiment of a review based on positive and negative word counts.
+    With the default "polarity" scorer the sentiment is the average polarity of the words;
+    with the "naive_bayes" scorer it is the sum of their log_odds_table weights, and an empty
+    review scores 0.0. In advanced mode a "not_" prefixed word has the negated weight of the word.
+    If the word counter counts n-grams, every n-gram of the review seen in training is scored
+    as one more feature after the words; in advanced mode the n-grams are formed from the words
+    without their "not_" prefix, as they were in training.
+    Sums that do not follow the word order (the n-gram scores, the naive Bayes weights) are
+    computed with math.fsum, which SentimentAccumulator reproduces exactly.
+    """
+    if scorer == NAIVE_BAYES_SCORER:
+        return _compute_log_odds(review, word_counter, advanced)
+    if scorer != POLARITY_SCORER:
+        raise ValueError(f"unknown scorer {scorer!r}, expected one of {SCORERS}")
+
     cumulative_sentiment = 0
     sentiment_details = []
+    polarity_table = word_counter.polarity_table
 
     for word in review:
         if advanced and word.startswith("not_"):
-            original_word = word[4:]
+            word_sentiment = -polarity_table.get(word[4:], 0)
         else:
-            original_word = word
+            word_sentiment = polarity_table.get(word, 0)
+
+        cumulative_sentiment += word_sentiment
+        sentiment_details.append((word, word_sentiment))
 
-        pos_counter = word_counter.pos_words_count.get(original_word, 0)
-        neg_counter = word_counter.neg_words_count.get(original_word, 0)
+    if word_counter.ngrams is not None:
+        words = [word[4:] if word.startswith("not_") else word for word in review] if advanced else review
+        ngram_details = word_counter.ngrams.features(words)
+        cumulative_sentiment += math.fsum(ngram_sentiment for _, ngram_sentiment in ngram_details)
+        sentiment_details.extend(ngram_details)
 
-        total = pos_counter + neg_counter
-        if total == 0:
-            word_sentiment = 0
+    average_sentiment = cumulative_sentiment / len(sentiment_details)
+    return average_sentiment, sentiment_details
+
+
+def _compute_log_odds(
+    review: List[str], word_counter: WordCounter, advanced: bool
+) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    The "naive_bayes" scorer of compute_sentiment.
+    """
+    index = word_counter.scoring_index(NAIVE_BAYES_SCORER)
+    weights = index.advanced_weights if advanced else index.weights
+    word_weights = list(map(weights.get, review, repeat(0.0)))
+    sentiment_details = list(zip(review, word_weights))
+
+    if word_counter.ngrams is not None:
+        words = [word[4:] if word.startswith("not_") else word for word in review] if advanced else review
+        ngram_details = word_counter.ngrams.features(words, word_counter.ngram_log_odds)
+        word_weights.extend(weight for _, weight in ngram_details)
+        sentiment_details.extend(ngram_details)
+
+    return math.fsum(word_weights), sentiment_details
+
+
+class SentimentAccumulator:
+    """
+    compute_sentiment for a review whose preprocessed words arrive in pieces, such as the pieces
+    of preprocessing.iter_review_words: add the pieces in order, then read the sentiment.
+    The result is identical to compute_sentiment of the whole word list, but only a few numbers
+    are kept instead of the per-word details. The math.fsum sums of compute_sentiment are kept
+    as a short list of partial sums whose math.fsum is the same correctly rounded value.
+    """
+
+    def __init__(self, word_counter: WordCounter, advanced: bool = False, scorer: str = POLARITY_SCORER):
+        if scorer not in SCORERS:
+            raise ValueError(f"unknown scorer {scorer!r}, expected one of {SCORERS}")
+        self.advanced = advanced
+        self.naive_bayes = scorer == NAIVE_BAYES_SCORER
+        if self.naive_bayes:
+            index = word_counter.scoring_index(NAIVE_BAYES_SCORER)
+            self.weights = index.advanced_weights if advanced else index.weights
         else:
-            if advanced and word.startswith("not_"):
-                word_sentiment = -1 * (pos_counter - neg_counter) / total
-            else:
-                word_sentiment = (pos_counter - neg_counter) / total
+            self.polarity_table = word_counter.polarity_table
+        self.ngrams = word_counter.ngrams
+        self.ngram_weights = word_counter.ngram_log_odds if self.naive_bayes else None
+        self.window = NgramWindow(self.ngrams.orders) if self.ngrams is not None else None
+        self.cumulative_sentiment = 0
+        self.partial_sums: List[float] = []
+        self.features = 0
 
-        cumulative_sentiment += word_sentiment
-        sentiment_details.append((word, word_sentiment))
+    def add(self, words: List[str]) -> None:
+        if self.naive_bayes:
+            values = list(map(self.weights.get, words, repeat(0.0)))
+        else:
+            values = []
+            polarity_table = self.polarity_table
+            advanced = self.advanced
+            cumulative_sentiment = self.cumulative_sentiment
+            for word in words:
+                if advanced and word.startswith("not_"):
+                    cumulative_sentiment += -polarity_table.get(word[4:], 0)
+                else:
+                    cumulative_sentiment += polarity_table.get(word, 0)
+            self.cumulative_sentiment = cumulative_sentiment
+        self.features += len(words)
+
+        if self.window is not None:
+            if self.advanced:
+                words = [word[4:] if word.startswith("not_") else word for word in words]
+            for ngram in self.window.push(words):
+                score = self.ngrams.score(ngram, self.ngram_weights)
+                if score is not None:
+                    values.append(score)
+                    self.features += 1
+        if values:
+            self.partial_sums = _exact_partial_sums(self.partial_sums + values)
+
+    @property
+    def sentiment(self) -> float:
+        """
+        The sentiment of the words added so far, 0.0 if there are none.
+        """
+        if self.naive_bayes:
+            return math.fsum(self.partial_sums)
+        if not self.features:
+            return 0.0
+        cumulative_sentiment = self.cumulative_sentiment
+        if self.ngrams is not None:
+            cumulative_sentiment += math.fsum(self.partial_sums)
+        return cumulative_sentiment / self.features
+
+
+def _exact_partial_sums(values: List[float]) -> List[float]:
+    """
+    Returns a few floats whose exact sum is the exact sum of values, so that their math.fsum equals
+    math.fsum(values). Every partial sum is the correctly rounded remainder of the previous ones.
+    """
+    partial_sums: List[float] = []
+    while True:
+        remainder = math.fsum(values + [-partial_sum for partial_sum in partial_sums])
+        if not remainder:
+            return partial_sums
+        partial_sums.append(remainder)
+
+
+def compute_file_sentiment(
+    file: str,
+    word_counter: WordCounter,
+    advanced: bool = False,
+    scorer: str = POLARITY_SCORER,
+    cues: NegationCues = DEFAULT_NEGATION_CUES,
+    chunk_size: int = CHUNK_SIZE,
+) -> float:
+    """
+    Returns the sentiment of the review in a file, reading it chunk_size characters at a time.
+    Memory use does not depend on the size of the file. The result is identical to
+    compute_sentiment(preprocess_review(content, advanced, cues), word_counter, advanced, scorer)[0]
+    for the whole content, except that a review without words scores 0.0.
+    """
+    accumulator = SentimentAccumulator(word_counter, advanced, scorer)
+    with open(file, encoding="utf-8") as stream:
+        for words in iter_review_words(iter_text_chunks(stream, chunk_size), advanced, cues):
+            accumulator.add(words)
+    return accumulator.sentiment
+
+
+def compute_file_sentiment_both(
+    file: str,
+    word_counter: WordCounter,
+    scorer: str = POLARITY_SCORER,
+    cues: NegationCues = DEFAULT_NEGATION_CUES,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[float, float]:
+    """
+    Returns the basic and advanced compute_file_sentiment of a file from one pass over it:
+    the file is read and tokenized once, as preprocess_review_both does for a review in memory.
+    """
+    basic = SentimentAccumulator(word_counter, False, scorer)
+    advanced = SentimentAccumulator(word_counter, True, scorer)
+    with open(file, encoding="utf-8") as stream:
+        for words, advanced_words in iter_review_words_both(iter_text_chunks(stream, chunk_size), cues):
+            basic.add(words)
+            advanced.add(advanced_words)
+    return basic.sentiment, advanced.sentiment
+
+
+class ReviewAnalysis:
+    """
+    The basic and advanced sentiment of one review, computed together by analyze_review.
+    The per-word details of a mode are only assembled when details is called.
+    """
+
+    def __init__(
+        self,
+        words: List[str],
+        advanced_words: List[str],
+        word_sentiments: Tuple[List[float], List[float]],
+        ngram_details: Tuple[List[Tuple[str, float]], List[Tuple[str, float]]],
+        sentiments: Tuple[float, float],
+    ):
+        self.words = words
+        self.advanced_words = advanced_words
+        self.basic_sentiment, self.advanced_sentiment = sentiments
+        self._word_sentiments = word_sentiments
+        self._ngram_details = ngram_details
+        self._details: Dict[bool, List[Tuple[str, float]]] = {}
+
+    def sentiment(self, advanced: bool = False) -> float:
+        return self.advanced_sentiment if advanced else self.basic_sentiment
+
+    def details(self, advanced: bool = False) -> List[Tuple[str, float]]:
+        """
+        Returns the sentiment details of compute_sentiment in the given mode.
+        """
+        details = self._details.get(advanced)
+        if details is None:
+            words = self.advanced_words if advanced else self.words
+            details = list(zip(words, self._word_sentiments[advanced]))
+            details.extend(self._ngram_details[advanced])
+            self._details[advanced] = details
+        return details
+
+
+@instrumented("analyze_review")
+def analyze_review(
+    review: str,
+    word_counter: WordCounter,
+    scorer: str = POLARITY_SCORER,
+    cues: NegationCues = DEFAULT_NEGATION_CUES,
+) -> ReviewAnalysis:
+    """
+    Scores a review in basic and advanced mode at once. The review is tokenized once by
+    preprocess_review_both, and both sentiments are identical to compute_sentiment of
+    preprocess_review in that mode, except that a review without words scores 0.0.
+    The n-gram features of both modes are the same, and computed once, unless the review
+    contains literal "not_" words, which advanced mode reads as negated words.
+    """
+    if scorer not in SCORERS:
+        raise ValueError(f"unknown scorer {scorer!r}, expected one of {SCORERS}")
+    words, advanced_words = preprocess_review_both(review, cues)
+    index = word_counter.scoring_index(scorer)
+    naive_bayes = scorer == NAIVE_BAYES_SCORER
+    # The same defaults as compute_sentiment, so that the sums are identical.
+    default = 0.0 if naive_bayes else 0
+    # advanced_weights reads "not_<word>" as the negated <word>, like compute_sentiment in advanced mode.
+    word_sentiments = (
+        list(map(index.weights.get, words, repeat(default))),
+        list(map(index.advanced_weights.get, advanced_words, repeat(default))),
+    )
+
+    ngram_details = ([], [])
+    ngrams = word_counter.ngrams
+    if ngrams is not None:
+        ngram_weights = word_counter.ngram_log_odds if naive_bayes else None
+        basic_details = ngrams.features(words, ngram_weights)
+        if any(map(str.startswith, words, repeat("not_"))):
+            unmarked_words = [word[4:] if word.startswith("not_") else word for word in advanced_words]
+            ngram_details = (basic_details, ngrams.features(unmarked_words, ngram_weights))
+        else:
+            ngram_details = (basic_details, basic_details)
+
+    sentiments = []
+    for sentiments_of_words, details in zip(word_sentiments, ngram_details):
+        if naive_bayes:
+            sentiments.append(math.fsum(sentiments_of_words + [weight for _, weight in details]))
+            continue
+        if not sentiments_of_words and not details:
+            sentiments.append(0.0)
+            continue
+        # reduce adds in word order like the loop of compute_sentiment, at C speed.
+        cumulative_sentiment = reduce(add, sentiments_of_words, 0)
+        if ngrams is not None:
+            cumulative_sentiment += math.fsum(ngram_sentiment for _, ngram_sentiment in details)
+        sentiments.append(cumulative_sentiment / (len(sentiments_of_words) + len(details)))
+    return ReviewAnalysis(words, advanced_words, word_sentiments, ngram_details, tuple(sentiments))
+
+
+def sentiment_verdict(sentiment: float) -> str:
+    """
+    Returns "positive", "neutral" or "negative" for a sentiment rounded to two decimals.
+    """
+    rounded_sentiment = round(sentiment, 2)
+    if rounded_sentiment > 0:
+        return "positive"
+    if rounded_sentiment == 0:
+        return "neutral"
+    return "negative"
+
+
+class PolarityIndex:
+    """
+    Maps the vocabulary of a WordCounter to integer ids once and keeps the polarity of every word
+    in a flat array, so that batches of reviews can be scored with array gathers.
+    Id 0 stands for unknown words, ids 1..N for the vocabulary and ids N+1..2N for the
+    negated ("not_" prefixed) vocabulary used in advanced mode.
+    With the "naive_bayes" scorer the array holds the log_odds_table weights instead of the polarities.
+    WordCounter.scoring_index keeps one per scorer up to date with the word counter.
+    """
+
+    def __init__(self, word_counter: WordCounter, scorer: str = POLARITY_SCORER):
+        if scorer == NAIVE_BAYES_SCORER:
+            polarity_table = word_counter.log_odds_table
+        elif scorer == POLARITY_SCORER:
+            polarity_table = word_counter.polarity_table
+        else:
+            raise ValueError(f"unknown scorer {scorer!r}, expected one of {SCORERS}")
+        words = sorted(polarity_table)
+
+        polarities = array("d", [0.0])
+        polarities.extend([polarity_table[word] for word in words])
+        polarities.extend([-polarity for polarity in polarities[1:]])
+
+        self.words: List[str] = words
+        self.polarities: array = polarities
+        self.word_ids: Dict[str, int] = {word: i for i, word in enumerate(words, 1)}
+        self._advanced_word_ids: Optional[Dict[str, int]] = None
+        self._weights: Optional[Dict[str, float]] = None
+        self._advanced_weights: Optional[Dict[str, float]] = None
+
+    @property
+    def advanced_word_ids(self) -> Dict[str, int]:
+        """
+        Word ids for advanced mode, where "not_<word>" always refers to the negated polarity of <word>.
+        Built on first use.
+        """
+        if self._advanced_word_ids is None:
+            vocabulary_size = len(self.words)
+            advanced_word_ids = {
+                word: i for word, i in self.word_ids.items() if not word.startswith("not_")
+            }
+            advanced_word_ids.update(
+                ("not_" + word, vocabulary_size + i) for word, i in self.word_ids.items()
+            )
+            self._advanced_word_ids = advanced_word_ids
+        return self._advanced_word_ids
+
+    @property
+    def weights(self) -> Dict[str, float]:
+        """
+        The weight of every word, for scoring single reviews with one lookup per word. Built on first use.
+        """
+        if self._weights is None:
+            self._weights = self._weights_by_word(self.word_ids)
+        return self._weights
+
+    @property
+    def advanced_weights(self) -> Dict[str, float]:
+        """
+        The weight of every word in advanced mode, including the negated "not_" words. Built on first use.
+        """
+        if self._advanced_weights is None:
+            self._advanced_weights = self._weights_by_word(self.advanced_word_ids)
+        return self._advanced_weights
+
+    def _weights_by_word(self, word_ids: Dict[str, int]) -> Dict[str, float]:
+        polarities = self.polarities
+        return {word: polarities[i] for word, i in word_ids.items()}
+
+
+@instrumented("polarity_lookup_batch")
+def compute_sentiment_batch(
+    reviews: Iterable[List[str]],
+    word_counter: WordCounter,
+    advanced: bool = False,
+    polarity_index: Optional[PolarityIndex] = None,
+    scorer: str = POLARITY_SCORER,
+) -> List[float]:
+    """
+    Computes the average sentiment of many preprocessed reviews at once.
+    All words are first translated to vocabulary ids, their polarities gathered into a single
+    array and finally summed per review. Scores match compute_sentiment, except that an empty
+    review scores 0.0 instead of raising ZeroDivisionError.
+    By default the word counter's own scoring index of the scorer is used.
+    A word counter with n-grams is scored review by review with compute_sentiment.
+    """
+    if word_counter.ngrams is not None:
+        return [
+            compute_sentiment(review, word_counter, advanced, scorer)[0] if review else 0.0
+            for review in reviews
+        ]
+    if polarity_index is None:
+        polarity_index = word_counter.scoring_index(scorer)
+    word_ids = polarity_index.advanced_word_ids if advanced else polarity_index.word_ids
+
+    ids: List[int] = []
+    offsets = [0]
+    for review in reviews:
+        ids.extend(map(word_ids.get, review, repeat(0)))
+        offsets.append(len(ids))
 
-    average_sentiment = cumulative_sentiment / len(review)
-    return average_sentiment, sentiment_details
\ No newline at end of file
+    word_sentiments = list(map(polarity_index.polarities.__getitem__, ids))
+    if scorer == NAIVE_BAYES_SCORER:
+        return [math.fsum(word_sentiments[start:end]) for start, end in zip(offsets, offsets[1:])]
+    return [
+        sum(word_sentiments[start:end]) / (end - start) if end > start else 0.0
+        for start, end in zip(offsets, offsets[1:])
+    ]
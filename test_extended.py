@@ -1,6 +1,16 @@
 import pytest
+import asyncio
+import csv
+import io
+import json
+import math
 import os
 import glob
+import subprocess
+import sys
+import tarfile
+import threading
+import zipfile
 from main import (
     preprocess_review,
     WordCounter,
@@ -10,6 +20,34 @@ from main import (
 
     get_next_review_file,
 )
+from sentiment_analysis import SCORERS, NAIVE_BAYES_SCORER, analyze_review, compute_file_sentiment, compute_file_sentiment_both, compute_sentiment_batch
+import batch_scoring
+from batch_scoring import main as batch_scoring_main
+from scoring_service import MAX_BODY_SIZE, ScoringService, load_test, post_json
+from review_index import (
+    INDEX_FILE_NAME,
+    ReviewNumberAllocator,
+    load_review_index,
+    read_first_sentence,
+)
+from review_store import SQLiteReviewStore, export_directory, import_directory, open_review_store
+from scoring_cache import ScoringCache, model_fingerprint
+from vocabulary import CompactVocabulary
+from corpus_pack import CorpusPack, pack_corpus, write_pack
+from document_matrix import DocumentTermMatrix, load_document_matrix, load_or_compile_corpus
+from background_training import BackgroundTrainer
+import file_operations
+import instrumentation
+import preprocessing
+import benchmark
+from benchmark import SyntheticCorpusConfig, generate_reviews, run_suite
+import evaluate
+from lexicon_snapshot import (
+    corpus_fingerprint,
+    load_lexicon_snapshot,
+    load_or_train_word_counter,
+    save_lexicon_snapshot,
+)
 
 # Constants
 POS_TEST_PATH = "test/pos"
@@ -40,6 +78,8 @@ def setup_files():
     # Cleanup files after tests
     for file in glob.glob(f"{REVIEW_FILES_PATH}/*.txt"):
         os.remove(file)
+    if os.path.exists(f"{REVIEW_FILES_PATH}/{INDEX_FILE_NAME}"):
+        os.remove(f"{REVIEW_FILES_PATH}/{INDEX_FILE_NAME}")
 
     os.remove(f"{POS_TEST_PATH}/pos_test.txt")
     os.remove(f"{NEG_TEST_PATH}/neg_test.txt")
@@ -126,4 +166,839 @@ def test_get_next_review_file(setup_files):
     Test to get the name of the next review file.
     """
     next_file = get_next_review_file(REVIEW_FILES_PATH)
-    assert next_file == "Review2.txt"  # The first file created in test_save_review is "Review1.txt", so the next should be "Review2.txt"
\ No newline at end of file
+    assert next_file == "Review2.txt"  # The first file created in test_save_review is "Review1.txt", so the next should be "Review2.txt"
+
+def test_lexicon_snapshot_round_trip(setup_files, tmp_path):
+    """
+    Test that a saved lexicon snapshot restores the trained counters and detects a stale corpus.
+    """
+    snapshot_path = str(tmp_path / "lexicon.snapshot")
+    wc = WordCounter()
+    load_or_train_word_counter(wc, POS_FILES_FEED, NEG_FILES_FEED, snapshot_path)
+
+    restored = WordCounter()
+    fingerprint = corpus_fingerprint(POS_FILES_FEED, NEG_FILES_FEED)
+    assert load_lexicon_snapshot(snapshot_path, restored, fingerprint)
+    assert restored.pos_words_count == wc.pos_words_count
+    assert restored.neg_words_count == wc.neg_words_count
+
+    stale_fingerprint = (fingerprint[0] + 1, fingerprint[1], fingerprint[2])
+    assert not load_lexicon_snapshot(snapshot_path, WordCounter(), stale_fingerprint)
+
+
+def test_parallel_word_counter(setup_files):
+    """
+    Test that counting in worker processes gives the same counters as the serial count.
+    """
+    serial = WordCounter()
+    serial.count_words(POS_FILES_FEED, is_positive=True)
+    serial.count_words(NEG_FILES_FEED, is_positive=False)
+
+    with open(f"{POS_TEST_PATH}/pos_test_2.txt", "w") as pos_test_file:
+        pos_test_file.write("A great, great cast.")
+    try:
+        serial.count_words(f"{POS_TEST_PATH}/pos_test_2.txt", is_positive=True)
+        parallel = WordCounter()
+        parallel.count_words(POS_FILES_FEED, is_positive=True, workers=2)
+        parallel.count_words(NEG_FILES_FEED, is_positive=False, workers=2)
+    finally:
+        os.remove(f"{POS_TEST_PATH}/pos_test_2.txt")
+
+    assert parallel.pos_words_count == serial.pos_words_count
+    assert parallel.neg_words_count == serial.neg_words_count
+    assert parallel.pos_words_count["great"] == 2
+
+
+def test_compute_sentiment_batch():
+    """
+    Test that batch scoring matches scoring the reviews one by one in both modes.
+    """
+    wc = WordCounter()
+    wc.pos_words_count = {"great": 3, "not": 1, "not_bad": 2, "movie": 2}
+    wc.neg_words_count = {"terrible": 4, "bad": 3, "movie": 1}
+
+    basic_reviews = [["great", "movie"], ["terrible", "unknown", "not_bad"], ["movie"]]
+    advanced_reviews = [["not", "not_great", "not_movie"], ["bad", "not_bad", "not_unknown"]]
+
+    for reviews, advanced in ((basic_reviews, False), (advanced_reviews, True)):
+        scores = compute_sentiment_batch(reviews, wc, advanced=advanced)
+        expected = [compute_sentiment(review, wc, advanced=advanced)[0] for review in reviews]
+        assert scores == pytest.approx(expected)
+
+    assert compute_sentiment_batch([[]], wc) == [0.0]
+
+
+def test_polarity_table_invalidation(setup_files):
+    """
+    Test that the polarity table follows retraining and reassigned counters.
+    """
+    wc = WordCounter()
+    wc.count_words(POS_FILES_FEED, is_positive=True)
+    assert wc.polarity_table["great"] == 1.0
+    assert wc.polarity_table["movie"] == 1.0
+
+    wc.count_words(NEG_FILES_FEED, is_positive=False)
+    assert wc.polarity_table["movie"] == 0.0
+    assert wc.polarity_table["terrible"] == -1.0
+
+    wc.pos_words_count = {"movie": 3}
+    assert wc.polarity_table["movie"] == 0.5
+    assert "great" not in wc.polarity_table
+
+
+def test_batch_scoring_jsonl(setup_files, tmp_path):
+    """
+    Test headless scoring of a JSONL file into a CSV file in both modes.
+    """
+    source = tmp_path / "reviews.jsonl"
+    source.write_text(
+        '{"id": "a", "review": "A great movie."}\n'
+        '\n'
+        '{"text": "Not a great movie. Terrible!"}\n',
+        encoding="utf-8",
+    )
+    output = tmp_path / "results.csv"
+    batch_scoring_main(
+        [
+            str(source),
+            "--output", str(output),
+            "--pos", POS_FILES_FEED,
+            "--neg", NEG_FILES_FEED,
+            "--snapshot", str(tmp_path / "lexicon.snapshot"),
+            "--workers", "1",
+            "--batch-size", "1",
+        ]
+    )
+
+    with open(output, encoding="utf-8", newline="") as stream:
+        rows = list(csv.DictReader(stream))
+    assert [row["id"] for row in rows] == ["a", "3"]
+    assert rows[0]["basic_verdict"] == "positive"
+    assert rows[1]["advanced_verdict"] == "negative"
+
+    with pytest.raises(SystemExit):
+        batch_scoring.parse_arguments([str(source), "--batch-size", "0"])
+    source.write_text('{"review": "Fine."}\n["not", "an", "object"]\n', encoding="utf-8")
+    with pytest.raises(ValueError, match="reviews.jsonl:2 is not a JSON object"):
+        list(batch_scoring.iter_reviews(str(source)))
+
+    # Review files larger than a chunk are streamed and score like the whole text.
+    directory = tmp_path / "reviews"
+    directory.mkdir()
+    (directory / "large.txt").write_text("Not a great movie. " * 5000, encoding="utf-8")
+    (directory / "small.txt").write_text("A great movie.", encoding="utf-8")
+    wc = WordCounter()
+    wc.count_documents([(True, "a great movie"), (False, "a terrible movie")])
+    streamed = io.StringIO()
+    batch_scoring.score_files(
+        batch_scoring.text_files(str(directory)), wc, ["basic", "advanced"],
+        batch_scoring.ResultWriter(streamed, "jsonl", ["basic", "advanced"]),
+    )
+    read_whole = io.StringIO()
+    batch_scoring.score_reviews(
+        batch_scoring.iter_reviews(str(directory)), wc, ["basic", "advanced"],
+        batch_scoring.ResultWriter(read_whole, "jsonl", ["basic", "advanced"]),
+    )
+    assert streamed.getvalue() == read_whole.getvalue()
+
+
+@pytest.mark.parametrize("archive_format", ["tar.gz", "zip"])
+def test_word_counter_from_archive(setup_files, tmp_path, archive_format):
+    """
+    Test that counting straight from an archive gives the same counters as the extracted files.
+    """
+    members = {
+        "aclImdb/train/pos/0_9.txt": "This is a great movie.",
+        "aclImdb/train/neg/0_1.txt": "This is a terrible movie.",
+        "aclImdb/train/unsup/0_0.txt": "Unlabeled review.",
+        "aclImdb/test/pos/0_10.txt": "A test split review.",
+        "aclImdb/README": "Not a review.",
+    }
+    archive_path = str(tmp_path / f"aclImdb.{archive_format}")
+    if archive_format == "zip":
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+    else:
+        with tarfile.open(archive_path, "w:gz") as archive:
+            for name, content in members.items():
+                data = content.encode("utf-8")
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+
+    from_archive = WordCounter()
+    from_archive.count_archive(archive_path)
+    from_files = WordCounter()
+    from_files.count_words(POS_FILES_FEED, is_positive=True)
+    from_files.count_words(NEG_FILES_FEED, is_positive=False)
+
+    assert from_archive.pos_words_count == from_files.pos_words_count
+    assert from_archive.neg_words_count == from_files.neg_words_count
+
+
+def test_incremental_refresh(tmp_path):
+    """
+    Test that refreshing after adding, modifying and deleting files matches a full rebuild.
+    """
+    pos_path = tmp_path / "pos"
+    pos_path.mkdir()
+    pattern = str(pos_path / "*.txt")
+    (pos_path / "1.txt").write_text("A great movie.", encoding="utf-8")
+    (pos_path / "2.txt").write_text("A fine movie.", encoding="utf-8")
+
+    wc = WordCounter()
+    assert wc.refresh(pattern, is_positive=True)["added"] == 2
+    assert wc.refresh(pattern, is_positive=True)["unchanged"] == 2
+
+    (pos_path / "2.txt").write_text("A fine, fine cast.", encoding="utf-8")
+    os.utime(pos_path / "2.txt", ns=(1, 1))
+    (pos_path / "1.txt").unlink()
+    (pos_path / "3.txt").write_text("Great fun.", encoding="utf-8")
+    summary = wc.refresh(pattern, is_positive=True)
+    assert (summary["added"], summary["modified"], summary["removed"]) == (1, 1, 1)
+
+    rebuilt = WordCounter()
+    rebuilt.count_words(pattern, is_positive=True)
+    assert wc.pos_words_count == rebuilt.pos_words_count
+    assert wc.polarity_table == rebuilt.polarity_table
+
+    manifest_path = str(tmp_path / "manifest.json")
+    wc.save_manifest(manifest_path)
+    restored = WordCounter()
+    restored.pos_words_count = dict(wc.pos_words_count)
+    restored.load_manifest(manifest_path)
+    assert restored.refresh(pattern, is_positive=True)["unchanged"] == 2
+
+
+def test_scoring_service_micro_batching():
+    """
+    Test single and bulk requests against the HTTP service and that concurrent requests share batches.
+    """
+    wc = WordCounter()
+    wc.pos_words_count = {"great": 1}
+    wc.neg_words_count = {"terrible": 1}
+
+    async def scenario():
+        service = ScoringService(wc, max_batch_size=16, max_wait=0.05)
+        port = await service.start("127.0.0.1", 0)
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, single = await post_json(
+                reader, writer, "/score", {"review": "Not great.", "advanced": True, "details": True}
+            )
+            _, bulk = await post_json(
+                reader, writer, "/score", {"reviews": ["Great!", "Terrible.", ""]}
+            )
+            bad_status, _ = await post_json(reader, writer, "/score", {"text": "missing"})
+            # A failing batch fails its requests, and the batcher keeps serving the next ones.
+            score_batch = service.batcher._score_batch
+
+            def fail_once(batch):
+                service.batcher._score_batch = score_batch
+                raise RuntimeError("model unavailable")
+
+            service.batcher._score_batch = fail_once
+            failed_status, failed = await post_json(reader, writer, "/score", {"review": "Great!"})
+            recovered_status, _ = await post_json(reader, writer, "/score", {"review": "Great!"})
+            assert (failed_status, recovered_status) == (500, 200)
+            assert "model unavailable" in failed["error"]
+            writer.close()
+
+            # An oversized body is refused with 413 without being read.
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                f"POST /score HTTP/1.1\r\nContent-Length: {MAX_BODY_SIZE + 1}\r\n\r\n".encode("latin-1")
+            )
+            await writer.drain()
+            assert (await reader.readline()).split()[1] == b"413"
+            assert b"Connection: close" in await reader.readuntil(b"\r\n\r\n")
+            writer.close()
+
+            load = await load_test("127.0.0.1", port, ["Great.", "Terrible."], concurrency=8, requests=40)
+            return status, single, bulk, bad_status, load, service.stats()
+        finally:
+            await service.stop()
+
+    status, single, bulk, bad_status, load, stats = asyncio.run(scenario())
+    assert status == 200
+    assert single["verdict"] == "negative"
+    assert single["details"] == [["not", 0], ["not_great", -1.0]]
+    assert [result["verdict"] for result in bulk["results"]] == ["positive", "negative", "neutral"]
+    assert bad_status == 400
+    assert load["requests"] == 40
+    assert stats["average_batch_size"] > 1
+    assert stats["latency_ms"]["p95"] >= stats["latency_ms"]["p50"] > 0
+
+
+def test_benchmark_suite_synthetic_corpus(monkeypatch):
+    config = SyntheticCorpusConfig(review_count=20, mean_words=40, vocabulary_size=200, seed=7)
+    reviews = list(generate_reviews(config))
+    assert reviews == list(generate_reviews(config))
+    assert [is_positive for is_positive, _ in reviews] == [True, False] * 10
+
+    report = run_suite(config, review_files=5, repeat=1)
+    names = [result["name"] for result in report["results"]]
+    assert "count_words" in names and "compute_sentiment[advanced]" in names
+    for result in report["results"]:
+        assert result["seconds"] > 0
+        assert result["docs_per_second"] > 0
+        assert result["peak_memory_bytes"] >= 0
+
+    # Reviews without words are scored as 0.0, a neutral verdict, as evaluate.py scores them.
+    corpus = [(True, "a great film"), (False, "a bad film"), (True, "...")]
+    monkeypatch.setattr(benchmark, "generate_reviews", lambda config: iter(corpus))
+    for result in benchmark.benchmark_ngram_tables(config, table_sizes=[1 << 8]):
+        assert result["accuracy"] == 2 / 3
+
+
+def test_review_index(tmp_path, monkeypatch, capsys):
+    """
+    Test that the review index follows saves, deletes and outside changes, and that listing pages.
+    """
+    path = str(tmp_path)
+    for text in ["First one. More", "Second!", "Third... and", "no delimiter  "]:
+        save_review(text, path)
+    assert [read_first_sentence(os.path.join(path, f"Review{i}.txt")) for i in range(1, 5)] == [
+        "First one...", "Second", "Third", "no delimiter",
+    ]
+    assert sorted(load_review_index(path)) == [f"Review{i}.txt" for i in range(1, 5)]
+
+    with open(os.path.join(path, "Review2.txt"), "w", encoding="utf-8") as stream:
+        stream.write("Changed outside. Yes")
+    with open(os.path.join(path, "Review10.txt"), "w", encoding="utf-8") as stream:
+        stream.write("Added outside.")
+    os.remove(os.path.join(path, "Review4.txt"))
+
+    prompts = []
+    monkeypatch.setattr("builtins.input", lambda prompt="": prompts.append(prompt) or "q")
+    capsys.readouterr()
+    files = list_review_files(path, page_size=2)
+    output = capsys.readouterr().out
+    assert files == ["Review1.txt", "Review2.txt"]
+    assert "2. Review2.txt - Changed outside..." in output
+    assert "Review3.txt" not in output
+    assert len(prompts) == 1
+    assert load_review_index(path)["Review10.txt"].first_sentence == "Added outside"
+
+
+def test_review_number_allocator_concurrent_writers(tmp_path):
+    """
+    Test that parallel writers with separate allocators never reuse a review file name.
+    """
+    path = str(tmp_path)
+    for number in (1, 2, 4):
+        (tmp_path / f"Review{number}.txt").write_text("existing")
+    allocators = [ReviewNumberAllocator(path) for _ in range(4)]
+    assert allocators[0].peek() == 3
+
+    created = []
+
+    def writer(allocator, worker):
+        for i in range(25):
+            created.append(allocator.create(f"{worker}-{i}"))
+
+    threads = [
+        threading.Thread(target=writer, args=(allocator, worker))
+        for worker, allocator in enumerate(allocators * 2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(created)) == len(created) == 200
+    contents = {(tmp_path / name).read_text() for name in created}
+    assert len(contents) == 200
+    assert sorted(int(name[6:-4]) for name in created) == [3] + list(range(5, 204))
+
+    allocators[0].release("Review3.txt")
+    assert allocators[0].peek() == 3
+
+    # A failed write gives its number back, and changes made by others are picked up.
+    os.remove(tmp_path / "Review3.txt")
+    allocator = ReviewNumberAllocator(path)
+    with pytest.raises(UnicodeEncodeError):
+        allocator.create("\ud800")
+    assert allocator.peek() == 3 and not (tmp_path / "Review3.txt").exists()
+    os.remove(tmp_path / "Review5.txt")
+    assert allocator.peek() == 3
+    (tmp_path / "Review3.txt").write_text("added outside")
+    assert allocator.peek() == 5
+
+
+def test_sqlite_review_store(tmp_path, monkeypatch, capsys):
+    """
+    Test the SQLite review store through the menu functions and the directory import/export.
+    """
+    database_path = str(tmp_path / "reviews.db")
+    save_review("Great film. Really", database_path)
+    save_review("Awful!", database_path)
+    assert get_next_review_file(database_path) == "Review3.txt"
+    assert list_review_files(database_path) == ["Review1.txt", "Review2.txt"]
+    assert "2. Review2.txt - Awful" in capsys.readouterr().out
+
+    store = open_review_store(database_path)
+    assert isinstance(store, SQLiteReviewStore)
+    assert store.save_reviews(f"Bulk review {i}." for i in range(25)) == 25
+    assert store.count() == 27
+    page = store.list_review_files(offset=10, limit=5)
+    assert [summary.file_name for summary in page] == [f"Review{i}.txt" for i in range(11, 16)]
+    assert page[0].first_sentence == "Bulk review 8"
+    store.delete_review_file("Review1.txt")
+    with pytest.raises(KeyError):
+        store.read_review_file("Review1.txt")
+
+    exported_path = str(tmp_path / "exported")
+    assert export_directory(store, exported_path) == 26
+    store.close()
+    assert sorted(os.listdir(exported_path))[:2] == [".reviews.index", "Review10.txt"]
+
+    imported = SQLiteReviewStore(str(tmp_path / "imported.sqlite"))
+    assert import_directory(imported, exported_path) == 26
+    assert imported.read_review_file("Review2.txt") == "Awful!"
+    assert imported.list_review_files(limit=1)[0].file_name == "Review2.txt"
+    imported.close()
+
+    assert list_review_files(str(tmp_path / "missing" / "reviews.db")) is None
+    assert "Cannot open the review database" in capsys.readouterr().out
+    assert file_operations.list_review_files(str(tmp_path / "missing" / "reviews.db")) == []
+    file_operations.save_review("Lost.", str(tmp_path / "missing" / "reviews.db"))
+    assert capsys.readouterr().out.count("Cannot open the review database") == 2
+
+    import review_store
+
+    refreshes = []
+    refresh = review_store.refresh_review_index
+    monkeypatch.setattr(review_store, "refresh_review_index", lambda path: refreshes.append(path) or refresh(path))
+    directory = open_review_store(exported_path)
+    pages = [directory.list_review_files(offset, 5) for offset in range(0, 30, 5)]
+    assert sum(len(page) for page in pages) == 26 and len(refreshes) == 1
+    directory.delete_review_file("Review2.txt")
+    assert directory.count() == 25 and len(refreshes) == 2
+    directory.close()
+
+
+def test_scoring_cache(tmp_path):
+    """
+    Test cache hits, LRU eviction, invalidation on retraining and the persistent tier.
+    """
+    wc = WordCounter()
+    wc.pos_words_count = {"great": 3}
+    wc.neg_words_count = {"terrible": 1}
+    disk_path = str(tmp_path / "scores.db")
+    cache = ScoringCache(wc, max_entries=1, disk_path=disk_path)
+
+    expected = compute_sentiment(preprocess_review("Not great.", advanced=True), wc, advanced=True)
+    assert cache.score("Not great.", advanced=True) == expected
+    assert cache.score("Not great.", advanced=True) == expected
+    # Both modes are cached in one entry.
+    basic_expected = compute_sentiment(preprocess_review("Not great."), wc)
+    assert cache.score("Not great.") == basic_expected
+    assert cache.sentiments_many(["Not great."]) == [(basic_expected[0], expected[0])]
+    assert cache.score("") == (0.0, [])
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["evictions"] == 1
+
+    wc.neg_words_count = {"terrible": 1, "great": 3}
+    assert cache.score("Great!") == (0.0, [("great", 0.0)])
+    assert cache.stats()["entries"] == 1
+    cache.close()
+
+    reopened = ScoringCache(wc, disk_path=disk_path, max_disk_entries=3, eviction_interval=1)
+    assert reopened.score_many(["Great!", "Terrible."]) == [(0.0, []), (-1.0, [])]
+    assert reopened.score_many(["Great!", "Terrible."], details=True) == [
+        (0.0, [("great", 0.0)]),
+        (-1.0, [("terrible", -1.0)]),
+    ]
+    assert reopened.stats()["disk_hits"] == 1 and reopened.stats()["hits"] == 2
+    # The persistent tier is counted in the database, which another process may have filled.
+    other = ScoringCache(wc, disk_path=disk_path)
+    other.score_many(["Good.", "Bad.", "Fine."])
+    other.close()
+    reopened.score_many(["Awful."])
+    assert reopened.stats()["disk_entries"] == 3
+    reopened.close()
+
+    # A review repeated within a batch is scored once, and rows are evicted every few inserts.
+    batched = ScoringCache(wc, disk_path=disk_path, max_disk_entries=2, eviction_interval=3)
+    assert batched.score_many(["Dull.", "Dull."]) == [(0.0, []), (0.0, [])]
+    assert batched.stats()["misses"] == 1 and batched.stats()["disk_entries"] == 4
+    batched.close()
+    reopened = ScoringCache(wc, disk_path=disk_path)
+    assert reopened.stats()["disk_entries"] == 2
+    reopened.close()
+
+
+def test_compact_vocabulary(setup_files, tmp_path):
+    """
+    Test that a compacted WordCounter keeps its dict-like counters, scores and snapshot format.
+    """
+    wc = WordCounter()
+    wc.count_words(POS_FILES_FEED, is_positive=True)
+    wc.count_words(NEG_FILES_FEED, is_positive=False)
+    pos_words_count = dict(wc.pos_words_count)
+    neg_words_count = dict(wc.neg_words_count)
+    review = preprocess_review("This is not a great movie.", advanced=True)
+    expected = compute_sentiment(review, wc, advanced=True)
+
+    wc.compact()
+    assert isinstance(wc.vocabulary, CompactVocabulary)
+    assert wc.pos_words_count == pos_words_count
+    assert wc.neg_words_count == neg_words_count
+    assert wc.neg_words_count["terrible"] == 1 and "terrible" not in wc.pos_words_count
+    assert wc.pos_words_count.get("missing", 0) == 0
+    assert compute_sentiment(review, wc, advanced=True) == expected
+
+    version = wc.version
+    for i in range(100):
+        wc.pos_words_count[f"new{i}"] = i + 1
+    del wc.neg_words_count["terrible"]
+    wc.invalidate_polarity_table()
+    assert len(wc.pos_words_count) == len(pos_words_count) + 100
+    assert wc.pos_words_count["new99"] == 100
+    assert "terrible" not in wc.neg_words_count
+    assert wc.polarity_table["new5"] == 1.0 and "terrible" not in wc.polarity_table
+    assert wc.version > version
+
+    fingerprint = corpus_fingerprint(POS_FILES_FEED, NEG_FILES_FEED)
+    snapshot_path = str(tmp_path / "compact.snapshot")
+    save_lexicon_snapshot(wc, snapshot_path, fingerprint)
+    restored = WordCounter()
+    assert load_lexicon_snapshot(snapshot_path, restored, fingerprint)
+    assert restored.vocabulary is not None
+    assert restored.pos_words_count == wc.pos_words_count
+    assert restored.polarity_table == wc.polarity_table
+
+
+def test_background_trainer(setup_files, tmp_path):
+    """
+    Test that background training reports its progress and yields the trained counter.
+    """
+    trainer = BackgroundTrainer(POS_FILES_FEED, NEG_FILES_FEED, str(tmp_path / "lexicon.snapshot"))
+    updates = []
+    trainer.progress.update = lambda counted, total: updates.append((counted, total))
+    trainer.start()
+    word_counter = trainer.wait(report=lambda message: None)
+
+    assert trainer.is_ready and trainer.error is None
+    assert word_counter.pos_words_count["great"] == 1
+    assert word_counter.neg_words_count["terrible"] == 1
+    assert updates == [(1, 2), (2, 2)]
+    assert trainer.status() == "The sentiment model is ready."
+
+
+def test_instrumentation(tmp_path):
+    """
+    Test that enabling instrumentation times the stages and that nothing is recorded while it is disabled.
+    """
+    instrumentation.reset()
+    preprocessing.preprocess_review("Not great.", advanced=True)
+    assert instrumentation.report() == {}
+    instrumentation.enable()
+    try:
+        wc = WordCounter()
+        wc.pos_words_count = {"great": 1}
+        review = preprocessing.preprocess_review("Not great. Great!", advanced=True)
+        compute_sentiment(review, wc, advanced=True)
+        summary = instrumentation.report()
+    finally:
+        instrumentation.disable()
+
+    preprocessing.preprocess_review("Not great.", advanced=True)
+    assert instrumentation.report()["preprocess_review"]["calls"] == summary["preprocess_review"]["calls"]
+    assert summary["preprocess_review"]["calls"] == 1
+    assert summary["negation"]["calls"] == 3
+    assert summary["sentence_split"]["calls"] == 1
+    assert summary["polarity_lookup"]["calls"] == 1
+    assert summary["preprocess_review"]["p95_seconds"] >= summary["preprocess_review"]["p50_seconds"] > 0
+
+    json_path = str(tmp_path / "profile.json")
+    instrumentation.export_json(json_path)
+    with open(json_path, encoding="utf-8") as stream:
+        assert set(json.load(stream)) == set(summary)
+    instrumentation.reset()
+
+
+def test_hashed_ngrams(setup_files, tmp_path):
+    """
+    Test that hashed n-grams are counted identically in serial and parallel training and scored as features.
+    """
+    wc = WordCounter()
+    wc.enable_ngrams(table_size=1 << 10)
+    wc.count_documents([(True, "A must see."), (False, "Not good, a waste of time."), (False, "A waste.")])
+    ngrams = wc.ngrams
+    assert ngrams.nbytes == 8 << 10
+    assert ngrams.neg_counts[ngrams.bucket("a waste")] == 2
+    assert ngrams.pos_counts[ngrams.bucket("must see")] == 1
+
+    sentiment, details = compute_sentiment(preprocess_review("A waste of time"), wc)
+    assert [ngram for ngram, _ in details[4:]] == ["a waste", "waste of", "of time", "a waste of", "waste of time"]
+    assert all(score == -1.0 for _, score in details[4:])
+    assert sentiment == sum(score for _, score in details) / len(details)
+    _, details = compute_sentiment(preprocess_review("This is not good.", advanced=True), wc, advanced=True)
+    assert ("not good", -1.0) in details
+    review = preprocess_review("A must see")
+    assert compute_sentiment_batch([review], wc) == [compute_sentiment(review, wc)[0]]
+    with pytest.raises(ValueError):
+        wc.refresh(POS_FILES_FEED, is_positive=True)
+
+    for number in range(6):
+        with open(tmp_path / f"{number}.txt", "w", encoding="utf-8") as stream:
+            stream.write(f"Review {number} is a must see, not a waste of time number {number % 3}.")
+    serial = WordCounter()
+    serial.enable_ngrams(table_size=1 << 10)
+    serial.count_words(str(tmp_path / "*.txt"), is_positive=True)
+    parallel = WordCounter()
+    parallel.enable_ngrams(table_size=1 << 10)
+    parallel.count_words(str(tmp_path / "*.txt"), is_positive=True, workers=2)
+    assert parallel.pos_words_count == serial.pos_words_count
+    assert parallel.ngrams.pos_counts == serial.ngrams.pos_counts
+    assert serial.ngrams.pos_counts[serial.ngrams.bucket("must see")] == 6
+    assert not any(parallel.ngrams.neg_counts)
+
+    fingerprint = (6, 0, bytes(32))
+    snapshot_path = str(tmp_path / "ngrams.snapshot")
+    save_lexicon_snapshot(parallel, snapshot_path, fingerprint)
+    assert not load_lexicon_snapshot(snapshot_path, WordCounter(), fingerprint)
+    restored = WordCounter()
+    restored.enable_ngrams(table_size=1 << 10)
+    assert load_lexicon_snapshot(snapshot_path, restored, fingerprint)
+    assert restored.ngrams.pos_counts == serial.ngrams.pos_counts
+    resized = WordCounter()
+    resized.enable_ngrams(table_size=1 << 11)
+    assert not load_lexicon_snapshot(snapshot_path, resized, fingerprint)
+    without_ngrams = WordCounter()
+    without_ngrams.vocabulary = restored.vocabulary
+    assert model_fingerprint(restored) == model_fingerprint(parallel)
+    assert model_fingerprint(without_ngrams) != model_fingerprint(restored)
+
+
+def test_naive_bayes_scorer():
+    """
+    Test that the naive Bayes scorer sums smoothed log-likelihood ratios, negated for "not_" words.
+    """
+    wc = WordCounter()
+    wc.pos_words_count = {"great": 3, "movie": 1}
+    wc.neg_words_count = {"awful": 2, "movie": 2}
+    # 3 words, 4 positive and 4 negative counts with add-one smoothing: both totals are 7.
+    assert wc.log_odds_table == {
+        "great": math.log(4 / 1),
+        "awful": math.log(1 / 3),
+        "movie": math.log(2 / 3),
+    }
+
+    sentiment, details = compute_sentiment(["great", "movie", "unknown"], wc, scorer=NAIVE_BAYES_SCORER)
+    assert details == [("great", math.log(4)), ("movie", math.log(2 / 3)), ("unknown", 0.0)]
+    assert sentiment == pytest.approx(math.log(8 / 3))
+    sentiment, details = compute_sentiment(["not", "not_great"], wc, advanced=True, scorer=NAIVE_BAYES_SCORER)
+    assert details == [("not", 0.0), ("not_great", -math.log(4))]
+    assert compute_sentiment(["not_great"], wc, scorer=NAIVE_BAYES_SCORER) == (0.0, [("not_great", 0.0)])
+    assert compute_sentiment([], wc, scorer=NAIVE_BAYES_SCORER) == (0.0, [])
+
+    reviews = [["great", "movie"], ["not_awful"], []]
+    assert compute_sentiment_batch(reviews, wc, advanced=True, scorer=NAIVE_BAYES_SCORER) == pytest.approx(
+        [compute_sentiment(review, wc, advanced=True, scorer=NAIVE_BAYES_SCORER)[0] for review in reviews]
+    )
+    with pytest.raises(ValueError):
+        compute_sentiment(["great"], wc, scorer="unknown")
+
+    cache = ScoringCache(wc, scorer=NAIVE_BAYES_SCORER)
+    assert cache.score("Great movie") == compute_sentiment(["great", "movie"], wc, scorer=NAIVE_BAYES_SCORER)
+    assert cache.key("Great movie") != ScoringCache(wc).key("Great movie")
+    wc.pos_words_count = {"awful": 1}
+    assert wc.log_odds_table["awful"] == pytest.approx(math.log(2 / 3 * 6 / 3)) and "great" not in wc.log_odds_table
+
+
+def test_document_term_matrix(setup_files, tmp_path):
+    """
+    Test that a compiled corpus round-trips through its file and yields the same counters as count_words.
+    """
+    wc = WordCounter()
+    wc.count_words(POS_FILES_FEED, is_positive=True)
+    wc.count_words(NEG_FILES_FEED, is_positive=False)
+
+    matrix_path = str(tmp_path / "corpus.dtm")
+    matrix = load_or_compile_corpus(POS_FILES_FEED, NEG_FILES_FEED, matrix_path)
+    assert list(matrix.labels) == [1, 0]
+    assert matrix.shape[1] == len(wc.pos_words_count.keys() | wc.neg_words_count.keys())
+    restored = load_document_matrix(matrix_path, corpus_fingerprint(POS_FILES_FEED, NEG_FILES_FEED))
+    for column in ("indptr", "indices", "data", "labels", "words"):
+        assert getattr(restored, column) == getattr(matrix, column)
+    assert load_document_matrix(matrix_path, (0, 0, bytes(32))) is None
+
+    from_matrix = WordCounter()
+    from_matrix.count_document_matrix(restored)
+    assert from_matrix.pos_words_count == wc.pos_words_count
+    assert from_matrix.neg_words_count == wc.neg_words_count
+
+    matrix = DocumentTermMatrix.from_documents([(True, "good good film"), (False, "bad film"), (True, "good")])
+    ids, counts = matrix.row(0)
+    assert [matrix.words[i] for i in ids] == ["good", "film"] and list(counts) == [2, 1]
+    assert list(matrix.document_frequencies(True)) == [2, 1, 0]
+    assert list(matrix.document_frequencies(True, documents=[0, 1])) == [1, 1, 0]
+    fold = WordCounter()
+    fold.count_document_matrix(matrix, documents=[1, 2])
+    assert fold.pos_words_count == {"good": 1} and fold.neg_words_count == {"bad": 1, "film": 1}
+    with_ngrams = WordCounter()
+    with_ngrams.enable_ngrams(table_size=1 << 8)
+    with pytest.raises(ValueError):
+        with_ngrams.count_document_matrix(matrix)
+
+
+def test_evaluate(setup_files, tmp_path, capsys):
+    """
+    Test that the evaluation reports the same accuracy and confusion matrix in one and in several processes.
+    """
+    arguments = [
+        "--pos", POS_FILES_FEED, "--neg", NEG_FILES_FEED,
+        "--train-pos", POS_FILES_FEED, "--train-neg", NEG_FILES_FEED,
+        "--snapshot", str(tmp_path / "lexicon.snapshot"), "--json", str(tmp_path / "evaluation.json"),
+    ]
+    single = evaluate.main(arguments + ["--workers", "1"])
+    parallel = evaluate.main(arguments + ["--workers", "2", "--shard-size", "1"])
+
+    assert single["documents"] == parallel["documents"] == 2
+    assert parallel["workers"] == 2
+    for mode in ("basic", "advanced"):
+        assert single["modes"][mode]["accuracy"] == parallel["modes"][mode]["accuracy"] == 1.0
+        assert parallel["modes"][mode]["confusion"] == {
+            "positive": {"positive": 1, "neutral": 0, "negative": 0},
+            "negative": {"positive": 0, "neutral": 0, "negative": 1},
+        }
+        assert parallel["modes"][mode]["p95_ms"] >= parallel["modes"][mode]["p50_ms"] > 0
+    with open(tmp_path / "evaluation.json", encoding="utf-8") as stream:
+        assert json.load(stream)["modes"].keys() == {"basic", "advanced"}
+    assert "accuracy 1.0000" in capsys.readouterr().out
+
+
+def test_streaming_analysis(tmp_path):
+    """
+    Test that reading a review in small chunks gives the same words and scores as the whole-file path.
+    """
+    review = (
+        "I did not like it - at all.  'Far from great', they said<br /><br />but the cast was good!\n"
+        "It is not only long... but also not very funny? No - never again. It isn't bad / just dull."
+    ) * 3
+    path = tmp_path / "review.txt"
+    path.write_text(review, encoding="utf-8")
+
+    assert [word for words in preprocessing.iter_file_tokens(str(path), chunk_size=7) for word in words] == (
+        preprocessing.tokenize(review)
+    )
+    for advanced in (False, True):
+        whole = preprocess_review(review, advanced=advanced)
+        with open(path, encoding="utf-8") as stream:
+            chunks = list(preprocessing.iter_text_chunks(stream, chunk_size=5))
+        assert "".join(chunks) == review and len(chunks) > 10
+        pieces = list(preprocessing.iter_review_words(chunks, advanced=advanced))
+        assert [word for words in pieces for word in words] == whole
+
+    marker = preprocessing.NegationMarker()
+    words = preprocess_review("not far from the best but not only bad", advanced=False)
+    marked = [word for word in words for word in marker.feed([word])] + marker.finish()
+    assert marked == preprocessing.mark_negations(words)
+
+    wc = WordCounter()
+    wc.enable_ngrams(table_size=1 << 8)
+    wc.count_documents([(True, "good cast, funny and great"), (False, "dull, bad and not funny at all")])
+    for advanced in (False, True):
+        for scorer in SCORERS:
+            expected = compute_sentiment(preprocess_review(review, advanced=advanced), wc, advanced, scorer)[0]
+            assert compute_file_sentiment(str(path), wc, advanced, scorer, chunk_size=5) == expected
+    for scorer in SCORERS:
+        assert compute_file_sentiment_both(str(path), wc, scorer, chunk_size=5) == tuple(
+            compute_file_sentiment(str(path), wc, advanced, scorer) for advanced in (False, True)
+        )
+
+
+def test_corpus_pack(setup_files, tmp_path):
+    """
+    Test that a packed corpus trains the same counters as its files, can be appended to and is verified.
+    """
+    pack_path = str(tmp_path / "train.pack")
+    assert pack_corpus(POS_FILES_FEED, NEG_FILES_FEED, pack_path) == 2
+    wc = WordCounter()
+    wc.count_words(POS_FILES_FEED, is_positive=True)
+    wc.count_words(NEG_FILES_FEED, is_positive=False)
+    from_pack = WordCounter()
+    from_pack.count_pack(pack_path)
+    assert from_pack.pos_words_count == wc.pos_words_count
+    assert from_pack.neg_words_count == wc.neg_words_count
+
+    with CorpusPack(pack_path) as pack:
+        fingerprint = pack.fingerprint
+    with open(pack_path, "ab") as stream:
+        stream.write(b"an interrupted append")
+    assert write_pack(pack_path, [(True, "très bon"), (False, "")], append=True) == 2
+    with CorpusPack(pack_path) as pack:
+        assert len(pack) == 4 and pack.fingerprint != fingerprint
+        assert list(pack.iter_documents([2, 3])) == [(True, "très bon"), (False, "")]
+        assert bytes(pack.document(0)) == b"This is a great movie." and not pack.is_positive(1)
+        assert pack.verify() == []
+
+    with open(pack_path, "r+b") as stream:
+        stream.write(b"That")
+    with CorpusPack(pack_path) as pack:
+        assert pack.verify() == [0]
+
+    arguments = ["--pack", pack_path, "--train-pack", pack_path]
+    report = evaluate.main(arguments + ["--workers", "2", "--shard-size", "1"])
+    assert report["documents"] == 4 and report["workers"] == 2
+    assert os.path.exists(pack_path + ".snapshot")
+
+    os.remove(pack_path)
+    with pytest.raises(ValueError, match="damaged pack"):
+        write_pack(pack_path, [(True, "lost")], append=True)
+
+
+def test_analyze_review():
+    """
+    Test that the combined analysis gives the scores and details of compute_sentiment in both modes,
+    including for literal "not_" words.
+    """
+    wc = WordCounter()
+    wc.count_documents([(True, "great cast, good and funny"), (False, "bad plot, not funny at all"), (True, "not_bad")])
+    review = "Not good. The cast was not_bad, but the plot is far from great!"
+    for ngrams in (False, True):
+        if ngrams:
+            wc.enable_ngrams(table_size=1 << 8)
+            wc.count_documents([(True, "the cast was great"), (False, "the plot is bad")])
+        for scorer in SCORERS:
+            analysis = analyze_review(review, wc, scorer)
+            for advanced in (False, True):
+                words = preprocess_review(review, advanced=advanced)
+                assert (analysis.advanced_words if advanced else analysis.words) == words
+                sentiment, details = compute_sentiment(words, wc, advanced, scorer)
+                assert analysis.sentiment(advanced) == sentiment
+                assert analysis.details(advanced) == details
+                assert analysis.details(advanced) is analysis.details(advanced)
+    assert analyze_review("...", wc).advanced_sentiment == 0.0
+
+
+def test_compact_vocabulary_across_hash_seeds(tmp_path):
+    """
+    Test that a compacted WordCounter pickled in one process is found in a process with another str hash seed.
+    """
+    pickle_path = str(tmp_path / "word_counter.pickle")
+    save = (
+        "import pickle, sys; from sentiment_analysis import WordCounter; wc = WordCounter(); "
+        "wc.count_documents([(True, 'good fun film'), (False, 'bad dull film')]); wc.compact(); "
+        "pickle.dump(wc, open(sys.argv[1], 'wb'))"
+    )
+    load = (
+        "import pickle, sys; wc = pickle.load(open(sys.argv[1], 'rb')); "
+        "print(wc.pos_words_count['good'], wc.neg_words_count['film'], wc.polarity_table['bad'])"
+    )
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for code, seed in ((save, "1"), (load, "2")):
+        completed = subprocess.run(
+            [sys.executable, "-c", code, pickle_path],
+            cwd=directory,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    assert completed.stdout.split() == ["1", "1", "-1.0"]
@@ -0,0 +1,107 @@
+import glob
+import random
+import re
+
+import pytest
+from preprocessing import (
+    NegationCues,
+    PUNCTUATIONS,
+    mark_negations,
+    preprocess_review,
+    tokenize,
+    tokenize_sentences,
+)
+
+IMDB_FILES = sorted(glob.glob("train/pos/*.txt") + glob.glob("train/neg/*.txt"))
+
+
+def reference_remove_punctuations(review):
+    """
+    The original tokenizer: one str.replace call per entry of PUNCTUATIONS.
+    """
+    for punctuation in PUNCTUATIONS:
+        review = review.replace(punctuation, " ")
+    return review
+
+
+def reference_sentences(review):
+    """
+    The original per-sentence tokenization of preprocess_review.
+    """
+    return [
+        reference_remove_punctuations(sentence.strip()).lower().split()
+        for sentence in re.split(r"[.!?]", review)
+    ]
+
+
+def assert_equivalent(text):
+    sentences = reference_sentences(text)
+    assert tokenize(text) == reference_remove_punctuations(text).lower().split()
+    assert tokenize_sentences(text) == sentences
+    assert preprocess_review(text) == [word for words in sentences for word in words]
+
+
+def random_texts(count):
+    """
+    Deterministic random snippets dense in punctuation, quotes, dashes and line breaks.
+    """
+    rng = random.Random(2024)
+    alphabet = list("abcdeé中 ") + list(" .,?!:;-'\"()[]{}@#$%^&*<>/br\n\t\x0b\x1c")
+    for _ in range(count):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        if rng.random() < 0.3:
+            text = text.replace("b", "<br />", 1)
+        yield text
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "   ",
+        "This is a movie - or is it? 'Yes' - it is!",
+        "It's far from bad.<br /><br />Don't miss it...",
+        "<br - /> <br' /> <br '/> <br./> x - - - y",
+        "x. 'y z' . - w",
+        "Null\x00bytes. In text!",
+    ],
+)
+def test_tokenizer_edge_cases(text):
+    assert_equivalent(text)
+
+
+def test_tokenizer_random_texts():
+    for text in random_texts(20000):
+        assert_equivalent(text)
+
+
+@pytest.mark.skipif(not IMDB_FILES, reason="IMDB training corpus is not available")
+def test_tokenizer_imdb_corpus():
+    for file in IMDB_FILES:
+        with open(file, encoding="utf-8") as stream:
+            assert_equivalent(stream.read())
+
+
+def test_negation_uses_word_positions():
+    """
+    Repeated words must be checked against their own neighbours, not those of their first occurrence.
+    """
+    words = ["only", "far", "away", "it", "is", "not", "only", "good", "far", "from", "bad"]
+    assert mark_negations(words) == [
+        "only", "far", "away", "it", "is", "not", "only", "good", "far", "not_from", "not_bad",
+    ]
+
+
+def test_negation_custom_cues():
+    cues = NegationCues(
+        negation_words=["hardly"],
+        negation_phrases=[("by", "no", "means")],
+        scope_breakers=["yet"],
+    )
+    words = ["hardly", "great", "yet", "fun", "by", "no", "means", "boring"]
+    assert mark_negations(words, cues) == [
+        "hardly", "not_great", "yet", "fun", "by", "not_no", "not_means", "not_boring",
+    ]
+    assert preprocess_review("Hardly great. Fun", advanced=True, cues=cues) == [
+        "hardly", "not_great", "fun",
+    ]
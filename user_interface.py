@@ -1,6 +1,6 @@
-from sentiment_analysis import WordCounter, compute_sentiment
+from sentiment_analysis import WordCounter, analyze_review
 from file_operations import  read_review_file, save_review, delete_review_file
-from preprocessing import preprocess_review
+from lexicon_snapshot import load_or_train_word_counter
 
 
 def enter_or_read_review_for_analysis(
@@ -21,11 +21,10 @@ def enter_or_read_review_for_analysis(
     )
     advanced = advanced_analysis.lower() == "y"
 
-    preprocessed_review = preprocess_review(review, advanced=advanced)
-
-    sentiment, sentiment_details = compute_sentiment(
-        preprocessed_review, word_counter, advanced=advanced
-    )
+    # Both modes are scored in one pass, so the advanced analysis "after all" is already done.
+    analysis = analyze_review(review, word_counter)
+    sentiment = analysis.sentiment(advanced)
+    sentiment_details = analysis.details(advanced)
 
     rounded_sentiment = round(sentiment, 2)
     verdict = "positive" if rounded_sentiment > 0 else "neutral" if rounded_sentiment == 0 else "negative"
@@ -39,10 +38,8 @@ def enter_or_read_review_for_analysis(
 
     if not advanced:
         if input("\nPerform advanced sentiment analysis after all? [y/n]: ").lower() == "y":
-            preprocessed_review = preprocess_review(review, advanced=True)
-            sentiment, sentiment_details = compute_sentiment(
-                preprocessed_review, word_counter, True
-            )
+            sentiment = analysis.advanced_sentiment
+            sentiment_details = analysis.details(advanced=True)
             rounded_sentiment = round(sentiment, 2)
             verdict = "positive" if rounded_sentiment > 0 else "neutral" if rounded_sentiment == 0 else "negative"
             print(f"\nThis review is {verdict}, sentiment = {sentiment:.2f}")
@@ -59,8 +56,9 @@ def enter_or_read_review_for_analysis(
 
 def main():
     word_counter = WordCounter()
-    word_counter.count_words(r"train\pos\*.txt", True)
-    word_counter.count_words(r"train\neg\*.txt", False)
+    load_or_train_word_counter(
+        word_counter, r"train\pos\*.txt", r"train\neg\*.txt", r"train\lexicon.snapshot"
+    )
 
     while True:
         print("\nMain Menu:")
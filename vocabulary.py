@@ -0,0 +1,189 @@
+"""
+Compact storage of the positive and negative word counters of a WordCounter.
+
+Training fills two Dict[str, int] counters whose keys mostly overlap, so every word is stored
+twice (as two distinct string objects), together with two dict entries and, for counts above
+256, two boxed ints. A CompactVocabulary keeps each word once, in a sorted list, and both
+counters as uint32 array columns next to it. Words are found through an open-addressing hash
+table that is itself an array of positions, so the per-word overhead is a few machine words
+instead of two dict entries. The word strings are the ones the polarity table is built from,
+so scoring structures share them instead of holding copies. (They are not passed through
+sys.intern: the interpreter's table of interned strings would cost more than it saves.)
+
+CountColumn exposes one column as a dict-like mapping, so code written against the dict
+counters keeps working. Updates are supported (new words are appended to the vocabulary) but
+are slower than on a dict: train on dicts and compact afterwards, see WordCounter.compact.
+
+The hash table uses hash(), which is salted per process (PYTHONHASHSEED), so it is never stored:
+snapshots keep only the words and counts, and unpickling rebuilds the table in the new process.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional
+
+EMPTY_SLOT: int = 0
+HASH_MASK: int = (1 << 64) - 1
+
+
+class CompactVocabulary:
+    """
+    One vocabulary with a positive and a negative document frequency column.
+    """
+
+    def __init__(self, words: Iterable[str], pos_counts: array, neg_counts: array):
+        self.words: List[str] = list(words)
+        self.pos_counts = array("I", pos_counts)
+        self.neg_counts = array("I", neg_counts)
+        if not len(self.words) == len(self.pos_counts) == len(self.neg_counts):
+            raise ValueError("the vocabulary and its count columns differ in length")
+        self._build_slots(len(self.words))
+        self.pos_words_count = CountColumn(self, self.pos_counts)
+        self.neg_words_count = CountColumn(self, self.neg_counts)
+
+    @classmethod
+    def from_counts(
+        cls, pos_words_count: Dict[str, int], neg_words_count: Dict[str, int]
+    ) -> "CompactVocabulary":
+        words = sorted(pos_words_count.keys() | neg_words_count.keys())
+        return cls(
+            words,
+            array("I", [pos_words_count.get(word, 0) for word in words]),
+            array("I", [neg_words_count.get(word, 0) for word in words]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __getstate__(self) -> Dict[str, object]:
+        # The slots depend on str hashes, which are salted per process: they are rebuilt on unpickling.
+        state = self.__dict__.copy()
+        del state["slots"], state["mask"]
+        return state
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__dict__.update(state)
+        self._build_slots(len(self.words))
+
+    def _build_slots(self, capacity: int) -> None:
+        size = 8
+        while size * 2 < capacity * 3:
+            size *= 2
+        # Slot values are vocabulary positions + 1; EMPTY_SLOT marks a free slot.
+        self.slots = array("I", bytes(4 * size))
+        self.mask = size - 1
+        for position, word in enumerate(self.words, 1):
+            self.slots[self._free_slot(word)] = position
+
+    def _probe(self, word: str) -> Iterator[int]:
+        # The probe sequence of CPython's dict: it visits every slot and mixes in the high hash bits.
+        perturb = hash(word) & HASH_MASK
+        slot = perturb & self.mask
+        while True:
+            yield slot
+            perturb >>= 5
+            slot = (slot * 5 + perturb + 1) & self.mask
+
+    def _free_slot(self, word: str) -> int:
+        for slot in self._probe(word):
+            if self.slots[slot] == EMPTY_SLOT:
+                return slot
+
+    def position(self, word: str) -> Optional[int]:
+        """
+        Returns the position of word in the vocabulary, or None if it is unknown.
+        """
+        # _probe inlined: this is the lookup behind every CountColumn access.
+        slots = self.slots
+        words = self.words
+        mask = self.mask
+        perturb = hash(word) & HASH_MASK
+        slot = perturb & mask
+        while True:
+            position = slots[slot]
+            if position == EMPTY_SLOT:
+                return None
+            if words[position - 1] == word:
+                return position - 1
+            perturb >>= 5
+            slot = (slot * 5 + perturb + 1) & mask
+
+    def add(self, word: str) -> int:
+        """
+        Appends a new word with zero counts and returns its position.
+        Appended words are not kept in sorted order.
+        """
+        self.words.append(word)
+        self.pos_counts.append(0)
+        self.neg_counts.append(0)
+        if len(self.words) * 3 > (self.mask + 1) * 2:
+            self._build_slots(len(self.words))
+        else:
+            self.slots[self._free_slot(word)] = len(self.words)
+        return len(self.words) - 1
+
+    def polarity_table(self) -> Dict[str, float]:
+        """
+        Returns the (pos - neg) / (pos + neg) polarity of every word with a non-zero total count,
+        like sentiment_analysis.build_polarity_table.
+        """
+        return {
+            word: (pos_count - neg_count) / (pos_count + neg_count)
+            for word, pos_count, neg_count in zip(self.words, self.pos_counts, self.neg_counts)
+            if pos_count or neg_count
+        }
+
+
+class CountColumn(MutableMapping[str, int]):
+    """
+    Dict-like view of one count column of a CompactVocabulary. Words with a zero count are absent,
+    so storing 0 removes a word, like deleting it.
+    """
+
+    def __init__(self, vocabulary: CompactVocabulary, counts: array):
+        self.vocabulary = vocabulary
+        self.counts = counts
+        self._size = sum(1 for count in counts if count)
+
+    def __getitem__(self, word: str) -> int:
+        position = self.vocabulary.position(word)
+        if position is None or not self.counts[position]:
+            raise KeyError(word)
+        return self.counts[position]
+
+    def get(self, word: str, default: Optional[int] = None) -> Optional[int]:
+        position = self.vocabulary.position(word)
+        if position is not None:
+            count = self.counts[position]
+            if count:
+                return count
+        return default
+
+    def __contains__(self, word: object) -> bool:
+        return self.get(word) is not None
+
+    def __setitem__(self, word: str, count: int) -> None:
+        position = self.vocabulary.position(word)
+        if position is None:
+            if not count:
+                return
+            position = self.vocabulary.add(word)
+        self._size += bool(count) - bool(self.counts[position])
+        self.counts[position] = count
+
+    def __delitem__(self, word: str) -> None:
+        position = self.vocabulary.position(word)
+        if position is None or not self.counts[position]:
+            raise KeyError(word)
+        self.counts[position] = 0
+        self._size -= 1
+
+    def __iter__(self) -> Iterator[str]:
+        for word, count in zip(self.vocabulary.words, self.counts):
+            if count:
+                yield word
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"CountColumn({dict(self.items())!r})"